@@ -1,7 +1,8 @@
 from django.contrib import admin
-from .models import Event, Invitation, Schedule
+from .models import Event, GroupInvitation, Invitation, Schedule
 
 # Register your models here.
 admin.site.register(Event)
 admin.site.register(Invitation)
+admin.site.register(GroupInvitation)
 admin.site.register(Schedule)
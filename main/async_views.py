@@ -0,0 +1,148 @@
+"""
+Async versions of the read-only guest pages, served under ASGI (see schedule/asgi.py).
+
+Django 3.2 has no async ORM yet, so every query runs through sync_to_async in
+a thread of its own, and queries that don't depend on each other are awaited
+together: the bookings of a guest page are filtered by the invitation uuid, so
+they don't have to wait for the invitation. Availability comes with the
+invitation (see get_invite_or_403). Templates are rendered by Django in a sync
+thread, since they may touch the session.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from functools import update_wrapper
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.http import HttpResponseRedirect
+from django.shortcuts import get_object_or_404
+from django.template.response import TemplateResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.safestring import mark_safe
+from django.views.generic.base import View
+from .models import Schedule
+from .utils import busy_intervals, get_available_intervals, get_invite_or_403
+from .views import CalendarView, ScheduleView
+from . import zones
+from schedule import routers
+
+
+# the threads mostly wait for the database, so there are more of them than
+# the default executor has; each one holds its own connection
+query_threads = ThreadPoolExecutor(settings.ASYNC_QUERY_THREADS, thread_name_prefix='query')
+
+
+def in_thread(func):
+    """``func`` as a coroutine running in a query thread, with that thread's database connection."""
+    def run(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            # as at the end of a request, CONN_MAX_AGE decides whether the connection stays open
+            close_old_connections()
+    return sync_to_async(run, thread_sensitive=False, executor=query_threads)
+
+
+class AsyncView(View):
+    """A View with async handlers, all of them have to be async."""
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        sync_view = super().as_view(**initkwargs)
+
+        # Django 3.2 serves a view without a thread only if it is an async function
+        async def view(request, *args, **kwargs):
+            return await sync_view(request, *args, **kwargs)
+        # view_class, view_initkwargs and csrf_exempt come along in __dict__
+        update_wrapper(view, sync_view)
+        return view
+
+    async def http_method_not_allowed(self, request, *args, **kwargs):
+        return super().http_method_not_allowed(request, *args, **kwargs)
+
+    async def options(self, request, *args, **kwargs):
+        return super().options(request, *args, **kwargs)
+
+
+def guest_bookings(uuid):
+    # the bookings of the invitation's owner, without waiting for the invitation
+    return Schedule.objects.filter(owner__event__invitation__uuid=uuid)
+
+
+def invite_owner_key(uuid):
+    # an invitation never changes its owner, so this is never invalidated
+    return f'invite-owner:{uuid}'
+
+
+class GuestCalendarRedirectView(AsyncView):
+    # see schedule/routers.py
+    replica_reads = True
+
+    async def get(self, request, uuid):
+        await in_thread(get_invite_or_403)(uuid, request)
+        now = timezone.now()
+        return HttpResponseRedirect(
+            reverse('guest_calendar', kwargs=dict(uuid=uuid, year=f'{now.year:04d}', month=f'{now.month:02d}'))
+        )
+
+
+class GuestCalendarView(AsyncView):
+    template_name = 'calendar.html'
+    replica_reads = True
+
+    async def get(self, request, uuid, year, month):
+        year, month = int(year), int(month)
+        tz = timezone.get_current_timezone()
+        month_begins, month_ends = CalendarView.month_range(year, month)
+        invite, busy = await asyncio.gather(
+            in_thread(get_invite_or_403)(uuid, request),
+            in_thread(busy_intervals)(guest_bookings(uuid), month_begins, month_ends),
+        )
+        statuses = CalendarView.day_statuses(
+            year, month, tz, busy,
+            get_available_intervals(invite.event.owner, month_begins, month_ends),
+        )
+        # the url kwargs are in the context, like in a TemplateView
+        context = dict(self.kwargs, invite=invite, **CalendarView.month_context(year, month, statuses))
+        return TemplateResponse(request, self.template_name, context)
+
+
+class GuestScheduleView(AsyncView):
+    template_name = 'schedule.html'
+    replica_reads = True
+
+    async def get(self, request, uuid, year, month, day):
+        context = {'date': date(int(year), int(month), int(day))}
+        day_begins, day_ends = zones.day_range(context['date'])
+        owner_id = cache.get(invite_owner_key(uuid))
+        grid_key = ScheduleView.get_grid_key(owner_id, self.kwargs) if owner_id is not None else None
+        day_grid = cache.get(grid_key) if grid_key else None
+        if day_grid is None:
+            bookings = guest_bookings(uuid).overlapping(day_begins, day_ends).select_related('event').order_by('start_time')
+            context['invite'], bookings = await asyncio.gather(
+                in_thread(get_invite_or_403)(uuid, request),
+                in_thread(list)(bookings),
+            )
+            day_grid = await sync_to_async(ScheduleView.render_day_grid)(request, context, bookings, day_begins, day_ends)
+            # the key has to be taken before the bookings are read, so on the first
+            # visit of an invitation the grid isn't cached, only its owner
+            if grid_key is None:
+                cache.set(invite_owner_key(uuid), context['invite'].event.owner_id, None)
+            # not from a replica, see ScheduleView
+            elif not routers.on_replica():
+                cache.set(grid_key, day_grid, ScheduleView.grid_timeout)
+        else:
+            context['invite'] = await in_thread(get_invite_or_403)(uuid, request)
+        context['day_grid'] = mark_safe(day_grid)
+        return TemplateResponse(request, self.template_name, context)
+
+
+class GuestBookingSuccessView(AsyncView):
+    template_name = 'schedule_as_guest_success.html'
+
+    async def get(self, request, uuid):
+        scheduled_event = await in_thread(get_object_or_404)(Schedule.objects.select_related('event__owner'), uuid=uuid)
+        return TemplateResponse(request, self.template_name, {'scheduled_event': scheduled_event})
@@ -0,0 +1,280 @@
+"""
+Free/busy engine.
+
+Everything here works on half-open intervals ``(start, end)`` of aware datetimes
+and never touches the database, so the same sweep can be used for a day page,
+a month or a JSON endpoint.
+"""
+import bisect
+import heapq
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.utils import timezone
+from .zones import get_zone, to_utc
+
+
+SLOT = timedelta(minutes=30)
+
+# month heatmap statuses
+FREE = 'free'
+PARTIAL = 'partial'
+FULL = 'full'
+
+
+def merge(intervals):
+    """Sort intervals and glue together the ones that overlap or touch."""
+    merged = []
+    for start, end in sorted(intervals):
+        if start >= end:
+            continue
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def subtract(available, busy):
+    """Parts of ``available`` not covered by ``busy``. Both must be merged."""
+    result = []
+    i = 0
+    for start, end in available:
+        while i < len(busy) and busy[i][1] <= start:
+            i += 1
+        j = i
+        current = start
+        while j < len(busy) and busy[j][0] < end:
+            if busy[j][0] > current:
+                result.append((current, busy[j][0]))
+            current = max(current, busy[j][1])
+            j += 1
+        if current < end:
+            result.append((current, end))
+    return result
+
+
+def intersect(a, b):
+    """Common parts of two merged interval lists."""
+    result = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        start = max(a[i][0], b[j][0])
+        end = min(a[i][1], b[j][1])
+        if start < end:
+            result.append((start, end))
+        if a[i][1] < b[j][1]:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+def grid(start, end, step=SLOT):
+    """Slot start times from ``start`` up to (not including) ``end``."""
+    slots = []
+    current = start
+    while current < end:
+        slots.append(current)
+        current += step
+    return slots
+
+
+def slots_within(intervals, start, end, step=SLOT, duration=timedelta()):
+    """
+    Grid slots that start inside one of the merged ``intervals`` and leave
+    room for ``duration`` before that interval ends.
+    """
+    slots = []
+    i = 0
+    for t in grid(start, end, step):
+        while i < len(intervals) and intervals[i][1] <= t:
+            i += 1
+        if i == len(intervals):
+            break
+        s, e = intervals[i]
+        if s <= t and t + duration <= e:
+            slots.append(t)
+    return slots
+
+
+def occupied_slots(bookings, start, end, step=SLOT):
+    """
+    Map every grid slot touched by a booking to the booking's label.
+    ``bookings`` is an iterable of ``(start, end, label)`` sorted by start.
+    """
+    slots = grid(start, end, step)
+    occupied = {}
+    first = 0
+    for b_start, b_end, label in bookings:
+        while first < len(slots) and slots[first] + step <= b_start:
+            first += 1
+        k = first
+        while k < len(slots) and slots[k] < b_end:
+            occupied[slots[k]] = label
+            k += 1
+    return occupied
+
+
+def free_slots(available, busy, start, end, step=SLOT, duration=timedelta()):
+    """Grid slots where a ``duration`` long meeting fits into free time."""
+    free = subtract(merge(available), merge(busy))
+    return slots_within(free, start, end, step, duration)
+
+
+def iter_free(available, busy):
+    """
+    Like subtract, lazily. ``available`` is merged, ``busy`` only has to be
+    sorted by start and is read no further than the free time asked for.
+    """
+    busy = iter(busy)
+    pending = None
+    for start, end in available:
+        current = start
+        while current < end:
+            if pending is None:
+                pending = next(busy, None)
+            if pending is None or pending[0] >= end:
+                break
+            b_start, b_end = pending
+            # bookings of a zero length event, merge drops them too
+            if b_start >= b_end:
+                pending = None
+                continue
+            if b_start > current:
+                yield current, b_start
+            current = max(current, b_end)
+            # one reaching past this interval may cover the next one too
+            if b_end <= end:
+                pending = None
+        if current < end:
+            yield current, end
+
+
+def iter_slots(free, origin, step=SLOT, duration=timedelta()):
+    """Starts on the grid from ``origin`` where a ``duration`` long meeting fits into ``free``."""
+    for start, end in free:
+        t = origin + -((origin - start) // step) * step if start > origin else origin
+        while t + duration <= end:
+            yield t
+            t += step
+
+
+def _boundaries(intervals):
+    for start, end in intervals:
+        yield start, 1
+        yield end, -1
+
+
+def common(*interval_lists):
+    """
+    Lazily, the parts of time inside an interval of every one of the merged
+    ``interval_lists``, which may be iterators. Their boundaries are merged
+    through a heap and counted, so each list is read once, as far as needed.
+    """
+    if not interval_lists:
+        return
+    covered = 0
+    # at the same time ends (-1) come before starts (+1), intervals are half-open
+    for t, change in heapq.merge(*map(_boundaries, interval_lists)):
+        if change < 0 and covered == len(interval_lists) and start < t:
+            yield start, t
+        covered += change
+        if covered == len(interval_lists):
+            start = t
+
+
+def per_day(intervals, tz=None):
+    """Total length of ``intervals`` for every local date they cover."""
+    tz = tz or timezone.get_current_timezone()
+    totals = {}
+    for start, end in intervals:
+        current = start
+        while current < end:
+            day = timezone.localtime(current, tz).date()
+            next_day = timezone.make_aware(datetime.combine(day + timedelta(days=1), datetime.min.time()), tz)
+            chunk_end = min(end, next_day)
+            totals[day] = totals.get(day, timedelta()) + (chunk_end - current)
+            current = chunk_end
+    return totals
+
+
+def day_status(available, booked):
+    """Heatmap status of a day from its available and booked time."""
+    if not available or booked >= available:
+        return FULL
+    if booked:
+        return PARTIAL
+    return FREE
+
+
+# Minute-of-week index. Minute 0 is Monday 00:00 UTC.
+
+WEEK = 7 * 24 * 60
+WEEK_DAYS = ['Mo', 'Tu', 'We', 'Th', 'Fr', 'Sa', 'Su']
+
+
+def standard_offset(tz):
+    """UTC offset of ``tz`` without daylight saving time, in minutes."""
+    now = timezone.localtime(timezone.now(), tz)
+    return int((now.utcoffset() - now.dst()).total_seconds() // 60)
+
+
+def week_minutes(windows, tz_of=lambda w: w.timezone):
+    """
+    Merge weekly windows into sorted UTC minute-of-week intervals, flattened
+    to [start0, end0, start1, end1, ...]. Each window is converted with the
+    standard offset of its own timezone; daylight saving time is applied when
+    the index is read. Intervals that wrap around the end of the week are split.
+    """
+    offsets = {}
+    intervals = []
+    for w in windows:
+        name = tz_of(w)
+        if name not in offsets:
+            offsets[name] = standard_offset(get_zone(name))
+        day = WEEK_DAYS.index(w.week_day)
+        start = day * 24 * 60 + w.start_time.hour * 60 + w.start_time.minute - offsets[name]
+        end = day * 24 * 60 + w.end_time.hour * 60 + w.end_time.minute - offsets[name]
+        if end <= start:
+            end += 24 * 60
+        start, end = start % WEEK, start % WEEK + (end - start)
+        if end > WEEK:
+            intervals += [(start, WEEK), (0, end - WEEK)]
+        else:
+            intervals.append((start, end))
+    return [minute for interval in merge(intervals) for minute in interval]
+
+
+def expand_week_minutes(minutes, tz, start, end):
+    """
+    Concrete UTC intervals of a minute-of-week index inside [start, end).
+    ``tz`` is the zone the index was built in. Every boundary goes back to its
+    wall-clock time and is converted on its own, so an interval crossing a
+    daylight saving change gets the offset of each side. Finding the first
+    interval of a week is a binary search, so cost depends on the output, not
+    the index size.
+    """
+    starts, ends = minutes[0::2], minutes[1::2]
+    if not starts:
+        return []
+    standard = timedelta(minutes=standard_offset(tz))
+    walls = []
+    # a day of margin on both sides for the daylight saving shift
+    lookup_start, lookup_end = start - timedelta(days=1), end + timedelta(days=1)
+    week_begins = lookup_start.astimezone(dt_timezone.utc)
+    week_begins = (week_begins - timedelta(days=week_begins.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
+    while week_begins < lookup_end:
+        first = (lookup_start - week_begins).total_seconds() // 60
+        i = bisect.bisect_right(ends, first) if first > 0 else 0
+        wall_begins = (week_begins + standard).replace(tzinfo=None)
+        while i < len(starts) and week_begins + timedelta(minutes=starts[i]) < lookup_end:
+            walls += [wall_begins + timedelta(minutes=starts[i]), wall_begins + timedelta(minutes=ends[i])]
+            i += 1
+        week_begins += timedelta(days=7)
+    boundaries = to_utc(walls, tz)
+    intervals = []
+    for s, e in zip(boundaries[0::2], boundaries[1::2]):
+        s, e = max(s, start), min(e, end)
+        if s < e:
+            intervals.append((s, e))
+    return merge(intervals)
@@ -0,0 +1,233 @@
+"""
+Booking pipeline.
+
+A booking is claimed in one short transaction: the owner's user row is locked
+(not the whole table), the overlap check runs again and the row is inserted.
+On PostgreSQL the exclusion constraint on main_schedule backs this up.
+"""
+from datetime import timedelta
+from itertools import islice
+from django.contrib.auth.models import User
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.db import IntegrityError, transaction
+from . import availability, metrics, recurrence
+from .cache import bump_owner_version
+from .models import OVERLAP_ERROR, Event, Schedule
+from .utils import busy_intervals, get_busy_intervals
+
+
+def lock_owner(owner_id):
+    # serializes bookings of the same owner only, must run inside a transaction
+    list(User.objects.select_for_update().filter(pk=owner_id).values_list('pk', flat=True))
+
+
+def claim_slot(booking):
+    """Save ``booking`` if its time is still free. Must run inside a transaction."""
+    booking.set_span()
+    lock_owner(booking.owner_id)
+    booking.clean()
+    try:
+        with transaction.atomic():
+            booking.save()
+    except IntegrityError:
+        metrics.inc('schedule_booking_conflicts_total')
+        raise ValidationError(OVERLAP_ERROR)
+    return booking
+
+
+def count_booking(source, n=1):
+    # counted once the booking is committed
+    transaction.on_commit(lambda: metrics.inc('schedule_bookings_total', n, source=source))
+
+
+def book(booking):
+    with transaction.atomic():
+        claim_slot(booking)
+        count_booking('owner')
+    return booking
+
+
+def book_with_invitation(invite, booking):
+    """Use up one invitation use and claim the slot, or do neither."""
+    used = False
+    try:
+        with transaction.atomic():
+            used = invite.get_used()
+            if not used:
+                raise PermissionDenied("Sorry, the invitation is expired!")
+            booking.invite_used = invite
+            claim_slot(booking)
+            count_booking('guest')
+    except Exception:
+        # the use was rolled back along with the booking, the invite kept on
+        # the request must still be active for the form to show the error
+        if used:
+            invite.uses_counter -= 1
+        raise
+    return booking
+
+
+DURATION_OVERLAP_ERROR = 'With this duration some bookings of the event would overlap other bookings.'
+
+
+def duration_conflicts(event):
+    """Whether the bookings of ``event``, with its new duration, overlap each other or other bookings of the owner."""
+    mine = list(Schedule.objects.filter(event=event).only('event', *recurrence.FIELDS))
+    if not mine:
+        return False
+    for b in mine:
+        b.event = event
+        b.set_span()
+    # a series without an end is checked a year ahead, as in Schedule.clean
+    start = min(b.start_time for b in mine)
+    end = max(b.series_end or b.start_time + recurrence.HORIZON for b in mine)
+    spans = sorted(span for b in mine for span in b.occurrences(start, end))
+    if any(later[0] < earlier[1] for earlier, later in zip(spans, spans[1:])):
+        return True
+    others = busy_intervals(Schedule.objects.filter(owner_id=event.owner_id).exclude(event=event), start, end)
+    return bool(availability.intersect(availability.merge(spans), others))
+
+
+def change_duration(event):
+    """
+    Save ``event`` with a new duration, which moves the end of every booking
+    of it, unless that makes them overlap.
+    """
+    with transaction.atomic():
+        lock_owner(event.owner_id)
+        if duration_conflicts(event):
+            raise ValidationError(DURATION_OVERLAP_ERROR)
+        # the exclusion constraint on PostgreSQL has the last word
+        try:
+            with transaction.atomic():
+                event.save()
+        except IntegrityError:
+            raise ValidationError(DURATION_OVERLAP_ERROR)
+    return event
+
+
+def find_conflicts(bookings, existing):
+    """
+    Split unsaved bookings, sorted by start time, into accepted and rejected
+    ones. ``existing`` are (start, end) pairs of saved bookings sorted by start.
+    A booking is rejected when it overlaps a saved one or one accepted before it.
+    """
+    accepted = []
+    rejected = []
+    i = 0
+    for b in bookings:
+        while i < len(existing) and existing[i][1] <= b.start_time:
+            i += 1
+        if i < len(existing) and existing[i][0] < b.end_time:
+            rejected.append((b, OVERLAP_ERROR))
+        elif accepted and accepted[-1].end_time > b.start_time:
+            rejected.append((b, 'Overlaps another booking in the same batch.'))
+        else:
+            accepted.append(b)
+    return accepted, rejected
+
+
+def existing_spans(owner, bookings):
+    """
+    Merged (start, end) of the owner's saved bookings around ``bookings``, one
+    range query. Recurring bookings are expanded for that range only.
+    """
+    if not bookings:
+        return []
+    return get_busy_intervals(
+        owner,
+        min(b.start_time for b in bookings),
+        max(b.end_time for b in bookings),
+    )
+
+
+def _insert(owner, bookings, partial, batch_size):
+    # book_many without its transaction, the caller holds the owner's lock
+    for b in bookings:
+        b.set_span()
+    bookings = sorted(bookings, key=lambda b: b.start_time)
+    accepted, rejected = find_conflicts(bookings, existing_spans(owner, bookings))
+    if rejected and not partial:
+        accepted = []
+    Schedule.objects.bulk_create(accepted, batch_size=batch_size)
+    # bulk_create doesn't send post_save
+    if accepted:
+        transaction.on_commit(lambda: bump_owner_version(owner.pk))
+    return accepted, rejected
+
+
+def book_many(owner, bookings, partial=False, source='bulk', batch_size=1000):
+    """
+    Save unsaved single bookings of ``owner`` at once. They are checked against
+    each other in memory and against the saved bookings with one range query,
+    then inserted with bulk_create, all in one transaction. A conflict rejects
+    the whole batch unless ``partial``, then only the conflicting bookings are
+    left out. Returns the created bookings and (booking, reason) of the rejected ones.
+    """
+    with transaction.atomic():
+        lock_owner(owner.pk)
+        accepted, rejected = _insert(owner, bookings, partial, batch_size)
+        count_booking(source, len(accepted))
+    metrics.inc('schedule_booking_conflicts_total', len(rejected))
+    return accepted, rejected
+
+
+def import_bookings(owner, entries, batch_size=1000):
+    """
+    Create bookings from parsed entries (see main.importers) in one transaction.
+    The entries are read ``batch_size`` at a time, each batch is checked with one
+    range query, which sees the batches inserted before it, and bulk inserted,
+    so a file of any size is never held in memory. Events made up for new
+    durations are created in the same transaction. Returns the number of created
+    bookings and a list of (line, reason) for the entries that were skipped.
+    """
+    entries = iter(entries)
+    created = 0
+    rejected = []
+    conflicts = 0
+    with transaction.atomic():
+        lock_owner(owner.pk)
+        events = list(Event.objects.filter(owner=owner))
+        by_slug = {e.slug: e for e in events}
+        by_title = {}
+        for e in events:
+            by_title.setdefault(e.title, e)
+        by_title_and_duration = {(e.title, e.duration): e for e in events}
+        while True:
+            chunk = list(islice(entries, batch_size))
+            if not chunk:
+                break
+            bookings = []
+            for entry in chunk:
+                if 'error' in entry:
+                    rejected.append((entry['line'], entry['error']))
+                    continue
+                title, start = entry['title'], entry['start']
+                if entry.get('end') is None:
+                    event = by_slug.get(title) or by_title.get(title)
+                    if event is None:
+                        rejected.append((entry['line'], f'Unknown event "{title}" and no end time.'))
+                        continue
+                else:
+                    duration = entry['end'] - start
+                    if duration <= timedelta():
+                        rejected.append((entry['line'], 'The end time is before the start time.'))
+                        continue
+                    event = by_title_and_duration.get((title, duration))
+                    if event is None and title in by_slug and by_slug[title].duration == duration:
+                        event = by_slug[title]
+                    if event is None:
+                        # the duration lives on the event, so each new length gets its own event
+                        event = Event.objects.create(owner=owner, title=title or 'Imported', duration=duration)
+                        by_title_and_duration[(title, duration)] = event
+                b = Schedule(event=event, start_time=start, notes=entry.get('notes', ''))
+                b.line = entry['line']
+                bookings.append(b)
+            accepted, chunk_conflicts = _insert(owner, bookings, True, batch_size)
+            created += len(accepted)
+            conflicts += len(chunk_conflicts)
+            rejected.extend((b.line, reason) for b, reason in chunk_conflicts)
+        count_booking('import', created)
+    metrics.inc('schedule_booking_conflicts_total', conflicts)
+    rejected.sort()
+    return created, rejected
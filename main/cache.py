@@ -0,0 +1,43 @@
+"""
+Per-owner change versions.
+
+Every owner has a version stamp in the cache that is bumped by signals
+(see main/signals.py) once a change to something shown on their pages is
+committed, so a new version never goes with old rows. Anything
+derived from an owner's data can be cached or validated against that stamp
+without touching the owner's rows. Deployments with several workers need a
+shared cache backend (CACHE_URL), otherwise each worker has its own stamps.
+"""
+import time
+from django.core.cache import cache
+
+VERSION_TIMEOUT = None  # never expire
+
+
+def version_key(owner_id):
+    return f'owner-version:{owner_id}'
+
+
+def get_owner_version(owner_id):
+    """Version stamp of an owner's data, also usable as a last-modified timestamp."""
+    version = cache.get(version_key(owner_id))
+    if version is None:
+        # unknown after a cache flush, start a new version so nothing stale is served
+        version = time.time()
+        if not cache.add(version_key(owner_id), version, VERSION_TIMEOUT):
+            version = cache.get(version_key(owner_id), version)
+    return version
+
+
+def bump_owner_version(owner_id):
+    cache.set(version_key(owner_id), time.time(), VERSION_TIMEOUT)
+
+
+def get_owner_versions(owner_ids):
+    """Version stamps of several owners in one cache round trip, by owner id."""
+    keys = {version_key(owner_id): owner_id for owner_id in owner_ids}
+    versions = {keys[key]: version for key, version in cache.get_many(keys).items()}
+    for owner_id in keys.values():
+        if owner_id not in versions:
+            versions[owner_id] = get_owner_version(owner_id)
+    return versions
@@ -0,0 +1,7 @@
+from django import forms
+from . import importers
+
+
+class ImportBookingsForm(forms.Form):
+    file = forms.FileField()
+    format = forms.ChoiceField(choices=importers.FORMATS)
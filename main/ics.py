@@ -0,0 +1,158 @@
+"""
+iCalendar (RFC 5545) output and input.
+
+Events are produced and parsed one at a time so a feed can be streamed and an
+uploaded file doesn't have to be read into memory.
+"""
+import re
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.utils.timezone import make_aware
+from . import recurrence
+from .zones import get_zone
+
+CRLF = '\r\n'
+PRODID = '-//schedule//EN'
+DURATION_RE = re.compile(r'P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?')
+
+
+def escape(text):
+    return (
+        text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+        .replace('\r\n', '\\n').replace('\n', '\\n')
+    )
+
+
+def fold(line):
+    """Split a content line into chunks of at most 75 octets."""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + CRLF
+    chunks = []
+    limit = 75
+    while encoded:
+        cut = min(limit, len(encoded))
+        # don't cut a multibyte character in half
+        while cut < len(encoded) and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        chunks.append(encoded[:cut].decode('utf-8'))
+        encoded = encoded[cut:]
+        limit = 74  # the leading space of a continuation line counts
+    return (CRLF + ' ').join(chunks) + CRLF
+
+
+def format_datetime(dt):
+    return dt.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def vevent(booking, dtstamp, start=None, end=None):
+    # start and end of one occurrence of a recurring booking, which gets its own uid
+    uid = f'{booking.uuid}-{format_datetime(start)}' if start else booking.uuid
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:{uid}@schedule',
+        f'DTSTAMP:{format_datetime(dtstamp)}',
+        f'DTSTART:{format_datetime(start or booking.start_time)}',
+        f'DTEND:{format_datetime(end or booking.end_time)}',
+        f'SUMMARY:{escape(booking.event.title)}',
+    ]
+    if booking.notes:
+        lines.append(f'DESCRIPTION:{escape(booking.notes)}')
+    lines.append('END:VEVENT')
+    return ''.join(fold(line) for line in lines)
+
+
+def calendar(bookings, name, dtstamp=None, until=None):
+    """
+    The whole VCALENDAR for an iterable of Schedule rows with their events loaded.
+    Recurring bookings are expanded into their occurrences before ``until``.
+    """
+    dtstamp = dtstamp or datetime.now(dt_timezone.utc)
+    yield fold('BEGIN:VCALENDAR') + fold('VERSION:2.0') + fold(f'PRODID:{PRODID}') + fold(f'X-WR-CALNAME:{escape(name)}')
+    for booking in bookings:
+        if not booking.frequency:
+            yield vevent(booking, dtstamp)
+            continue
+        for start, end in recurrence.occurrences(booking, end=until):
+            yield vevent(booking, dtstamp, start, end)
+    yield fold('END:VCALENDAR')
+
+
+def unfold(lines):
+    """Join continuation lines; yields (line number, content line)."""
+    current = None
+    number = 0
+    for i, line in enumerate(lines, 1):
+        line = line.rstrip('\r\n')
+        if line[:1] in (' ', '\t') and current is not None:
+            current += line[1:]
+            continue
+        if current is not None:
+            yield number, current
+        current, number = line, i
+    if current:
+        yield number, current
+
+
+def unescape(text):
+    return re.sub(r'\\([\\;,nN])', lambda m: '\n' if m.group(1) in 'nN' else m.group(1), text)
+
+
+def parse_datetime(value, params, default_tz):
+    if params.get('VALUE') == 'DATE' or len(value) == 8:
+        raise ValueError('all-day events are not supported')
+    if value.endswith('Z'):
+        return datetime.strptime(value, '%Y%m%dT%H%M%SZ').replace(tzinfo=dt_timezone.utc)
+    naive = datetime.strptime(value, '%Y%m%dT%H%M%S')
+    tz = get_zone(params['TZID']) if 'TZID' in params else default_tz
+    return make_aware(naive, tz)
+
+
+def parse_duration(value):
+    match = DURATION_RE.fullmatch(value)
+    if not match:
+        raise ValueError(f'unsupported duration {value}')
+    weeks, days, hours, minutes, seconds = (int(g or 0) for g in match.groups())
+    return timedelta(weeks=weeks, days=days, hours=hours, minutes=minutes, seconds=seconds)
+
+
+def parse(lines, default_tz):
+    """
+    Yield one dict per VEVENT with line, title, start, end and notes, or with
+    line and error when the event can't be read. Recurring events are not expanded.
+    """
+    event = None
+    for number, line in unfold(lines):
+        name, _, value = line.partition(':')
+        name, *raw_params = name.split(';')
+        name = name.upper()
+        params = dict(p.split('=', 1) for p in raw_params if '=' in p)
+        if name == 'BEGIN' and value.upper() == 'VEVENT':
+            event = {'line': number, 'notes': ''}
+        elif event is None:
+            continue
+        elif name == 'END' and value.upper() == 'VEVENT':
+            if 'error' not in event:
+                if 'start' not in event:
+                    event['error'] = 'no DTSTART'
+                elif 'end' not in event and 'duration' not in event:
+                    event['error'] = 'no DTEND or DURATION'
+                else:
+                    event.setdefault('end', event['start'] + event.pop('duration', timedelta()))
+                    event.pop('duration', None)
+                    event.setdefault('title', '')
+            yield event
+            event = None
+        else:
+            try:
+                if name == 'SUMMARY':
+                    event['title'] = unescape(value)
+                elif name == 'DESCRIPTION':
+                    event['notes'] = unescape(value)
+                elif name == 'DTSTART':
+                    event['start'] = parse_datetime(value, params, default_tz)
+                elif name == 'DTEND':
+                    event['end'] = parse_datetime(value, params, default_tz)
+                elif name == 'DURATION':
+                    event['duration'] = parse_duration(value)
+            except (ValueError, KeyError) as e:
+                event.setdefault('error', f'{name}: {e}')
@@ -0,0 +1,47 @@
+"""
+Readers for booking imports.
+
+Each reader takes an iterable of text lines and yields entries for
+main.booking.import_bookings: dicts with line, title, start, end (or None)
+and notes, or with line and error.
+"""
+import csv
+from datetime import datetime
+from django.utils import timezone
+from . import ics
+
+CSV = 'csv'
+ICS = 'ics'
+FORMATS = [(CSV, 'CSV'), (ICS, 'iCalendar')]
+CSV_COLUMNS = ['event', 'start_time', 'end_time', 'notes']
+
+
+def parse_iso(value, tz):
+    dt = datetime.fromisoformat(value.strip())
+    if timezone.is_naive(dt):
+        dt = timezone.make_aware(dt, tz)
+    return dt
+
+
+def read_csv(lines, tz):
+    # columns: event (title or slug), start_time, optional end_time and notes
+    reader = csv.DictReader(lines)
+    for row in reader:
+        entry = {'line': reader.line_num, 'title': (row.get('event') or '').strip(), 'notes': row.get('notes') or ''}
+        try:
+            entry['start'] = parse_iso(row.get('start_time') or '', tz)
+            entry['end'] = parse_iso(row['end_time'], tz) if (row.get('end_time') or '').strip() else None
+        except ValueError as e:
+            entry = {'line': reader.line_num, 'error': f'Bad date: {e}'}
+        yield entry
+
+
+def read_ics(lines, tz):
+    return ics.parse(lines, tz)
+
+
+def read(lines, format, tz=None):
+    tz = tz or timezone.get_current_timezone()
+    if format == ICS:
+        return read_ics(lines, tz)
+    return read_csv(lines, tz)
@@ -0,0 +1,97 @@
+import asyncio
+import threading
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.models import F
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from main.models import Invitation, Schedule
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares requests per second of the guest pages under WSGI (a fixed number of sync workers) '
+        'and ASGI (one event loop) with a simulated database latency. Run seed_schedule first.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--latency', type=float, default=5, help='milliseconds added to every query')
+        parser.add_argument('--workers', type=int, default=4, help='WSGI workers')
+        parser.add_argument('--concurrency', type=int, default=50, help='requests in flight under ASGI')
+
+    def handle(self, *args, **options):
+        invite = Invitation.objects.filter(
+            uses_counter__lt=F('max_number_of_uses'),
+            expiration_time__gt=timezone.now(),
+        ).select_related('event').first()
+        booking = Schedule.objects.filter(owner_id=invite.event.owner_id).first() if invite else None
+        if booking is None:
+            raise CommandError('No active invitation with bookings, run seed_schedule first.')
+        self.latency = options['latency'] / 1000
+        day = timezone.localtime(booking.start_time)
+        guest = dict(uuid=invite.uuid)
+        self.paths = [
+            reverse('guest_calendar_redirect', kwargs=guest),
+            reverse('guest_calendar', kwargs=dict(guest, year=f'{day.year:04d}', month=f'{day.month:02d}')),
+            reverse('schedule_as_guest', kwargs=dict(guest, year=f'{day.year:04d}', month=f'{day.month:02d}', day=f'{day.day:02d}')),
+            reverse('schedule_as_guest_success', kwargs=dict(uuid=booking.uuid)),
+        ]
+        connection_created.connect(self.slow_down)
+        for connection in connections.all():
+            connection.execute_wrappers.append(self.sleep)
+        try:
+            # the debug toolbar middleware is sync only, it would hold a thread for every request
+            middleware = [m for m in settings.MIDDLEWARE if not m.startswith('debug_toolbar')]
+            with override_settings(DEBUG=False, ALLOWED_HOSTS=settings.ALLOWED_HOSTS + ['testserver'], MIDDLEWARE=middleware):
+                # the day grid cache would hide the database
+                with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}):
+                    wsgi = self.run_wsgi(options['requests'], options['workers'])
+                    with override_settings(ROOT_URLCONF='schedule.asgi_urls'):
+                        asgi = asyncio.run(self.run_asgi(options['requests'], options['concurrency']))
+        finally:
+            connection_created.disconnect(self.slow_down)
+            for connection in connections.all():
+                connection.execute_wrappers.remove(self.sleep)
+        self.stdout.write(f"WSGI, {options['workers']} workers: {wsgi:.0f} requests/s")
+        self.stdout.write(f"ASGI, {options['concurrency']} in flight: {asgi:.0f} requests/s")
+
+    def sleep(self, execute, sql, params, many, context):
+        time.sleep(self.latency)
+        return execute(sql, params, many, context)
+
+    def slow_down(self, sender, connection, **kwargs):
+        # connections of the threads sync_to_async starts
+        if self.sleep not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self.sleep)
+
+    def run_wsgi(self, requests, workers):
+        def worker(count):
+            client = Client()
+            for i in range(count):
+                response = client.get(self.paths[i % len(self.paths)])
+                assert response.status_code < 400, response.status_code
+        threads = [threading.Thread(target=worker, args=(requests // workers,)) for i in range(workers)]
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return requests // workers * workers / (time.perf_counter() - started)
+
+    async def run_asgi(self, requests, concurrency):
+        client = AsyncClient()
+        limit = asyncio.Semaphore(concurrency)
+
+        async def get(path):
+            async with limit:
+                response = await client.get(path)
+                assert response.status_code < 400, response.status_code
+
+        started = time.perf_counter()
+        await asyncio.gather(*(get(self.paths[i % len(self.paths)]) for i in range(requests)))
+        return requests / (time.perf_counter() - started)
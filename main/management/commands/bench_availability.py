@@ -0,0 +1,91 @@
+import random
+import timeit
+from datetime import datetime, time, timedelta
+from types import SimpleNamespace
+import pytz
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from main import availability
+from main.models import AvailabilityIndex, AvailabilityWindow
+
+
+def legacy_day(day_begins, day_ends, windows, bookings):
+    # the slot loops ScheduleView used before the interval engine
+    time_delta = timedelta(seconds=1800)
+    time_list = []
+    for w in windows:
+        start_time = timezone.make_aware(datetime.combine(day_begins.date(), w.start_time)).astimezone(pytz.utc)
+        end_time = timezone.make_aware(datetime.combine(day_begins.date(), w.end_time)).astimezone(pytz.utc)
+        for i in range(48):
+            t = day_begins + i * time_delta
+            if start_time <= t < end_time:
+                time_list.append(t)
+    schedule_dict = {}
+    for b_start, b_end, title in bookings:
+        start_hour = b_start.replace(minute=0, second=0, microsecond=0)
+        begin = max(start_hour, day_begins)
+        if b_start.minute >= 30:
+            begin = begin + timedelta(minutes=30)
+        current = begin
+        while min(b_end, day_ends) > current:
+            schedule_dict[current] = title
+            current = current + timedelta(minutes=30)
+    return time_list, schedule_dict
+
+
+def engine_day(day_begins, day_ends, index, bookings):
+    # what the day page does: the availability index, then the slot sweeps
+    available = index.intervals(day_begins, day_ends)
+    time_list = availability.slots_within(available, day_begins, day_ends)
+    schedule_dict = availability.occupied_slots(bookings, day_begins, day_ends)
+    return time_list, schedule_dict
+
+
+def engine_free_slots(day_begins, day_ends, index, bookings):
+    # what FreeSlotsView does for a day
+    return availability.free_slots(
+        index.intervals(day_begins, day_ends), [(start, end) for start, end, title in bookings],
+        day_begins, day_ends, availability.SLOT, timedelta(hours=1)
+    )
+
+
+class Command(BaseCommand):
+    help = 'Compares the interval engine, read through the availability index, with the old slot loops on synthetic data.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--windows', type=int, default=20)
+        parser.add_argument('--bookings', type=int, default=40)
+        parser.add_argument('--repeat', type=int, default=200)
+
+    def handle(self, *args, **options):
+        timezone.activate(pytz.utc)
+        day = timezone.now().date()
+        day_begins = timezone.make_aware(datetime.combine(day, time.min))
+        day_ends = timezone.make_aware(datetime.combine(day, time.max))
+        week_day = AvailabilityWindow.DAYS_OF_WEEK[day.weekday()][0]
+        windows = []
+        for i in range(options['windows']):
+            start = random.randrange(0, 23 * 60, 30)
+            end = min(start + random.randrange(30, 240, 30), 23 * 60 + 59)
+            windows.append(SimpleNamespace(
+                week_day=week_day,
+                start_time=time(start // 60, start % 60),
+                end_time=time(end // 60, end % 60),
+            ))
+        bookings = []
+        current = day_begins
+        for i in range(options['bookings']):
+            start = current + timedelta(minutes=random.randrange(0, 60, 15))
+            end = start + timedelta(minutes=random.randrange(15, 120, 15))
+            bookings.append((start, end, f'event {i}'))
+            current = end
+        # built when a window is saved, not when the day is read
+        index = AvailabilityIndex(minutes=availability.week_minutes(windows, tz_of=lambda w: 'UTC'), timezone='UTC')
+        cases = (
+            ('legacy loops', legacy_day, windows),
+            ('interval engine', engine_day, index),
+            ('free slots of the day', engine_free_slots, index),
+        )
+        for name, func, availability_data in cases:
+            seconds = timeit.timeit(lambda: func(day_begins, day_ends, availability_data, bookings), number=options['repeat'])
+            self.stdout.write(f'{name}: {seconds / options["repeat"] * 1e6:.1f} us per day')
@@ -0,0 +1,64 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+PROFILES = ['dev', 'prod']
+
+# runs in a fresh interpreter, so nothing is imported yet
+CHILD = '''
+import io, json, sys, time
+from wsgiref.util import setup_testing_defaults
+started = time.perf_counter()
+from schedule.wsgi import application
+imported = time.perf_counter()
+environ = {'PATH_INFO': sys.argv[1], 'wsgi.errors': io.StringIO()}
+setup_testing_defaults(environ)
+status = []
+body = b''.join(application(environ, lambda s, headers, exc_info=None: status.append(s)))
+answered = time.perf_counter()
+print(json.dumps({
+    'import': imported - started,
+    'response': answered - imported,
+    'status': status[0],
+    'modules': len(sys.modules),
+}))
+'''
+
+
+class Command(BaseCommand):
+    help = (
+        'Reports the import time of schedule.wsgi.application and the time to its first response '
+        'under each settings profile, each run in a fresh interpreter.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', nargs='+', choices=PROFILES, default=PROFILES)
+        parser.add_argument('--path', default='/accounts/login/', help='requested first')
+        parser.add_argument('--runs', type=int, default=5, help='the median is reported')
+
+    def handle(self, *args, **options):
+        for profile in options['profiles']:
+            env = dict(os.environ, DJANGO_SETTINGS_MODULE=f'schedule.settings.{profile}')
+            # the request comes from wsgiref's testing defaults
+            env.setdefault('ALLOWED_HOSTS', '127.0.0.1')
+            # prod requires one
+            env.setdefault('METRICS_TOKEN', 'bench')
+            runs = []
+            for i in range(options['runs']):
+                result = subprocess.run(
+                    [sys.executable, '-c', CHILD, options['path']],
+                    cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+                )
+                if result.returncode:
+                    raise CommandError(f'{profile}: {result.stderr.strip()}')
+                runs.append(json.loads(result.stdout.splitlines()[-1]))
+            imported = statistics.median(run['import'] for run in runs) * 1000
+            response = statistics.median(run['response'] for run in runs) * 1000
+            self.stdout.write(
+                f"{profile}: import {imported:.0f} ms, first response {response:.0f} ms "
+                f"({runs[0]['status']}), {runs[0]['modules']} modules loaded"
+            )
@@ -0,0 +1,27 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from main import importers
+from main.booking import import_bookings
+
+
+class Command(BaseCommand):
+    help = 'Imports bookings for a user from an iCalendar or CSV file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=[f for f, name in importers.FORMATS], default=None,
+                            help='defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        try:
+            owner = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f'User "{options["username"]}" does not exist')
+        format = options['format'] or (importers.ICS if options['path'].lower().endswith('.ics') else importers.CSV)
+        with open(options['path'], encoding='utf-8', newline='') as f:
+            created, rejected = import_bookings(owner, importers.read(f, format), options['batch_size'])
+        for line, reason in rejected:
+            self.stdout.write(f'line {line}: {reason}')
+        self.stdout.write(self.style.SUCCESS(f'{created} bookings created, {len(rejected)} rejected'))
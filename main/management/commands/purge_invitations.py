@@ -0,0 +1,46 @@
+from datetime import timedelta
+from django.core import serializers
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from main.models import Invitation
+
+
+class Command(BaseCommand):
+    help = 'Deletes expired and used up invitations in batches, optionally archiving them to a JSON lines file first.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='keep invitations that went inactive less than this many days ago')
+        parser.add_argument('--archive', metavar='PATH', help='append the deleted invitations to this file')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='only count them')
+
+    def handle(self, *args, **options):
+        # used up invitations have no date, they go as soon as they are used up
+        purgeable = Invitation.objects.inactive(timezone.now() - timedelta(days=options['days']))
+        if options['dry_run']:
+            self.stdout.write(f'{purgeable.count()} invitations would be deleted')
+            return
+        archive = open(options['archive'], 'a', encoding='utf-8') if options['archive'] else None
+        deleted = 0
+        last_id = 0
+        try:
+            while True:
+                # batches are committed one by one, so the table is never locked for long
+                with transaction.atomic():
+                    batch = list(purgeable.filter(id__gt=last_id).order_by('id')[:options['batch_size']])
+                    if not batch:
+                        break
+                    if archive is not None:
+                        serializers.serialize('jsonl', batch, stream=archive)
+                    # bookings made with them keep existing, their invite_used is set to null
+                    Invitation.objects.filter(id__in=[i.id for i in batch]).delete()
+                if archive is not None:
+                    archive.flush()
+                last_id = batch[-1].id
+                deleted += len(batch)
+                self.stdout.write(f'{deleted} invitations deleted')
+        finally:
+            if archive is not None:
+                archive.close()
+        self.stdout.write(self.style.SUCCESS(f'{deleted} invitations deleted'))
@@ -0,0 +1,123 @@
+import random
+import time as clock
+from datetime import datetime, time, timedelta
+from itertools import islice
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from main import availability
+from main.models import AvailabilityIndex, AvailabilityWindow, Event, Invitation, Schedule
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DURATIONS = [timedelta(minutes=m) for m in (15, 30, 45, 60)]
+
+
+def peak_memory():
+    if resource is None:
+        return 'n/a'
+    # kilobytes on Linux
+    return f'{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB'
+
+
+class Command(BaseCommand):
+    help = 'Fills the database with synthetic users, events, invitations, availability windows and bookings.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--events', type=int, default=3, help='events per user')
+        parser.add_argument('--invitations', type=int, default=2, help='invitations per event')
+        parser.add_argument('--windows', type=int, default=5, help='availability windows per user')
+        parser.add_argument('--bookings', type=int, default=100, help='bookings per user')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--users-per-chunk', type=int, default=500)
+        parser.add_argument('--prefix', default='seed', help='usernames are <prefix><number>')
+        parser.add_argument('--seed', type=int, default=None, help='random seed')
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        self.batch_size = options['batch_size']
+        self.counts = {}
+        self.password = make_password('password')
+        self.start = timezone.now().replace(minute=0, second=0, microsecond=0)
+        first = User.objects.filter(username__startswith=options['prefix']).count()
+        started = clock.perf_counter()
+        for chunk_start in range(first, first + options['users'], options['users_per_chunk']):
+            chunk_end = min(chunk_start + options['users_per_chunk'], first + options['users'])
+            with transaction.atomic():
+                self.seed_chunk([f"{options['prefix']}{i}" for i in range(chunk_start, chunk_end)], options)
+            self.stdout.write(f'{chunk_end - first} users done, peak memory {peak_memory()}')
+        elapsed = clock.perf_counter() - started
+        total = sum(self.counts.values())
+        for model, count in self.counts.items():
+            self.stdout.write(f'{model}: {count} rows')
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} rows in {elapsed:.1f} s, {total / elapsed:.0f} rows/s, peak memory {peak_memory()}'
+        ))
+
+    def insert(self, model, objects):
+        # objects is a generator, only one batch is kept in memory at a time
+        objects = iter(objects)
+        while True:
+            batch = list(islice(objects, self.batch_size))
+            if not batch:
+                break
+            model.objects.bulk_create(batch, batch_size=self.batch_size)
+            self.counts[model.__name__] = self.counts.get(model.__name__, 0) + len(batch)
+
+    def seed_chunk(self, usernames, options):
+        self.insert(User, (User(username=name, password=self.password) for name in usernames))
+        # bulk_create doesn't return primary keys on every backend, so read them back
+        user_ids = list(User.objects.filter(username__in=usernames).values_list('id', flat=True))
+        # slugs are generated here instead of Event.generate_slug, which runs a query per event
+        self.insert(Event, (
+            Event(owner_id=user_id, title=f'Event {j}', slug=f'event-{j}', duration=random.choice(DURATIONS))
+            for user_id in user_ids for j in range(options['events'])
+        ))
+        events = {}
+        for event_id, owner_id, duration in Event.objects.filter(owner_id__in=user_ids).values_list('id', 'owner_id', 'duration'):
+            events.setdefault(owner_id, []).append((event_id, duration))
+        self.insert(Invitation, (
+            Invitation(event_id=event_id, owner_id=owner_id, max_number_of_uses=random.randint(1, 10))
+            for owner_id, owner_events in events.items() for event_id, duration in owner_events
+            for j in range(options['invitations'])
+        ))
+        windows = [
+            AvailabilityWindow(
+                week_day=AvailabilityWindow.DAYS_OF_WEEK[j % 7][0],
+                start_time=time(9 + j // 7 * 3 % 12),
+                end_time=time(11 + j // 7 * 3 % 12),
+            )
+            for j in range(options['windows'])
+        ]
+        self.insert(AvailabilityWindow, (
+            AvailabilityWindow(owner_id=user_id, week_day=w.week_day, start_time=w.start_time, end_time=w.end_time, timezone=w.timezone)
+            for user_id in user_ids for w in windows
+        ))
+        # bulk_create skips the signal that keeps the index up to date
+        minutes = availability.week_minutes(windows)
+        tz = timezone.get_default_timezone_name()
+        self.insert(AvailabilityIndex, (
+            AvailabilityIndex(owner_id=user_id, minutes=minutes, timezone=tz) for user_id in user_ids
+        ))
+        self.insert(Schedule, self.bookings(events, options['bookings']))
+
+    def bookings(self, events, per_user):
+        # one booking per hour and no event is longer than an hour, so they never overlap
+        for owner_id, owner_events in events.items():
+            for k in range(per_user):
+                event_id, duration = random.choice(owner_events)
+                start_time = self.start + timedelta(hours=k)
+                yield Schedule(
+                    event_id=event_id,
+                    owner_id=owner_id,
+                    start_time=start_time,
+                    end_time=start_time + duration,
+                    # bulk_create skips save(), which sets it
+                    series_end=start_time + duration,
+                )
@@ -0,0 +1,167 @@
+"""
+Request and booking metrics in the Prometheus text format, served at /metrics.
+
+Every process counts in memory under a lock, which is all a request pays.
+With METRICS_DIR set, each process writes its totals to <pid>.json there at
+most every FLUSH_INTERVAL seconds and /metrics adds up the files of all the
+workers, so it doesn't matter which worker is scraped. The directory should
+be emptied when the server starts, totals of old processes are kept in it.
+"""
+import atexit
+import json
+import os
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+from time import monotonic, perf_counter
+from django.conf import settings
+
+# seconds, the last bucket is +Inf
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+FLUSH_INTERVAL = 5
+
+# name: (type, help)
+METRICS = {
+    'schedule_request_duration_seconds': ('histogram', 'Time to respond, by url name.'),
+    'schedule_requests_total': ('counter', 'Responses by url name and status code.'),
+    'schedule_db_queries_total': ('counter', 'Database queries by url name.'),
+    'schedule_db_query_seconds_total': ('counter', 'Time spent in database queries by url name.'),
+    'schedule_bookings_total': ('counter', 'Bookings made, by who made them.'),
+    'schedule_booking_conflicts_total': ('counter', 'Bookings rejected because they overlap another one.'),
+    'schedule_invitation_uses_total': ('counter', 'Invitation links used up by a booking.'),
+}
+
+_lock = threading.Lock()
+_flush_lock = threading.Lock()
+# (name, labels) -> value, labels are sorted (key, value) pairs
+_counters = {}
+# (name, labels) -> [count per bucket, not cumulative, then +Inf, then the sum]
+_histograms = {}
+_flushed = monotonic()
+
+# [queries, seconds] of the current request, shared with the threads it runs queries in
+request_queries = ContextVar('request_queries', default=None)
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name, value=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, value, **labels):
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [0] * (len(BUCKETS) + 2)
+        histogram[bisect_left(BUCKETS, value)] += 1
+        histogram[-1] += value
+
+
+def count_queries(execute, sql, params, many, context):
+    """A connection execute_wrapper adding to the current request's query count and time."""
+    stats = request_queries.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats[0] += 1
+        stats[1] += perf_counter() - started
+
+
+def instrument(connection):
+    # connection_created is sent again on every reconnect of the same wrapper
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+def _snapshot():
+    with _lock:
+        return {
+            'counters': [[name, labels, value] for (name, labels), value in _counters.items()],
+            'histograms': [[name, labels, list(values)] for (name, labels), values in _histograms.items()],
+        }
+
+
+def flush(force=False):
+    """Write this process's totals to METRICS_DIR, unless they were written less than FLUSH_INTERVAL ago."""
+    global _flushed
+    if not settings.METRICS_DIR or not force and monotonic() - _flushed < FLUSH_INTERVAL:
+        return
+    # one thread writes, the others carry on
+    if not _flush_lock.acquire(blocking=force):
+        return
+    try:
+        _flushed = monotonic()
+        path = os.path.join(settings.METRICS_DIR, f'{os.getpid()}.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(_snapshot(), f)
+        # a reader never sees half a file
+        os.replace(path + '.tmp', path)
+    finally:
+        _flush_lock.release()
+
+
+atexit.register(flush, force=True)
+
+
+def _snapshots():
+    if not settings.METRICS_DIR:
+        return [_snapshot()]
+    flush(force=True)
+    snapshots = []
+    for name in os.listdir(settings.METRICS_DIR):
+        if name.endswith('.json'):
+            with open(os.path.join(settings.METRICS_DIR, name)) as f:
+                snapshots.append(json.load(f))
+    return snapshots
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def render():
+    """The totals of every worker in the Prometheus text format."""
+    counters, histograms = {}, {}
+    for snapshot in _snapshots():
+        for name, labels, value in snapshot['counters']:
+            key = name, tuple(map(tuple, labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, values in snapshot['histograms']:
+            key = name, tuple(map(tuple, labels))
+            total = histograms.setdefault(key, [0] * len(values))
+            for i, value in enumerate(values):
+                total[i] += value
+    lines = []
+    for name, (kind, help) in METRICS.items():
+        lines.append(f'# HELP {name} {help}')
+        lines.append(f'# TYPE {name} {kind}')
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name:
+                lines.append(f'{name}{_labels(labels)} {value}')
+        for (metric, labels), values in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ('+Inf',), values):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(labels, le=bound)} {cumulative}')
+            lines.append(f'{name}_sum{_labels(labels)} {values[-1]}')
+            lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,33 @@
+from django.db import migrations, transaction
+
+BATCH_SIZE = 1000
+
+
+def backfill(apps, schema_editor):
+    # batches are committed one by one, so the table is never locked for long
+    Schedule = apps.get_model('main', 'Schedule')
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                Schedule.objects.filter(id__gt=last_id).select_related('event').order_by('id')[:BATCH_SIZE]
+            )
+            if not batch:
+                break
+            for booking in batch:
+                booking.owner_id = booking.event.owner_id
+                booking.end_time = booking.start_time + booking.event.duration
+            Schedule.objects.bulk_update(batch, ['owner', 'end_time'])
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('main', '0003_schedule_owner_end_time'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def add_exclusion_constraint(apps, schema_editor):
+    # only PostgreSQL can reject overlapping ranges by itself
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    schema_editor.execute(
+        'ALTER TABLE main_schedule ADD CONSTRAINT schedule_no_overlap '
+        'EXCLUDE USING gist (owner_id WITH =, tstzrange(start_time, end_time, \'[)\') WITH &&)'
+    )
+
+
+def drop_exclusion_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('ALTER TABLE main_schedule DROP CONSTRAINT IF EXISTS schedule_no_overlap')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('main', '0004_backfill_schedule_span'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='schedule',
+            name='owner',
+            field=models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='schedule',
+            name='end_time',
+            field=models.DateTimeField(editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='schedule',
+            index=models.Index(fields=['owner', 'start_time', 'end_time'], name='schedule_owner_span_idx'),
+        ),
+        migrations.RunPython(add_exclusion_constraint, drop_exclusion_constraint),
+    ]
@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+from main.availability import week_minutes
+
+
+def build_indexes(apps, schema_editor):
+    AvailabilityWindow = apps.get_model('main', 'AvailabilityWindow')
+    AvailabilityIndex = apps.get_model('main', 'AvailabilityIndex')
+    windows = {}
+    for w in AvailabilityWindow.objects.order_by('-id').iterator():
+        windows.setdefault(w.owner_id, []).append(w)
+    AvailabilityIndex.objects.bulk_create([
+        AvailabilityIndex(owner_id=owner_id, minutes=week_minutes(owner_windows), timezone=owner_windows[0].timezone)
+        for owner_id, owner_windows in windows.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('main', '0005_schedule_span_constraints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='availabilitywindow',
+            name='timezone',
+            field=models.CharField(default=django.utils.timezone.get_default_timezone_name, editable=False, max_length=64),
+        ),
+        migrations.CreateModel(
+            name='AvailabilityIndex',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('minutes', models.JSONField(default=list)),
+                ('timezone', models.CharField(default=django.utils.timezone.get_default_timezone_name, max_length=64)),
+                ('owner', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='availability_index', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(build_indexes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,76 @@
+import django.core.validators
+from django.db import migrations, models, transaction
+from django.db.models import F
+import django.utils.timezone
+
+BATCH_SIZE = 1000
+
+
+def backfill(apps, schema_editor):
+    # every existing booking is a single occurrence, so its series ends with it
+    Schedule = apps.get_model('main', 'Schedule')
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            ids = list(Schedule.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:BATCH_SIZE])
+            if not ids:
+                break
+            Schedule.objects.filter(id__in=ids).update(series_end=F('end_time'))
+        last_id = ids[-1]
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('main', '0006_availability_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='schedule',
+            name='count',
+            field=models.PositiveIntegerField(blank=True, help_text='Number of occurrences.', null=True, validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+        migrations.AddField(
+            model_name='schedule',
+            name='exceptions',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.AddField(
+            model_name='schedule',
+            name='frequency',
+            field=models.CharField(blank=True, choices=[('', 'Does not repeat'), ('daily', 'Daily'), ('weekly', 'Weekly'), ('monthly', 'Monthly')], default='', max_length=7),
+        ),
+        migrations.AddField(
+            model_name='schedule',
+            name='interval',
+            field=models.PositiveSmallIntegerField(default=1, help_text='Repeat every n days, weeks or months.', validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+        migrations.AddField(
+            model_name='schedule',
+            name='series_end',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='schedule',
+            name='timezone',
+            field=models.CharField(default=django.utils.timezone.get_default_timezone_name, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='schedule',
+            name='until',
+            field=models.DateTimeField(blank=True, help_text='No occurrences after this time.', null=True),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+        # range lookups filter on series_end now (see ScheduleQuerySet.overlapping),
+        # built after the backfill
+        migrations.RemoveIndex(
+            model_name='schedule',
+            name='schedule_owner_span_idx',
+        ),
+        migrations.AddIndex(
+            model_name='schedule',
+            index=models.Index(fields=['owner', 'start_time', 'series_end'], name='schedule_owner_series_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations, transaction
+
+BATCH_SIZE = 1000
+
+
+def backfill(apps, schema_editor):
+    # batches are committed one by one, so the table is never locked for long
+    Invitation = apps.get_model('main', 'Invitation')
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                Invitation.objects.filter(id__gt=last_id).select_related('event').order_by('id')[:BATCH_SIZE]
+            )
+            if not batch:
+                break
+            for invitation in batch:
+                invitation.owner_id = invitation.event.owner_id
+            Invitation.objects.bulk_update(batch, ['owner'])
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('main', '0008_invitation_owner'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('main', '0009_backfill_invitation_owner'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='invitation',
+            name='owner',
+            field=models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='invitation',
+            index=models.Index(fields=['owner', 'expiration_time', 'id'], name='invitation_owner_expiry_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations
+
+
+def add_active_index(apps, schema_editor):
+    # only PostgreSQL can build the index without locking the table. expiration_time
+    # can't be in the condition, now() isn't immutable, so it's a column instead
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX CONCURRENTLY IF NOT EXISTS invitation_active_idx '
+        'ON main_invitation (uuid, expiration_time) WHERE uses_counter < max_number_of_uses'
+    )
+
+
+def drop_active_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX CONCURRENTLY IF EXISTS invitation_active_idx')
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('main', '0010_invitation_owner_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_active_index, drop_active_index),
+    ]
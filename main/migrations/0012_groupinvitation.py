@@ -0,0 +1,33 @@
+import datetime
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import main.models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('main', '0011_invitation_active_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupInvitation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.TextField()),
+                ('duration', models.DurationField(default=datetime.timedelta(seconds=3600))),
+                ('uuid', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('expiration_time', models.DateTimeField(default=main.models.get_default_time)),
+                ('members', models.ManyToManyField(related_name='group_invitations', to=settings.AUTH_USER_MODEL)),
+                ('owner', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='groupinvitation',
+            index=models.Index(fields=['owner', 'id'], name='group_owner_page_idx'),
+        ),
+    ]
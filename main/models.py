@@ -1,14 +1,17 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 import uuid, datetime
 from django.urls import reverse
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
-from django.db.models import F
+from django.db.models import F, Q
 from django.template.defaultfilters import slugify
 from django.utils import timezone
 from main.utils import make_utc
-import pytz
+from main import availability, metrics, recurrence, zones
+
+
+OVERLAP_ERROR = 'Events overlap in time! Please choose different start time.'
 
 
 def get_default_time():
@@ -43,26 +46,59 @@ class Event(models.Model):
         if not self.slug:
             self.generate_slug()
         super().save( *args, **kwargs)
+        # keep the stored end time of the bookings in sync with the duration
+        end_time = F('start_time') + self.duration
+        Schedule.objects.filter(event=self, frequency='').exclude(end_time=end_time).update(end_time=end_time, series_end=end_time)
+        # the end of a series depends on its rule, there is one row per series
+        for series in Schedule.objects.filter(event=self).exclude(frequency='').exclude(end_time=end_time):
+            series.event = self
+            series.save(update_fields=['end_time', 'series_end'])
 
     class Meta:
         unique_together = ['slug', 'owner']
+        indexes = [
+            # the events page, see main/pagination.py
+            models.Index(fields=['owner', 'id'], name='event_owner_page_idx'),
+        ]
+
+
+class InvitationQuerySet(models.QuerySet):
+
+    def active(self, now=None):
+        # the same test as Invitation.is_active, in the query
+        return self.filter(expiration_time__gt=now or timezone.now(), uses_counter__lt=F('max_number_of_uses'))
+
+    def inactive(self, now=None):
+        return self.filter(Q(expiration_time__lte=now or timezone.now()) | Q(uses_counter__gte=F('max_number_of_uses')))
 
 
 class Invitation(models.Model):
     event = models.ForeignKey(Event, on_delete=models.CASCADE)
+    # copied from the event on save so the list of an owner's invitations doesn't need a join
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, editable=False)
     uuid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
     uses_counter = models.IntegerField(default=0)
     max_number_of_uses = models.IntegerField(default=1, validators=[MinValueValidator(1)])
     expiration_time = models.DateTimeField(default=get_default_time)
 
+    objects = InvitationQuerySet.as_manager()
+
     def get_absolute_url(self):
         username = self.event.owner.username
         event_slug = self.event.slug
         return reverse('invitation_create', kwargs={'username': username, 'event_slug': event_slug})
 
+    def save(self, *args, **kwargs):
+        self.owner_id = self.event.owner_id
+        super().save(*args, **kwargs)
+
     def get_used(self):
-        self.uses_counter += 1
-        self.save()
+        # a conditional UPDATE, so concurrent guests can't use the link more times than allowed
+        used = Invitation.objects.active().filter(pk=self.pk).update(uses_counter=F('uses_counter') + 1)
+        if used:
+            self.uses_counter += 1
+            transaction.on_commit(lambda: metrics.inc('schedule_invitation_uses_total'))
+        return bool(used)
 
     @property
     def is_active(self):
@@ -71,43 +107,132 @@ class Invitation(models.Model):
             return True
         return False
 
+    class Meta:
+        indexes = [
+            # the invitation pages, see main/pagination.py
+            models.Index(fields=['owner', 'expiration_time', 'id'], name='invitation_owner_expiry_idx'),
+            models.Index(fields=['event', 'id'], name='invitation_event_page_idx'),
+        ]
+
+
+class GroupInvitation(models.Model):
+    """A link showing the time when all of the members are free, for a meeting of ``duration``."""
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, editable=False)
+    title = models.TextField()
+    duration = models.DurationField(default=datetime.timedelta(hours=1))
+    members = models.ManyToManyField(User, related_name='group_invitations')
+    uuid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
+    expiration_time = models.DateTimeField(default=get_default_time)
+
+    def __str__(self):
+        return self.title
+
+    def get_absolute_url(self):
+        return reverse('group_invitation_create', kwargs={'username': self.owner.username})
+
+    @property
+    def is_active(self):
+        return make_utc(self.expiration_time) > timezone.now()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['owner', 'id'], name='group_owner_page_idx'),
+        ]
+
+
+class ScheduleQuerySet(models.QuerySet):
+
+    def overlapping(self, start, end):
+        # bookings with an occurrence that may overlap [start, end), see Schedule.occurrences
+        return self.filter(Q(series_end__gt=start) | Q(series_end__isnull=True), start_time__lt=end)
+
 
 class Schedule(models.Model):
     event = models.ForeignKey(Event, on_delete=models.CASCADE)
+    # owner and end_time are copied from the event on save so overlap lookups don't need a join
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, editable=False)
+    # start_time and end_time are the first occurrence of a recurring booking
     start_time = models.DateTimeField(default=timezone.now)
+    end_time = models.DateTimeField(editable=False)
     notes = models.TextField(blank=True)
     invite_used = models.ForeignKey(Invitation, null=True, default=None, editable=False, on_delete=models.SET_NULL)
     uuid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
+    frequency = models.CharField(max_length=7, choices=recurrence.FREQUENCIES, blank=True, default='')
+    interval = models.PositiveSmallIntegerField(default=1, validators=[MinValueValidator(1)], help_text='Repeat every n days, weeks or months.')
+    count = models.PositiveIntegerField(null=True, blank=True, validators=[MinValueValidator(1)], help_text='Number of occurrences.')
+    until = models.DateTimeField(null=True, blank=True, help_text='No occurrences after this time.')
+    # starts of cancelled occurrences, see recurrence.exception_key
+    exceptions = models.JSONField(default=list, blank=True, editable=False)
+    # occurrences keep their wall-clock time in this timezone
+    timezone = models.CharField(max_length=64, default=timezone.get_default_timezone_name, editable=False)
+    # end of the last occurrence, null if the series never ends
+    series_end = models.DateTimeField(null=True, editable=False)
 
-    @property
-    def end_time(self):
-        end_time = self.start_time + self.event.duration
-        return end_time
+    objects = ScheduleQuerySet.as_manager()
 
     def __str__(self):
         tz = timezone.get_current_timezone()
         return f'{self.event.title} : {self.start_time.astimezone(tz)}'
 
     def get_absolute_url(self):
-        username = self.event.owner.username
+        username = self.owner.username
         year = f'{self.start_time.year:04d}'
         month = f'{self.start_time.month:02d}'
         day = f'{self.start_time.day:02d}'
         return reverse('schedule', kwargs={'username': username, 'year': year, 'month': month, 'day': day})
 
+    def set_span(self):
+        self.owner_id = self.event.owner_id
+        self.end_time = self.start_time + self.event.duration
+        self.series_end = recurrence.series_end(self)
+
+    def occurrences(self, start=None, end=None):
+        return recurrence.occurrences(self, start, end)
+
+    def save(self, *args, **kwargs):
+        self.set_span()
+        super().save(*args, **kwargs)
+
     def clean(self):
         cleaned_data = super().clean()
-        start = self.start_time.astimezone(pytz.utc)
-        end = self.end_time.astimezone(pytz.utc)
-        conflicting_events = Schedule.objects.filter(
-            start_time__lte=end,
-            start_time__gte=start-F('event__duration'),
-            event__owner=self.event.owner,
-        )
-        if conflicting_events.exists():
-            raise ValidationError('Events overlap in time! Please choose different start time.')
+        if self.frequency and self.until is not None and self.until < self.start_time:
+            raise ValidationError({'until': 'The series must end after it starts.'})
+        self.set_span()
+        # a series without an end is checked a year ahead
+        end = self.series_end or self.start_time + recurrence.HORIZON
+        others = Schedule.objects.filter(owner_id=self.owner_id).overlapping(self.start_time, end).exclude(pk=self.pk)
+        if not self.frequency and not others.exclude(frequency='').exists():
+            conflicting_events = others.filter(end_time__gt=self.start_time).exists()
+        else:
+            mine = availability.merge(self.occurrences(self.start_time, end))
+            theirs = availability.merge(
+                span for other in others.only(*recurrence.FIELDS) for span in other.occurrences(self.start_time, end)
+            )
+            conflicting_events = bool(availability.intersect(mine, theirs))
+        if not conflicting_events and self.series_end is None:
+            conflicting_events = self.conflicts_after(end)
+        if conflicting_events:
+            metrics.inc('schedule_booking_conflicts_total')
+            raise ValidationError(OVERLAP_ERROR)
         return cleaned_data
 
+    def conflicts_after(self, horizon):
+        # a series without an end against the bookings starting past its horizon,
+        # each over its own span, or a year of it if it doesn't end either
+        later = Schedule.objects.filter(owner_id=self.owner_id, start_time__gte=horizon).exclude(pk=self.pk)
+        for other in later.only('series_end', *recurrence.FIELDS).iterator():
+            end = other.series_end or other.start_time + recurrence.HORIZON
+            mine = availability.merge(self.occurrences(other.start_time, end))
+            if mine and availability.intersect(mine, availability.merge(other.occurrences(other.start_time, end))):
+                return True
+        return False
+
+    class Meta:
+        indexes = [
+            # see ScheduleQuerySet.overlapping, series_end is checked in the index
+            models.Index(fields=['owner', 'start_time', 'series_end'], name='schedule_owner_series_idx'),
+        ]
+
 
 class AvailabilityWindow(models.Model):
     MONDAY = "Mo"
@@ -128,8 +253,11 @@ class AvailabilityWindow(models.Model):
     ]
     owner = models.ForeignKey(User, on_delete=models.CASCADE)
     week_day = models.CharField(max_length=2, choices=DAYS_OF_WEEK, null=False, blank=False)
-    start_time = models.TimeField(null=False, blank=False) #TODO: time should be stored in utc and the day of the week should be corrected accordingly 
+    # wall-clock times in the timezone below, a window ending before it starts goes past midnight
+    # reads go through AvailabilityIndex, which keeps them in utc
+    start_time = models.TimeField(null=False, blank=False)
     end_time = models.TimeField(null=False, blank=False)
+    timezone = models.CharField(max_length=64, default=timezone.get_default_timezone_name, editable=False)
     uuid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
 
     def __str__(self) -> str:
@@ -142,3 +270,56 @@ class AvailabilityWindow(models.Model):
         for day, name in self.DAYS_OF_WEEK:
             if day == self.week_day:
                 return name
+
+    def clean(self):
+        # the index applies daylight saving time in one timezone, see AvailabilityIndex
+        other = AvailabilityWindow.objects.filter(owner_id=self.owner_id).exclude(pk=self.pk).exclude(timezone=self.timezone)
+        other_timezone = other.values_list('timezone', flat=True).first()
+        if other_timezone is not None:
+            raise ValidationError(
+                f'Your other availability windows are in {other_timezone}. Switch to that timezone or delete them first.'
+            )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['owner', 'id'], name='window_owner_page_idx'),
+        ]
+
+
+class AvailabilityIndex(models.Model):
+    """
+    All availability windows of an owner merged into sorted UTC minute-of-week
+    intervals, rebuilt whenever a window changes (see main/signals.py). The
+    windows of an owner share one timezone (see AvailabilityWindow.clean).
+    """
+    owner = models.OneToOneField(User, on_delete=models.CASCADE, related_name='availability_index')
+    # flattened [start0, end0, start1, end1, ...]
+    minutes = models.JSONField(default=list)
+    # daylight saving time is applied in this timezone
+    timezone = models.CharField(max_length=64, default=timezone.get_default_timezone_name)
+
+    def __str__(self):
+        return f'Availability index of {self.owner_id}'
+
+    @classmethod
+    def rebuild(cls, owner_id, create=True):
+        windows = list(AvailabilityWindow.objects.filter(owner_id=owner_id).order_by('-id'))
+        values = {
+            'minutes': availability.week_minutes(windows),
+            'timezone': windows[0].timezone if windows else timezone.get_default_timezone_name(),
+        }
+        if create:
+            cls.objects.update_or_create(owner_id=owner_id, defaults=values)
+        else:
+            cls.objects.filter(owner_id=owner_id).update(**values)
+
+    @classmethod
+    def for_owner(cls, owner):
+        # None if the owner never set a window; free when loaded with select_related
+        try:
+            return owner.availability_index
+        except cls.DoesNotExist:
+            return None
+
+    def intervals(self, start, end):
+        return availability.expand_week_minutes(self.minutes, zones.get_zone(self.timezone), start, end)
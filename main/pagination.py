@@ -0,0 +1,87 @@
+"""
+Keyset pagination.
+
+A page is read with a WHERE on the ordering columns of the row it continues
+from instead of an OFFSET, so with an index on the filter and ordering
+columns page 1000 costs the same as page 1. The cursor in the url is that
+row's key, signed so it can't be made up.
+"""
+from functools import reduce
+from operator import or_
+from django.core import signing
+from django.db.models import Q
+
+PAGE_SIZE = 50
+
+SALT = 'main.pagination'
+
+
+class KeysetPage:
+    """A page of rows with the cursors of the pages before and after it, None at either end."""
+
+    def __init__(self, object_list, previous_cursor, next_cursor):
+        self.object_list = object_list
+        self.previous_cursor = previous_cursor
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_other_pages(self):
+        return self.previous_cursor is not None or self.next_cursor is not None
+
+
+def _key(obj, fields):
+    return signing.dumps([field.value_to_string(obj) for field in fields], salt=SALT, compress=True)
+
+
+def _decode(cursor, fields):
+    """The key in ``cursor``, None if it isn't one of ours."""
+    try:
+        values = signing.loads(cursor, salt=SALT)
+    except signing.BadSignature:
+        return None
+    if not isinstance(values, list) or len(values) != len(fields):
+        return None
+    return [field.to_python(value) for field, value in zip(fields, values)]
+
+
+def _beyond(names, values, lookup):
+    # (a, b) > (x, y) as (a > x) or (a = x and b > y), which every backend can use an index for
+    return reduce(or_, (
+        Q(**dict(zip(names[:i], values[:i])), **{f'{names[i]}__{lookup}': values[i]})
+        for i in range(len(names))
+    ))
+
+
+def paginate(queryset, ordering, after=None, before=None, per_page=PAGE_SIZE):
+    """
+    The page of ``queryset`` after the cursor ``after`` or before ``before``,
+    the first one without either. ``ordering`` are field names, ascending,
+    ending with a unique one, like ['expiration_time', 'id'].
+    """
+    fields = [queryset.model._meta.get_field(name) for name in ordering]
+    names = [field.attname for field in fields]
+    key = _decode(before, fields) if before else None
+    if key is not None:
+        rows = list(queryset.filter(_beyond(names, key, 'lt')).order_by(*(f'-{name}' for name in names))[:per_page + 1])
+        # nothing left before it, the rows were deleted in the meantime: the first page
+        if rows:
+            more, rows = len(rows) > per_page, rows[:per_page][::-1]
+            return KeysetPage(rows, _key(rows[0], fields) if more else None, _key(rows[-1], fields))
+    key = _decode(after, fields) if after else None
+    if key is not None:
+        queryset = queryset.filter(_beyond(names, key, 'gt'))
+    rows = list(queryset.order_by(*names)[:per_page + 1])
+    more, rows = len(rows) > per_page, rows[:per_page]
+    # the first row of a later page, which is where the page before it ends
+    previous_cursor = _key(rows[0], fields) if key is not None and rows else None
+    return KeysetPage(rows, previous_cursor, _key(rows[-1], fields) if more else None)
+
+
+def paginate_request(request, queryset, ordering, per_page=PAGE_SIZE):
+    """The page of ``queryset`` the ``after`` or ``before`` cursor of the request asks for."""
+    return paginate(queryset, ordering, request.GET.get('after'), request.GET.get('before'), per_page)
@@ -0,0 +1,158 @@
+"""
+Recurring bookings.
+
+A booking with a frequency stands for a whole series, a subset of RFC 5545
+RRULE: FREQ=DAILY/WEEKLY/MONTHLY with INTERVAL, COUNT or UNTIL, and EXDATE
+style exceptions. Occurrences are never stored, they are expanded lazily for
+the range a page asks for, so a series costs one row however long it is.
+Occurrences keep their wall-clock time in the booking's timezone across
+daylight saving time changes. A monthly series skips months that don't have
+its day, like RRULE does.
+"""
+import calendar
+import heapq
+import itertools
+from datetime import timedelta
+from .zones import UTC, get_zone
+
+
+DAILY = 'daily'
+WEEKLY = 'weekly'
+MONTHLY = 'monthly'
+FREQUENCIES = [
+    ('', 'Does not repeat'),
+    (DAILY, 'Daily'),
+    (WEEKLY, 'Weekly'),
+    (MONTHLY, 'Monthly'),
+]
+
+# conflicts of a series without an end are checked this far ahead, and feeds
+# list its occurrences this far ahead
+HORIZON = timedelta(days=366)
+
+# what the expansion needs, for .only()
+FIELDS = ['start_time', 'end_time', 'frequency', 'interval', 'count', 'until', 'exceptions', 'timezone']
+
+
+def exception_key(start):
+    """How an occurrence start is stored in Schedule.exceptions."""
+    return start.astimezone(UTC).isoformat()
+
+
+def _step(booking):
+    # daily and weekly series only
+    return timedelta(days=booking.interval * (7 if booking.frequency == WEEKLY else 1))
+
+
+def _local_start(first, frequency, interval, n):
+    """Wall-clock start of the n-th step, None if the month has no such day."""
+    if frequency == MONTHLY:
+        month = first.month - 1 + n * interval
+        year, month = first.year + month // 12, month % 12 + 1
+        if first.day > calendar.monthrange(year, month)[1]:
+            return None
+        return first.replace(year=year, month=month)
+    return first + timedelta(days=n * interval * (7 if frequency == WEEKLY else 1))
+
+
+def _starts(booking, after=None):
+    """
+    Starts of the series in order, exceptions included. With ``after`` daily
+    and weekly series jump close to it instead of walking from the first one.
+    """
+    tz = get_zone(booking.timezone)
+    first = booking.start_time.astimezone(tz).replace(tzinfo=None)
+    n = 0
+    if after is not None and booking.frequency != MONTHLY:
+        # a day of margin for daylight saving time
+        n = max(0, (after - booking.start_time - timedelta(days=1)) // _step(booking))
+    # every step of a daily or weekly series is an occurrence, so this is exact
+    index = n
+    while booking.count is None or index < booking.count:
+        local = _local_start(first, booking.frequency, booking.interval, n)
+        n += 1
+        if local is None:
+            continue
+        index += 1
+        # kept in utc, so adding the duration doesn't follow the wall clock
+        start = local.replace(tzinfo=tz).astimezone(UTC)
+        if booking.until is not None and start > booking.until:
+            return
+        yield start
+
+
+def occurrences(booking, start=None, end=None):
+    """
+    Yield (start, end) of the occurrences of ``booking`` overlapping
+    [start, end) in order. Without ``end`` a series without an end never stops.
+    """
+    duration = booking.end_time - booking.start_time
+    if not booking.frequency:
+        if (start is None or booking.end_time > start) and (end is None or booking.start_time < end):
+            yield booking.start_time, booking.end_time
+        return
+    skipped = set(booking.exceptions)
+    for s in _starts(booking, start - duration if start is not None else None):
+        if end is not None and s >= end:
+            return
+        if start is not None and s + duration <= start:
+            continue
+        if exception_key(s) not in skipped:
+            yield s, s + duration
+
+
+def series_end(booking):
+    """End of the last occurrence, None if the series has no end."""
+    if not booking.frequency:
+        return booking.end_time
+    if booking.count is None and booking.until is None:
+        return None
+    after = booking.until
+    if booking.count is not None and booking.frequency != MONTHLY:
+        last = booking.start_time + _step(booking) * (booking.count - 1)
+        after = min(after, last) if after is not None else last
+    last = None
+    # exceptions are ignored, the end only has to bound the occurrences
+    for last in _starts(booking, after):
+        pass
+    if last is None:
+        return booking.end_time
+    return last + (booking.end_time - booking.start_time)
+
+
+def _labelled(booking, start, end):
+    for s, e in occurrences(booking, start, end):
+        yield s, e, booking
+
+
+def expand(bookings, start, end):
+    """(start, end, booking) of every occurrence of ``bookings`` in [start, end), by start time."""
+    # a generator function per booking: a generator expression would see the last booking only
+    return heapq.merge(*(_labelled(b, start, end) for b in bookings), key=lambda occurrence: occurrence[0])
+
+
+def expand_sorted(bookings, start, end):
+    """
+    Like expand, for ``bookings`` ordered by start time, which are read only
+    as far as the occurrences taken from it: a booking has no occurrence
+    before its start, so later ones can wait.
+    """
+    bookings = iter(bookings)
+    upcoming = next(bookings, None)
+    heap = []
+    # breaks ties, occurrences and generators don't compare
+    order = itertools.count()
+    while True:
+        while upcoming is not None and (not heap or upcoming.start_time <= heap[0][0]):
+            series = _labelled(upcoming, start, end)
+            first = next(series, None)
+            if first is not None:
+                heapq.heappush(heap, (first[0], next(order), first, series))
+            upcoming = next(bookings, None)
+        if not heap:
+            return
+        occurrence_start, _, occurrence, series = heapq.heappop(heap)
+        yield occurrence
+        following = next(series, None)
+        if following is not None:
+            heapq.heappush(heap, (following[0], next(order), following, series))
@@ -0,0 +1,33 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from . import metrics
+from .cache import bump_owner_version
+from .models import AvailabilityIndex, AvailabilityWindow, Event, Schedule
+
+
+@receiver([post_save, post_delete], sender=Schedule)
+@receiver([post_save, post_delete], sender=Event)
+@receiver([post_save, post_delete], sender=AvailabilityWindow)
+def owner_data_changed(sender, instance, **kwargs):
+    # after the commit: a reader seeing the new version must also see the new rows,
+    # or it would cache the old ones under it
+    owner_id = instance.owner_id
+    transaction.on_commit(lambda: bump_owner_version(owner_id))
+
+
+@receiver(post_save, sender=AvailabilityWindow)
+def window_saved(sender, instance, **kwargs):
+    AvailabilityIndex.rebuild(instance.owner_id)
+
+
+@receiver(post_delete, sender=AvailabilityWindow)
+def window_deleted(sender, instance, **kwargs):
+    # no create here: the owner may be being deleted along with the windows
+    AvailabilityIndex.rebuild(instance.owner_id, create=False)
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    metrics.instrument(connection)
@@ -1,3 +1,1477 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import tempfile
+import threading
+import uuid
+from datetime import date, datetime, time, timedelta
+from itertools import islice
+from time import perf_counter
+from types import SimpleNamespace
+from unittest import skipUnless
+import pytz
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test import Client, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import get_resolver, reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from main import availability, booking, ics, importers, metrics, pagination, recurrence, zones
+from main.async_views import GuestScheduleView
+from main.cache import get_owner_version
+from main.models import OVERLAP_ERROR, AvailabilityIndex, AvailabilityWindow, Event, GroupInvitation, Invitation, Schedule
+from main.utils import GUEST_PATH_PREFIX, GUEST_TIMEZONE_COOKIE, api_token, feed_token, get_available_intervals, get_busy_intervals
+from main.views import ScheduleView
+from schedule import routers
 
-# Create your tests here.
+
+def at(hour, minute=0, day=7):
+    return datetime(2023, 8, day, hour, minute, tzinfo=pytz.utc)
+
+
+def metric(series):
+    # the current value of a series in /metrics, 0 before it's first counted
+    for line in metrics.render().splitlines():
+        if line.startswith(series + ' '):
+            return float(line.split()[-1])
+    return 0
+
+
+class IntervalEngineTest(SimpleTestCase):
+
+    def test_merge_sorts_and_joins_overlapping_and_touching(self):
+        merged = availability.merge([(at(12), at(13)), (at(9), at(10)), (at(9, 30), at(11)), (at(11), at(11, 30))])
+        self.assertEqual(merged, [(at(9), at(11, 30)), (at(12), at(13))])
+
+    def test_merge_drops_empty_intervals(self):
+        self.assertEqual(availability.merge([(at(10), at(10)), (at(11), at(9))]), [])
+
+    def test_subtract(self):
+        available = [(at(9), at(12)), (at(13), at(17))]
+        busy = [(at(8), at(9, 30)), (at(10), at(10, 30)), (at(11, 30), at(14))]
+        self.assertEqual(
+            availability.subtract(available, busy),
+            [(at(9, 30), at(10)), (at(10, 30), at(11, 30)), (at(14), at(17))]
+        )
+
+    def test_intersect(self):
+        a = [(at(9), at(12)), (at(13), at(17))]
+        b = [(at(11), at(14)), (at(16), at(18))]
+        self.assertEqual(availability.intersect(a, b), [(at(11), at(12)), (at(13), at(14)), (at(16), at(17))])
+
+    def test_grid_covers_a_whole_day(self):
+        slots = availability.grid(at(0), at(23, 59))
+        self.assertEqual(len(slots), 48)
+        self.assertEqual(slots[-1], at(23, 30))
+
+    def test_slots_within_respects_duration(self):
+        slots = availability.slots_within([(at(9), at(10, 30))], at(0), at(23, 59), duration=timedelta(hours=1))
+        self.assertEqual(slots, [at(9), at(9, 30)])
+
+    def test_occupied_slots_marks_every_touched_slot(self):
+        bookings = [(at(9, 15), at(10), 'a'), (at(10), at(10, 45), 'b')]
+        self.assertEqual(
+            availability.occupied_slots(bookings, at(0), at(23, 59)),
+            {at(9): 'a', at(9, 30): 'a', at(10): 'b', at(10, 30): 'b'}
+        )
+
+    def test_occupied_slots_clips_to_range(self):
+        bookings = [(at(23, 0, day=6), at(0, 30), 'late')]
+        self.assertEqual(availability.occupied_slots(bookings, at(0), at(23, 59)), {at(0): 'late'})
+
+    def test_free_slots(self):
+        slots = availability.free_slots(
+            [(at(9), at(12))], [(at(10), at(11))], at(0), at(23, 59), duration=timedelta(minutes=30)
+        )
+        self.assertEqual(slots, [at(9), at(9, 30), at(11), at(11, 30)])
+
+    def test_index_intervals_use_week_day_and_timezone(self):
+        windows = [
+            SimpleNamespace(week_day='Mo', start_time=time(9), end_time=time(11), timezone='America/Los_Angeles'),
+            SimpleNamespace(week_day='Tu', start_time=time(9), end_time=time(11), timezone='America/Los_Angeles'),
+        ]
+        index = AvailabilityIndex(minutes=availability.week_minutes(windows), timezone='America/Los_Angeles')
+        # 2023-08-07 is a Monday, Los Angeles is UTC-7 in August
+        tz = pytz.timezone('America/Los_Angeles')
+        day_begins = tz.localize(datetime(2023, 8, 7))
+        day_ends = tz.localize(datetime(2023, 8, 7, 23, 59))
+        self.assertEqual(index.intervals(day_begins, day_ends), [(at(16), at(18))])
+
+
+class ScheduleViewTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('owner', password='secret')
+        self.event = Event.objects.create(owner=self.owner, title='Call', duration=timedelta(minutes=45))
+        self.invite = Invitation.objects.create(event=self.event, max_number_of_uses=5)
+        # 2023-08-07 is a Monday
+        AvailabilityWindow.objects.create(owner=self.owner, week_day='Mo', start_time=time(9), end_time=time(12), timezone='UTC')
+        Schedule.objects.create(event=self.event, start_time=at(10, 15))
+
+    @override_settings(TIME_ZONE='UTC')
+    def test_owner_day_shows_every_slot(self):
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse('schedule', kwargs=dict(username='owner', year='2023', month='08', day='07')))
+        self.assertEqual(len(response.context['time_list']), 48)
+        self.assertEqual(response.context['schedule_dict'], {at(10): 'Call', at(10, 30): 'Call'})
+
+    @override_settings(TIME_ZONE='UTC')
+    def test_day_grid_is_cached_until_the_owner_changes_something(self):
+        url = reverse('schedule_as_guest', kwargs=dict(uuid=self.invite.uuid, year='2023', month='08', day='07'))
+        first = self.client.get(url).content
+        # only the invitation is read
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url).content, first)
+        with self.captureOnCommitCallbacks(execute=True):
+            Schedule.objects.create(event=self.event, start_time=at(9))
+        self.assertContains(self.client.get(url), 'unavailable', count=4)
+
+    @override_settings(TIME_ZONE='UTC')
+    def test_guest_day_shows_only_available_slots(self):
+        response = self.client.get(reverse('schedule_as_guest', kwargs=dict(uuid=self.invite.uuid, year='2023', month='08', day='07')))
+        self.assertEqual(response.context['time_list'], availability.grid(at(9), at(12)))
+        self.assertContains(response, 'unavailable', count=2)
+
+
+class CalendarHeatmapTest(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', password='secret')
+        self.event = Event.objects.create(owner=self.owner, title='Call', duration=timedelta(hours=1))
+        self.invite = Invitation.objects.create(event=self.event, max_number_of_uses=5)
+        for week_day in ('Mo', 'Tu'):
+            AvailabilityWindow.objects.create(owner=self.owner, week_day=week_day, start_time=time(9), end_time=time(11), timezone='UTC')
+        Schedule.objects.create(event=self.event, start_time=at(9, day=7))
+        Schedule.objects.create(event=self.event, start_time=at(9, day=8))
+        Schedule.objects.create(event=self.event, start_time=at(10, day=8))
+
+    @override_settings(TIME_ZONE='UTC')
+    def test_guest_calendar_marks_days(self):
+        response = self.client.get(reverse('guest_calendar', kwargs=dict(uuid=self.invite.uuid, year='2023', month='08')))
+        statuses = {day: status for day, week_day, status in response.context['calendar'] if day}
+        self.assertEqual(statuses[7], availability.PARTIAL)
+        self.assertEqual(statuses[8], availability.FULL)
+        self.assertEqual(statuses[14], availability.FREE)
+        # no availability windows on Wednesdays
+        self.assertEqual(statuses[9], availability.FULL)
+
+    @override_settings(TIME_ZONE='UTC')
+    def test_owner_calendar_counts_the_whole_day(self):
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse('calendar', kwargs=dict(username='owner', year='2023', month='08')))
+        statuses = {day: status for day, week_day, status in response.context['calendar'] if day}
+        self.assertEqual(statuses[8], availability.PARTIAL)
+        self.assertEqual(statuses[9], availability.FREE)
+
+    @override_settings(TIME_ZONE='UTC')
+    def test_only_bookings_inside_the_availability_count(self):
+        long_call = Event.objects.create(owner=self.owner, title='Long call', duration=timedelta(hours=2))
+        # outside Monday's 9-11 window, after the 9:00 booking
+        Schedule.objects.create(event=long_call, start_time=at(15, day=14))
+        # crosses midnight into Tuesday's window
+        Schedule.objects.create(event=Event.objects.create(owner=self.owner, title='Night', duration=timedelta(hours=13)),
+                                start_time=at(22, day=14))
+        response = self.client.get(reverse('guest_calendar', kwargs=dict(uuid=self.invite.uuid, year='2023', month='08')))
+        statuses = {day: status for day, week_day, status in response.context['calendar'] if day}
+        self.assertEqual(statuses[14], availability.FREE)
+        self.assertEqual(statuses[15], availability.FULL)
+
+    @override_settings(TIME_ZONE='UTC')
+    def test_series_started_before_the_month(self):
+        # a Monday in July
+        Schedule.objects.create(event=self.event, start_time=at(9, day=21) - timedelta(days=28), frequency='weekly')
+        response = self.client.get(reverse('guest_calendar', kwargs=dict(uuid=self.invite.uuid, year='2023', month='08')))
+        statuses = {day: status for day, week_day, status in response.context['calendar'] if day}
+        self.assertEqual(statuses[21], availability.PARTIAL)
+
+
+class ScheduleSpanTest(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', password='secret')
+        self.event = Event.objects.create(owner=self.owner, title='Call', duration=timedelta(hours=1))
+        self.booking = Schedule.objects.create(event=self.event, start_time=at(10))
+
+    def test_owner_and_end_time_are_stored(self):
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.owner, self.owner)
+        self.assertEqual(self.booking.end_time, at(11))
+
+    def test_duration_change_updates_end_time(self):
+        self.event.duration = timedelta(minutes=90)
+        self.event.save()
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.end_time, at(11, 30))
+
+    def test_clean_rejects_overlap(self):
+        with self.assertRaises(ValidationError):
+            Schedule(event=self.event, start_time=at(10, 30)).clean()
+        with self.assertRaises(ValidationError):
+            Schedule(event=self.event, start_time=at(9, 30)).clean()
+
+    def test_clean_allows_back_to_back(self):
+        Schedule(event=self.event, start_time=at(11)).clean()
+        Schedule(event=self.event, start_time=at(9)).clean()
+
+    def test_clean_ignores_the_booking_itself(self):
+        self.booking.clean()
+
+    def test_a_longer_duration_must_not_make_bookings_overlap(self):
+        self.client.force_login(self.owner)
+        url = reverse('event_update', kwargs=dict(username='owner', event_slug=self.event.slug))
+        other = Event.objects.create(owner=self.owner, title='Review', duration=timedelta(minutes=30))
+        Schedule.objects.create(event=other, start_time=at(12), frequency='daily', count=2)
+        # into the series' first occurrence
+        response = self.client.post(url, {'title': 'Call', 'duration': '02:30:00'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['form'].errors['duration'], [booking.DURATION_OVERLAP_ERROR])
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.end_time, at(11))
+        # into the event's own next booking
+        Schedule.objects.create(event=self.event, start_time=at(10, day=8))
+        self.assertEqual(self.client.post(url, {'title': 'Call', 'duration': '24:30:00'}).status_code, 200)
+        self.assertEqual(self.client.post(url, {'title': 'Call', 'duration': '02:00:00'}).status_code, 302)
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.end_time, at(12))
+
+
+class ConcurrentGuestBookingTest(TransactionTestCase):
+    threads = 12
+
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', password='secret')
+        self.event = Event.objects.create(owner=self.owner, title='Call', duration=timedelta(hours=1))
+        self.invite = Invitation.objects.create(event=self.event, max_number_of_uses=3)
+
+    def book_in_parallel(self, start_times):
+        barrier = threading.Barrier(len(start_times))
+        outcomes = []
+
+        def guest(start_time):
+            invite = Invitation.objects.get(pk=self.invite.pk)
+            barrier.wait()
+            try:
+                booking.book_with_invitation(invite, Schedule(event=self.event, start_time=start_time))
+                outcomes.append('booked')
+            except (PermissionDenied, ValidationError):
+                outcomes.append('rejected')
+            except OperationalError:
+                # SQLite refuses a concurrent writer instead of waiting, the attempt is rolled back
+                outcomes.append('rejected')
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=guest, args=(t,)) for t in start_times]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return outcomes
+
+    def test_invitation_is_never_overused(self):
+        outcomes = self.book_in_parallel([at(i) for i in range(self.threads)])
+        self.invite.refresh_from_db()
+        self.assertGreaterEqual(outcomes.count('booked'), 1)
+        self.assertLessEqual(self.invite.uses_counter, self.invite.max_number_of_uses)
+        self.assertEqual(self.invite.uses_counter, outcomes.count('booked'))
+        self.assertEqual(Schedule.objects.filter(invite_used=self.invite).count(), outcomes.count('booked'))
+
+    def test_slot_is_never_double_booked(self):
+        self.invite.max_number_of_uses = self.threads
+        self.invite.save()
+        outcomes = self.book_in_parallel([at(10)] * self.threads)
+        self.invite.refresh_from_db()
+        self.assertEqual(outcomes.count('booked'), 1)
+        self.assertEqual(Schedule.objects.filter(owner=self.owner).count(), 1)
+        self.assertEqual(self.invite.uses_counter, 1)
+
+
+class InvitationLookupTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('owner', password='secret')
+        self.event = Event.objects.create(owner=self.owner, title='Call', duration=timedelta(hours=1))
+        self.invite = Invitation.objects.create(event=self.event, max_number_of_uses=5)
+        self.kwargs = dict(uuid=self.invite.uuid, year='2023', month='08', day='07')
+
+    def test_guest_day_fetches_the_invitation_once(self):
+        # invitation with event, owner and availability index, bookings
+        with self.assertNumQueries(2):
+            self.client.get(reverse('schedule_as_guest', kwargs=self.kwargs))
+
+    def test_guest_form_fetches_the_invitation_once(self):
+        with self.assertNumQueries(1):
+            self.client.get(reverse('schedule_as_guest_form', kwargs=dict(self.kwargs, time='10:00')))
+
+    def test_a_failed_booking_gives_the_use_back(self):
+        self.invite.max_number_of_uses = 1
+        self.invite.save()
+        Schedule.objects.create(event=self.event, start_time=at(10))
+        # taken after the form was validated, by a concurrent booking
+        with self.assertRaisesMessage(ValidationError, OVERLAP_ERROR):
+            booking.book_with_invitation(self.invite, Schedule(event=self.event, start_time=at(10)))
+        # still usable, so the form shows the overlap instead of "expired"
+        self.assertEqual(self.invite.uses_counter, 0)
+        self.assertTrue(self.invite.is_active)
+        self.invite.refresh_from_db()
+        self.assertEqual(self.invite.uses_counter, 0)
+
+
+class QueryBudgetTest(TestCase):
+    """
+    Every page gets a fixed query budget, checked on seeded data and again
+    after more rows are added, so per-row queries fail the build.
+    """
+    day = dict(year='2023', month='08', day='07')
+    report = []
+
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('owner', password='secret')
+        other = User.objects.create_user('other', password='secret')
+        self.events = []
+        for user in (self.owner, other):
+            for title in ('Call', 'Interview', 'Review'):
+                event = Event.objects.create(owner=user, title=title, duration=timedelta(minutes=45))
+                if user == self.owner:
+                    self.events.append(event)
+        self.event = self.events[0]
+        self.invite = Invitation.objects.create(event=self.event, max_number_of_uses=100)
+        self.booking = Schedule.objects.create(event=self.event, start_time=at(1), invite_used=self.invite)
+        self.window = AvailabilityWindow.objects.create(owner=self.owner, week_day='Mo', start_time=time(0), end_time=time(23))
+        self.group = GroupInvitation.objects.create(owner=self.owner, title='Team')
+        self.group.members.add(self.owner, other)
+        self.seed(1)
+
+    def seed(self, n):
+        # n more rows of everything the owner's pages list
+        hour = Schedule.objects.filter(owner=self.owner).count() + 1
+        for i in range(n):
+            for event in self.events:
+                Invitation.objects.create(event=event)
+                Schedule.objects.create(event=event, start_time=at(hour))
+                hour += 1
+            Schedule.objects.create(event=self.event, start_time=at(i, day=5), frequency='weekly', count=4)
+            Event.objects.create(owner=self.owner, title='Extra')
+            AvailabilityWindow.objects.create(owner=self.owner, week_day='Tu', start_time=time(9), end_time=time(10))
+            GroupInvitation.objects.create(owner=self.owner, title='Extra').members.add(self.owner)
+            self.group.members.add(User.objects.create_user(f'member{User.objects.count()}'))
+
+    def urls(self):
+        owner = dict(username='owner')
+        event = dict(owner, event_slug=self.event.slug)
+        guest = dict(uuid=self.invite.uuid)
+        # url name: (kwargs, logged in as the owner, query budget)
+        return {
+            'home': ({}, True, 2),
+            'signup': ({}, False, 0),
+            'set_timezone': ({}, True, 2),
+            'calendar_redirect': (owner, True, 2),
+            'calendar': (dict(owner, year='2023', month='08'), True, 3),
+            'schedule': (dict(owner, **self.day), True, 3),
+            'events': (owner, True, 3),
+            'calendar_feed': (owner, True, 3),
+            'event_calendar_feed': (event, True, 4),
+            'create_event': (owner, True, 2),
+            'schedule_event': (owner, True, 3),
+            'schedule_event_form': (dict(owner, time='10:00', **self.day), True, 3),
+            'import_bookings': (owner, True, 2),
+            'schedule_cancel': (dict(owner, uuid=self.booking.uuid), True, 4),
+            'event_delete': (event, True, 3),
+            'event_update': (event, True, 3),
+            'active_invitations': (owner, True, 3),
+            'set_availability': (owner, True, 3),
+            'availability_delete': (dict(owner, uuid=self.window.uuid), True, 3),
+            'event_calendar_redirect': (event, True, 2),
+            'event_schedule': (dict(event, **self.day), True, 3),
+            'event_calendar': (dict(event, year='2023', month='08'), True, 3),
+            'event_schedule_form': (dict(event, time='10:00', **self.day), True, 4),
+            'invitation_create': (event, True, 4),
+            'invitation_create_menu': (owner, True, 3),
+            'guest_calendar_redirect': (guest, False, 1),
+            'set_timezone_guest': (guest, False, 0),
+            'guest_calendar': (dict(guest, year='2023', month='08'), False, 2),
+            'schedule_as_guest': (dict(guest, **self.day), False, 2),
+            'schedule_as_guest_form': (dict(guest, time='10:00', **self.day), False, 1),
+            'schedule_as_guest_success': (dict(uuid=self.booking.uuid), False, 1),
+            'free_slots': (guest, False, 2),
+            'next_available': (guest, False, 2),
+            'group_free_slots': (dict(uuid=self.group.uuid), False, 4),
+            'group_invitation_create': (owner, True, 4),
+            'group_join': (dict(uuid=self.group.uuid), True, 4),
+            'bulk_booking': (owner, True, 3),
+            'week': (dict(owner, **self.day), True, 3),
+            'week_as_guest': (dict(guest, **self.day), False, 2),
+            'metrics': ({}, False, 0),
+        }
+
+    def measure(self, name, kwargs, as_owner):
+        self.client.logout()
+        if as_owner:
+            self.client.force_login(self.owner)
+        started = perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(name, kwargs=kwargs))
+            if response.streaming:
+                b''.join(response.streaming_content)
+        elapsed = perf_counter() - started
+        self.assertLess(response.status_code, 400, name)
+        return len(queries), elapsed
+
+    @override_settings(TIME_ZONE='UTC')
+    def test_query_budgets(self):
+        urls = self.urls()
+        counts = {}
+        for name, (kwargs, as_owner, budget) in urls.items():
+            with self.subTest(url=name):
+                counts[name], elapsed = self.measure(name, kwargs, as_owner)
+                self.report.append((name, 'owner' if as_owner else 'guest', counts[name], elapsed))
+                self.assertLessEqual(counts[name], budget)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.seed(5)
+        for name, (kwargs, as_owner, budget) in urls.items():
+            with self.subTest(url=name, rows='more'):
+                self.assertEqual(self.measure(name, kwargs, as_owner)[0], counts[name], 'the query count grows with the data')
+
+    def test_every_url_has_a_budget(self):
+        names = {p.name for p in get_resolver().url_patterns if getattr(p, 'name', None)}
+        self.assertEqual(names - set(self.urls()), set())
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        if cls.report:
+            print('\nqueries per page:')
+            for name, viewer, count, elapsed in sorted(cls.report, key=lambda row: -row[2]):
+                print(f'  {name:<28} {viewer:<6} {count:>3} queries {elapsed * 1000:7.1f} ms')
+
+
+class CalendarFeedTest(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', password='secret')
+        self.event = Event.objects.create(owner=self.owner, title='Call, weekly', duration=timedelta(hours=1))
+        Schedule.objects.create(event=self.event, start_time=at(10), notes='first line\nsecond line')
+        self.url = reverse('calendar_feed', kwargs=dict(username='owner')) + '?token=' + feed_token('owner')
+
+    def test_feed_lists_bookings(self):
+        response = self.client.get(self.url)
+        content = b''.join(response.streaming_content).decode()
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        self.assertIn('DTSTART:20230807T100000Z\r\n', content)
+        self.assertIn('DTEND:20230807T110000Z\r\n', content)
+        self.assertIn('SUMMARY:Call\\, weekly\r\n', content)
+        self.assertIn('DESCRIPTION:first line\\nsecond line\r\n', content)
+
+    def test_feed_needs_a_token(self):
+        response = self.client.get(reverse('calendar_feed', kwargs=dict(username='owner')) + '?token=wrong')
+        self.assertEqual(response.status_code, 403)
+
+    def test_unknown_event_is_not_found(self):
+        url = reverse('event_calendar_feed', kwargs=dict(username='owner', event_slug='nope')) + '?token=' + feed_token('owner')
+        self.assertEqual(self.client.get(url).status_code, 404)
+        url = reverse('event_calendar_feed', kwargs=dict(username='owner', event_slug=self.event.slug)) + '?token=' + feed_token('owner')
+        self.assertIn('SUMMARY:Call', b''.join(self.client.get(url).streaming_content).decode())
+
+    def test_repeated_poll_gets_not_modified_without_reading_bookings(self):
+        etag = self.client.get(self.url)['ETag']
+        # only the owner is looked up
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_new_booking_changes_the_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Schedule.objects.create(event=self.event, start_time=at(12))
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class FoldTest(SimpleTestCase):
+
+    def test_long_lines_are_folded_at_75_octets(self):
+        folded = ics.fold('SUMMARY:' + 'é' * 100)
+        lines = folded.split('\r\n')
+        self.assertTrue(all(len(line.encode()) <= 75 for line in lines))
+        self.assertEqual(''.join(line[1:] if i else line for i, line in enumerate(lines)), 'SUMMARY:' + 'é' * 100)
+
+
+class ImportBookingsTest(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', password='secret')
+        self.event = Event.objects.create(owner=self.owner, title='Call', duration=timedelta(hours=1))
+        Schedule.objects.create(event=self.event, start_time=at(10))
+
+    def import_lines(self, text, format):
+        return booking.import_bookings(self.owner, importers.read(io.StringIO(text), format, pytz.utc))
+
+    def test_csv_import_rejects_conflicts(self):
+        created, rejected = self.import_lines(
+            'event,start_time,end_time,notes\n'
+            'Call,2023-08-07T12:00:00,,\n'
+            'call,2023-08-07T10:30:00,,\n'
+            'Call,2023-08-07T10:30:00+00:00,,overlaps the saved booking\n'
+            'Lunch,2023-08-07T12:30:00,2023-08-07T13:30:00,overlaps the first line\n'
+            'Lunch,2023-08-07T14:00:00,2023-08-07T14:30:00,\n'
+            'Call,yesterday,,\n',
+            importers.CSV
+        )
+        self.assertEqual(created, 2)
+        self.assertEqual([line for line, reason in rejected], [3, 4, 5, 7])
+        lunch = Schedule.objects.get(event__title='Lunch')
+        self.assertEqual((lunch.start_time, lunch.end_time, lunch.series_end, lunch.owner), (at(14), at(14, 30), at(14, 30), self.owner))
+
+    def test_ics_import(self):
+        created, rejected = self.import_lines(
+            'BEGIN:VCALENDAR\r\n'
+            'BEGIN:VEVENT\r\n'
+            'SUMMARY:Call\r\n'
+            'DTSTART;TZID=Europe/Berlin:20230807T140000\r\n'
+            'DURATION:PT1H\r\n'
+            'DESCRIPTION:a long\r\n'
+            '  description\r\n'
+            'END:VEVENT\r\n'
+            'BEGIN:VEVENT\r\n'
+            'SUMMARY:Call\r\n'
+            'DTSTART:20230807T103000Z\r\n'
+            'DTEND:20230807T113000Z\r\n'
+            'END:VEVENT\r\n'
+            'BEGIN:VEVENT\r\n'
+            'SUMMARY:Holiday\r\n'
+            'DTSTART;VALUE=DATE:20230808\r\n'
+            'END:VEVENT\r\n'
+            'END:VCALENDAR\r\n',
+            importers.ICS
+        )
+        self.assertEqual(created, 1)
+        self.assertEqual([line for line, reason in rejected], [9, 14])
+        imported = Schedule.objects.get(start_time=at(12))
+        self.assertEqual((imported.event, imported.notes), (self.event, 'a long description'))
+
+    def test_conflicts_are_found_across_batches(self):
+        text = (
+            'event,start_time,end_time\n'
+            'Lunch,2023-08-07T12:00:00,2023-08-07T13:00:00\n'
+            'Call,2023-08-07T14:00:00,\n'
+            'Lunch,2023-08-07T12:30:00,2023-08-07T13:30:00\n'
+        )
+        created, rejected = booking.import_bookings(self.owner, importers.read(io.StringIO(text), importers.CSV, pytz.utc), batch_size=2)
+        self.assertEqual(created, 2)
+        self.assertEqual([line for line, reason in rejected], [4])
+
+    def test_a_failed_import_leaves_no_events_behind(self):
+        def entries():
+            yield {'line': 2, 'title': 'Lunch', 'start': at(12), 'end': at(13)}
+            raise ValueError
+        with self.assertRaises(ValueError):
+            booking.import_bookings(self.owner, entries(), batch_size=1)
+        self.assertFalse(Event.objects.filter(title='Lunch').exists())
+        self.assertEqual(Schedule.objects.count(), 1)
+
+    def test_upload(self):
+        self.client.force_login(self.owner)
+        upload = io.BytesIO(b'event,start_time\nCall,2023-08-08T10:00:00+00:00\n')
+        upload.name = 'bookings.csv'
+        response = self.client.post(
+            reverse('import_bookings', kwargs=dict(username='owner')),
+            {'file': upload, 'format': importers.CSV}
+        )
+        self.assertEqual(response.context['created'], 1)
+        self.assertTrue(Schedule.objects.filter(start_time=at(10, day=8)).exists())
+
+
+@override_settings(TIME_ZONE='UTC')
+class FreeSlotsTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('owner', password='secret')
+        self.event = Event.objects.create(owner=self.owner, title='Call', duration=timedelta(hours=1))
+        self.invite = Invitation.objects.create(event=self.event, max_number_of_uses=5)
+        self.window = AvailabilityWindow.objects.create(owner=self.owner, week_day='Mo', start_time=time(9), end_time=time(12), timezone='UTC')
+        Schedule.objects.create(event=self.event, start_time=at(10))
+        self.url = reverse('free_slots', kwargs=dict(uuid=self.invite.uuid)) + '?start=2023-08-07&end=2023-08-08'
+
+    def test_free_slots(self):
+        data = self.client.get(self.url).json()
+        self.assertEqual(data['slots'], ['2023-08-07T09:00:00+00:00', '2023-08-07T11:00:00+00:00'])
+        self.assertEqual(data['duration'], 60)
+
+    def test_second_request_is_served_from_cache(self):
+        self.client.get(self.url)
+        # only the invitation is read
+        with self.assertNumQueries(1):
+            self.client.get(self.url)
+
+    def test_changes_invalidate_the_cache(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Schedule.objects.create(event=self.event, start_time=at(11))
+        self.assertEqual(self.client.get(self.url).json()['slots'], ['2023-08-07T09:00:00+00:00'])
+        self.window.end_time = time(13)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.window.save()
+        self.assertEqual(self.client.get(self.url).json()['slots'], ['2023-08-07T09:00:00+00:00', '2023-08-07T12:00:00+00:00'])
+
+    def test_the_version_changes_only_after_the_commit(self):
+        version = get_owner_version(self.owner.pk)
+        with self.captureOnCommitCallbacks() as callbacks:
+            Schedule.objects.create(event=self.event, start_time=at(11))
+            # a reader before the commit must not cache the old rows under a new version
+            self.assertEqual(get_owner_version(self.owner.pk), version)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(get_owner_version(self.owner.pk), version)
+
+    def test_bad_range(self):
+        response = self.client.get(reverse('free_slots', kwargs=dict(uuid=self.invite.uuid)) + '?start=2023-08-07&end=2023-08-01')
+        self.assertEqual(response.status_code, 400)
+
+
+class AvailabilityIndexTest(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', password='secret')
+
+    def window(self, week_day, start, end, tz='Europe/Berlin'):
+        return AvailabilityWindow.objects.create(owner=self.owner, week_day=week_day, start_time=start, end_time=end, timezone=tz)
+
+    def intervals(self, start, end):
+        owner = User.objects.select_related('availability_index').get(pk=self.owner.pk)
+        with self.assertNumQueries(0):
+            return get_available_intervals(owner, start, end)
+
+    def test_windows_are_merged_in_utc_on_write(self):
+        self.window('Mo', time(9), time(12))
+        self.window('Mo', time(11), time(13))
+        # Berlin is UTC+1 without daylight saving time
+        self.assertEqual(AvailabilityIndex.objects.get(owner=self.owner).minutes, [8 * 60, 12 * 60])
+
+    def test_daylight_saving_time(self):
+        self.window('Mo', time(9), time(12))
+        # summer (UTC+2) and winter (UTC+1)
+        self.assertEqual(self.intervals(at(0), at(23, 59)), [(at(7), at(10))])
+        winter = datetime(2023, 12, 4, tzinfo=pytz.utc)
+        self.assertEqual(self.intervals(winter, winter + timedelta(days=1)), [(winter + timedelta(hours=8), winter + timedelta(hours=11))])
+
+    def test_window_past_midnight_and_week_end(self):
+        self.window('Su', time(22), time(2), tz='UTC')
+        sunday = datetime(2023, 8, 6, tzinfo=pytz.utc)
+        self.assertEqual(
+            self.intervals(sunday, sunday + timedelta(days=2)),
+            [(sunday + timedelta(hours=22), sunday + timedelta(hours=26))]
+        )
+
+    def test_west_of_utc_crosses_into_the_next_utc_day(self):
+        self.window('Fr', time(20), time(23), tz='America/Los_Angeles')
+        friday = datetime(2023, 8, 11, tzinfo=pytz.utc)
+        self.assertEqual(
+            self.intervals(friday, friday + timedelta(days=2)),
+            [(friday + timedelta(hours=27), friday + timedelta(hours=30))]
+        )
+
+    def test_window_across_a_daylight_saving_change(self):
+        self.window('Sa', time(22, 30), time(6, 30), tz='America/Los_Angeles')
+        # summer time ends on 2023-11-05 at 02:00, each end keeps its own offset
+        saturday = datetime(2023, 11, 4, tzinfo=pytz.utc)
+        self.assertEqual(
+            self.intervals(saturday, saturday + timedelta(days=2)),
+            [(saturday + timedelta(hours=29, minutes=30), saturday + timedelta(hours=38, minutes=30))]
+        )
+
+    def test_no_gap_where_the_week_is_split(self):
+        # Monday 00:00 UTC is Sunday 16:00 in Los Angeles standard time, after the change
+        self.window('Sa', time(20), time(0), tz='America/Los_Angeles')
+        self.window('Su', time(0), time(20), tz='America/Los_Angeles')
+        saturday = datetime(2023, 11, 4, tzinfo=pytz.utc)
+        self.assertEqual(
+            self.intervals(saturday, saturday + timedelta(days=3)),
+            [(saturday + timedelta(hours=27), saturday + timedelta(hours=52))]
+        )
+
+    def test_windows_of_an_owner_share_a_timezone(self):
+        self.window('Mo', time(9), time(12))
+        self.client.force_login(self.owner)
+        session = self.client.session
+        session['django_timezone'] = 'America/Los_Angeles'
+        session.save()
+        response = self.client.post(
+            reverse('set_availability', kwargs=dict(username='owner')),
+            {'week_day': 'Tu', 'start_time': '09:00', 'end_time': '12:00'}
+        )
+        self.assertContains(response, 'Your other availability windows are in Europe/Berlin.')
+        self.assertEqual(AvailabilityWindow.objects.filter(owner=self.owner).count(), 1)
+
+    def test_deleting_the_last_window_empties_the_index(self):
+        self.window('Mo', time(9), time(12)).delete()
+        self.assertEqual(self.intervals(at(0), at(23, 59)), [])
+
+
+def series(start, hours=1, frequency='weekly', interval=1, count=None, until=None, exceptions=(), tz='UTC'):
+    return SimpleNamespace(
+        start_time=start, end_time=start + timedelta(hours=hours), frequency=frequency, interval=interval,
+        count=count, until=until, exceptions=list(exceptions), timezone=tz,
+    )
+
+
+class RecurrenceTest(SimpleTestCase):
+
+    def test_weekly_series_is_expanded_for_the_range_only(self):
+        weekly = series(at(10, day=1))
+        self.assertEqual(
+            list(recurrence.occurrences(weekly, at(0, day=14), at(0, day=29))),
+            [(at(10, day=15), at(11, day=15)), (at(10, day=22), at(11, day=22))]
+        )
+
+    def test_far_ranges_jump_to_the_occurrence(self):
+        daily = series(at(9), frequency='daily', interval=2)
+        start = at(0) + timedelta(days=3650)
+        occurrences = list(recurrence.occurrences(daily, start, start + timedelta(days=4)))
+        self.assertEqual(len(occurrences), 2)
+        self.assertEqual((occurrences[0][0] - at(9)).days % 2, 0)
+
+    def test_count_until_and_exceptions(self):
+        self.assertEqual(len(list(recurrence.occurrences(series(at(9), frequency='daily', count=5)))), 5)
+        self.assertEqual(len(list(recurrence.occurrences(series(at(9), frequency='daily', until=at(9, day=9))))), 3)
+        skipped = series(at(9), frequency='daily', count=3, exceptions=[recurrence.exception_key(at(9, day=8))])
+        self.assertEqual([s for s, e in recurrence.occurrences(skipped)], [at(9), at(9, day=9)])
+
+    def test_monthly_skips_months_without_the_day(self):
+        monthly = series(datetime(2023, 1, 31, 9, tzinfo=pytz.utc), frequency='monthly', count=3)
+        self.assertEqual(
+            [s.month for s, e in recurrence.occurrences(monthly)],
+            [1, 3, 5]
+        )
+
+    def test_wall_clock_time_is_kept_across_daylight_saving_time(self):
+        berlin = pytz.timezone('Europe/Berlin')
+        weekly = series(berlin.localize(datetime(2023, 10, 23, 9)), tz='Europe/Berlin', count=2)
+        self.assertEqual(
+            [s.astimezone(berlin).hour for s, e in recurrence.occurrences(weekly)],
+            [9, 9]
+        )
+
+    def test_expand_keeps_each_occurrence_with_its_booking(self):
+        daily, weekly = series(at(9), frequency='daily'), series(at(11))
+        self.assertEqual(
+            [(s.day, b) for s, e, b in recurrence.expand([daily, weekly], at(0), at(0, day=9))],
+            [(7, daily), (7, weekly), (8, daily)]
+        )
+
+    def test_series_end(self):
+        self.assertEqual(recurrence.series_end(series(at(9), frequency='daily', count=3)), at(10, day=9))
+        self.assertEqual(recurrence.series_end(series(at(9), until=at(0, day=30))), at(10, day=28))
+        self.assertIsNone(recurrence.series_end(series(at(9))))
+
+
+@override_settings(TIME_ZONE='UTC')
+class RecurringBookingTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('owner', password='secret')
+        self.event = Event.objects.create(owner=self.owner, title='Standup', duration=timedelta(minutes=30))
+        # every Monday at 9, without an end
+        self.series = Schedule.objects.create(event=self.event, start_time=at(9), frequency='weekly', timezone='UTC')
+
+    def test_one_row_per_series(self):
+        self.assertEqual(Schedule.objects.count(), 1)
+        self.assertIsNone(self.series.series_end)
+
+    def test_clean_checks_every_occurrence(self):
+        with self.assertRaises(ValidationError):
+            Schedule(event=self.event, start_time=at(9, day=28)).clean()
+        Schedule(event=self.event, start_time=at(9, day=29)).clean()
+        with self.assertRaises(ValidationError):
+            Schedule(event=self.event, start_time=at(9, day=1), frequency='daily', count=7).clean()
+        Schedule(event=self.event, start_time=at(9, day=1), frequency='daily', count=6).clean()
+
+    def test_clean_checks_bookings_past_the_horizon(self):
+        # a Monday two years on
+        Schedule.objects.create(event=self.event, start_time=at(10) + timedelta(weeks=104))
+        with self.assertRaises(ValidationError):
+            Schedule(event=self.event, start_time=at(10), frequency='weekly').clean()
+        Schedule(event=self.event, start_time=at(11), frequency='weekly').clean()
+        Schedule(event=self.event, start_time=at(10), frequency='weekly', count=10).clean()
+
+    def test_day_view_shows_the_occurrence(self):
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse('schedule', kwargs=dict(username='owner', year='2023', month='09', day='04')))
+        start = datetime(2023, 9, 4, 9, tzinfo=pytz.utc)
+        self.assertEqual(response.context['schedule_dict'], {start: 'Standup'})
+
+    def test_cancelling_one_occurrence(self):
+        self.client.force_login(self.owner)
+        url = reverse('schedule_cancel', kwargs=dict(username='owner', uuid=self.series.uuid))
+        self.client.post(url + '?occurrence=' + at(9, day=14).isoformat().replace('+', '%2B'))
+        self.series.refresh_from_db()
+        self.assertEqual(self.series.exceptions, [recurrence.exception_key(at(9, day=14))])
+        Schedule(event=self.event, start_time=at(9, day=14)).clean()
+
+    def test_duration_change_moves_the_series_end(self):
+        finite = Schedule.objects.create(event=self.event, start_time=at(12), frequency='daily', count=3)
+        self.event.duration = timedelta(hours=1)
+        self.event.save()
+        finite.refresh_from_db()
+        self.assertEqual(finite.series_end, at(13, day=9))
+
+    def test_feed_lists_occurrences(self):
+        content = ''.join(ics.calendar([self.series], 'owner', until=at(0, day=22)))
+        self.assertEqual(content.count('BEGIN:VEVENT'), 3)
+        self.assertIn(f'UID:{self.series.uuid}-20230814T090000Z@schedule', content)
+
+    def test_free_slots_skip_occurrences(self):
+        busy = get_busy_intervals(self.owner, at(0, day=14), at(0, day=15))
+        self.assertEqual(busy, [(at(9, day=14), at(9, 30, day=14))])
+
+
+class ZonesTest(SimpleTestCase):
+    berlin = zones.get_zone('Europe/Berlin')
+
+    def test_zones_are_cached(self):
+        self.assertIs(zones.get_zone('Europe/Berlin'), self.berlin)
+
+    def test_day_range_on_daylight_saving_changes(self):
+        spring, autumn = zones.day_range(date(2023, 3, 26), self.berlin), zones.day_range(date(2023, 10, 29), self.berlin)
+        self.assertEqual(spring[1] - spring[0], timedelta(hours=23))
+        self.assertEqual(autumn[1] - autumn[0], timedelta(hours=25))
+        self.assertEqual(autumn[0], datetime(2023, 10, 28, 22, tzinfo=pytz.utc))
+
+    def test_to_local_matches_astimezone_across_the_change(self):
+        for day in (date(2023, 3, 26), date(2023, 10, 29)):
+            start, end = zones.day_range(day, self.berlin)
+            slots = availability.grid(start, end, timedelta(minutes=15))
+            local = zones.to_local(slots, self.berlin)
+            expected = [t.astimezone(self.berlin) for t in slots]
+            self.assertEqual([(t.replace(tzinfo=None), t.fold) for t in local], [(t.replace(tzinfo=None), t.fold) for t in expected])
+
+    def test_repeated_hour_is_told_apart(self):
+        first = datetime(2023, 10, 29, 0, 30, tzinfo=pytz.utc)
+        local = zones.to_local([first, first + timedelta(hours=1)], self.berlin)
+        self.assertEqual([t.hour for t in local], [2, 2])
+        self.assertEqual([t.fold for t in local], [0, 1])
+
+    def test_to_utc(self):
+        self.assertEqual(
+            zones.to_utc([datetime(2023, 3, 26, 1, 30), datetime(2023, 3, 26, 3, 30), datetime(2023, 10, 29, 2, 30)], self.berlin),
+            [datetime(2023, 3, 26, 0, 30, tzinfo=pytz.utc), datetime(2023, 3, 26, 1, 30, tzinfo=pytz.utc), datetime(2023, 10, 29, 0, 30, tzinfo=pytz.utc)]
+        )
+        # the skipped hour is read with the offset from before the change, like zoneinfo does
+        skipped = datetime(2023, 3, 26, 2, 30)
+        self.assertEqual(zones.to_utc([skipped], self.berlin), [skipped.replace(tzinfo=self.berlin).astimezone(pytz.utc)])
+
+
+class TimezoneViewTest(TestCase):
+
+    def set_timezone(self, name):
+        session = self.client.session
+        session['django_timezone'] = name
+        session.save()
+
+    def test_unknown_timezone_falls_back_to_the_default(self):
+        self.set_timezone('Nowhere/Special')
+        response = self.client.get(reverse('login'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_day_with_a_repeated_hour(self):
+        owner = User.objects.create_user('owner', password='secret')
+        event = Event.objects.create(owner=owner, title='Call', duration=timedelta(minutes=30))
+        # 02:00 the second time, after the clocks are turned back
+        Schedule.objects.create(event=event, start_time=datetime(2023, 10, 29, 1, tzinfo=pytz.utc))
+        self.client.force_login(owner)
+        self.set_timezone('Europe/Berlin')
+        response = self.client.get(reverse('schedule', kwargs=dict(username='owner', year='2023', month='10', day='29')))
+        self.assertEqual(len(response.context['slots']), 50)
+        self.assertEqual([local.strftime('%H:%M') for i, local in response.context['slots'][4:8]], ['02:00', '02:30', '02:00', '02:30'])
+        self.assertContains(response, '<td>02:00</td>', count=1)
+
+
+@override_settings(ROOT_URLCONF='schedule.asgi_urls', TIME_ZONE='UTC')
+class AsyncGuestViewTest(TransactionTestCase):
+    # queries run in threads of their own, which can't see a TestCase transaction
+
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('owner', password='secret')
+        self.event = Event.objects.create(owner=self.owner, title='Call', duration=timedelta(minutes=45))
+        self.invite = Invitation.objects.create(event=self.event, max_number_of_uses=5)
+        AvailabilityWindow.objects.create(owner=self.owner, week_day='Mo', start_time=time(9), end_time=time(12), timezone='UTC')
+        self.booking = Schedule.objects.create(event=self.event, start_time=at(10, 15))
+
+    async def test_guest_calendar(self):
+        response = await self.async_client.get(reverse('guest_calendar', kwargs=dict(uuid=self.invite.uuid, year='2023', month='08')))
+        statuses = {day: status for day, week_day, status in response.context['calendar'] if day}
+        self.assertEqual(statuses[7], availability.PARTIAL)
+        self.assertEqual(statuses[14], availability.FREE)
+
+    async def test_guest_day(self):
+        url = reverse('schedule_as_guest', kwargs=dict(uuid=self.invite.uuid, year='2023', month='08', day='07'))
+        for visit in range(3):
+            response = await self.async_client.get(url)
+            self.assertContains(response, 'unavailable', count=2)
+        self.assertIs(response.resolver_match.func.view_class, GuestScheduleView)
+        self.assertTrue(asyncio.iscoroutinefunction(response.resolver_match.func))
+        # cached from the second visit on
+        self.assertEqual(len([key for key in cache._cache if 'day-grid' in key]), 1)
+
+    async def test_redirect_and_success_pages(self):
+        response = await self.async_client.get(reverse('guest_calendar_redirect', kwargs=dict(uuid=self.invite.uuid)))
+        self.assertEqual(response.status_code, 302)
+        response = await self.async_client.get(reverse('schedule_as_guest_success', kwargs=dict(uuid=self.booking.uuid)))
+        self.assertContains(response, 'Call')
+
+    async def test_expired_invitation(self):
+        await sync_to_async(Invitation.objects.filter(pk=self.invite.pk).update)(uses_counter=5)
+        response = await self.async_client.get(reverse('guest_calendar', kwargs=dict(uuid=self.invite.uuid, year='2023', month='08')))
+        self.assertEqual(response.status_code, 403)
+
+    async def test_other_methods(self):
+        response = await self.async_client.post(reverse('guest_calendar_redirect', kwargs=dict(uuid=self.invite.uuid)))
+        self.assertEqual(response.status_code, 405)
+
+    async def test_queries_in_threads_are_counted(self):
+        series = 'schedule_db_queries_total{view="guest_calendar"}'
+        before = metric(series)
+        await self.async_client.get(reverse('guest_calendar', kwargs=dict(uuid=self.invite.uuid, year='2023', month='08')))
+        # the invitation and the bookings, in two threads
+        self.assertEqual(metric(series) - before, 2)
+
+
+@override_settings(TIME_ZONE='UTC')
+class GuestTimezoneTest(TestCase):
+
+    def setUp(self):
+        owner = User.objects.create_user('owner', password='secret')
+        event = Event.objects.create(owner=owner, title='Call', duration=timedelta(minutes=30))
+        self.invite = Invitation.objects.create(event=event, max_number_of_uses=5)
+        self.calendar = reverse('guest_calendar', kwargs=dict(uuid=self.invite.uuid, year='2023', month='08'))
+
+    def test_guest_flow_writes_no_session(self):
+        self.client.get(reverse('guest_calendar_redirect', kwargs=dict(uuid=self.invite.uuid)))
+        response = self.client.post(reverse('set_timezone_guest', kwargs=dict(uuid=self.invite.uuid)), {'timezone': 'Europe/Berlin'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.cookies[GUEST_TIMEZONE_COOKIE]['path'], GUEST_PATH_PREFIX)
+        self.assertContains(self.client.get(self.calendar), 'Your current time zone is Europe/Berlin')
+        self.assertEqual(Session.objects.count(), 0)
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, self.client.cookies)
+
+    def test_timezone_in_the_link_is_remembered(self):
+        response = self.client.get(self.calendar + '?tz=Asia/Tokyo')
+        self.assertContains(response, 'Your current time zone is Asia/Tokyo')
+        self.assertIn(GUEST_TIMEZONE_COOKIE, response.cookies)
+        self.assertContains(self.client.get(self.calendar), 'Your current time zone is Asia/Tokyo')
+
+    def test_forged_cookie_is_ignored(self):
+        self.client.cookies[GUEST_TIMEZONE_COOKIE] = 'Asia/Tokyo'
+        self.assertContains(self.client.get(self.calendar), 'Your current time zone is UTC')
+        response = self.client.post(reverse('set_timezone_guest', kwargs=dict(uuid=self.invite.uuid)), {'timezone': 'Nowhere/Special'})
+        self.assertNotIn(GUEST_TIMEZONE_COOKIE, response.cookies)
+
+
+class KeysetPaginationTest(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', password='secret')
+        event = Event.objects.create(owner=self.owner, title='Call', duration=timedelta(minutes=30))
+        expires = timezone.now() + timedelta(days=1)
+        # ties on expiration_time are broken by id
+        for i in range(7):
+            Invitation.objects.create(event=event, expiration_time=expires + timedelta(hours=i // 3))
+        self.invitations = Invitation.objects.filter(owner=self.owner)
+
+    def test_walks_forward_and_back(self):
+        ordering = ['expiration_time', 'id']
+        expected = list(self.invitations.order_by(*ordering))
+        pages, page = [], pagination.paginate(self.invitations, ordering, per_page=3)
+        while True:
+            pages.append(page)
+            if page.next_cursor is None:
+                break
+            page = pagination.paginate(self.invitations, ordering, after=page.next_cursor, per_page=3)
+        self.assertEqual([len(p) for p in pages], [3, 3, 1])
+        self.assertEqual([i for p in pages for i in p], expected)
+        self.assertIsNone(pages[0].previous_cursor)
+        back = pagination.paginate(self.invitations, ordering, before=pages[2].previous_cursor, per_page=3)
+        self.assertEqual(back.object_list, pages[1].object_list)
+        back = pagination.paginate(self.invitations, ordering, before=back.previous_cursor, per_page=3)
+        self.assertEqual(back.object_list, pages[0].object_list)
+        self.assertIsNone(back.previous_cursor)
+
+    def test_made_up_cursor_is_the_first_page(self):
+        page = pagination.paginate(self.invitations, ['id'], after='1:forged', per_page=3)
+        self.assertEqual(page.object_list, list(self.invitations.order_by('id')[:3]))
+
+    def test_later_pages_cost_the_same(self):
+        self.client.force_login(self.owner)
+        url = reverse('active_invitations', kwargs=dict(username='owner'))
+        with CaptureQueriesContext(connection) as first:
+            response = self.client.get(url)
+        page = pagination.paginate(self.invitations, ['expiration_time', 'id'], per_page=1)
+        with CaptureQueriesContext(connection) as later:
+            self.client.get(url, {'after': page.next_cursor})
+        self.assertEqual(len(first), len(later))
+        self.assertNotContains(response, 'pagination-next')
+
+
+class SeedScheduleTest(TestCase):
+
+    def test_seed(self):
+        call_command(
+            'seed_schedule', users=3, events=2, invitations=2, windows=4, bookings=5,
+            batch_size=4, users_per_chunk=2, seed=1, stdout=io.StringIO()
+        )
+        self.assertEqual(User.objects.filter(username__startswith='seed').count(), 3)
+        self.assertEqual(Event.objects.count(), 6)
+        self.assertEqual(Invitation.objects.count(), 12)
+        self.assertEqual(AvailabilityWindow.objects.count(), 12)
+        self.assertEqual(AvailabilityIndex.objects.count(), 3)
+        self.assertEqual(Schedule.objects.count(), 15)
+        self.assertFalse(Schedule.objects.filter(series_end__isnull=True).exists())
+        for owner in User.objects.all():
+            bookings = list(Schedule.objects.filter(owner=owner).order_by('start_time'))
+            self.assertTrue(all(a.end_time <= b.start_time for a, b in zip(bookings, bookings[1:])))
+            self.assertTrue(all(b.end_time == b.start_time + b.event.duration == b.series_end for b in bookings))
+
+
+class PurgeInvitationsTest(TestCase):
+
+    def setUp(self):
+        owner = User.objects.create_user('owner', password='secret')
+        self.event = Event.objects.create(owner=owner, title='Call', duration=timedelta(minutes=30))
+        now = timezone.now()
+        self.active = Invitation.objects.create(event=self.event, max_number_of_uses=2, uses_counter=1)
+        self.recent = Invitation.objects.create(event=self.event, expiration_time=now - timedelta(days=1))
+        self.old = Invitation.objects.create(event=self.event, expiration_time=now - timedelta(days=60))
+        self.used = Invitation.objects.create(event=self.event, uses_counter=1)
+        self.booking = Schedule.objects.create(event=self.event, start_time=at(10), invite_used=self.used)
+
+    def test_purges_in_batches_and_archives(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'invitations.jsonl')
+            out = io.StringIO()
+            call_command('purge_invitations', archive=path, batch_size=1, stdout=out)
+            with open(path, encoding='utf-8') as f:
+                archived = [json.loads(line)['fields']['uuid'] for line in f]
+        self.assertEqual(set(Invitation.objects.all()), {self.active, self.recent})
+        self.assertEqual(sorted(archived), sorted([str(self.old.uuid), str(self.used.uuid)]))
+        self.assertIn('1 invitations deleted\n2 invitations deleted\n', out.getvalue())
+        self.booking.refresh_from_db()
+        self.assertIsNone(self.booking.invite_used)
+
+    def test_dry_run_deletes_nothing(self):
+        out = io.StringIO()
+        call_command('purge_invitations', dry_run=True, stdout=out)
+        self.assertIn('2 invitations would be deleted', out.getvalue())
+        self.assertEqual(Invitation.objects.count(), 4)
+
+    def test_only_active_invitations_are_looked_up(self):
+        url = lambda invite: reverse('free_slots', kwargs=dict(uuid=invite.uuid))
+        self.assertEqual(self.client.get(url(self.recent)).status_code, 403)
+        self.assertEqual(self.client.get(url(self.used)).status_code, 403)
+        self.assertEqual(self.client.get(reverse('free_slots', kwargs=dict(uuid=uuid.uuid4()))).status_code, 404)
+        self.assertEqual(list(Invitation.objects.active()), [self.active])
+
+
+class MetricsTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('owner', password='secret')
+        self.event = Event.objects.create(owner=self.owner, title='Call', duration=timedelta(hours=1))
+        self.invite = Invitation.objects.create(event=self.event, max_number_of_uses=5)
+        AvailabilityWindow.objects.create(owner=self.owner, week_day='Mo', start_time=time(0), end_time=time(23), timezone='UTC')
+
+    def test_requests_by_url_name(self):
+        self.client.force_login(self.owner)
+        requests = 'schedule_requests_total{status="200",view="events"}'
+        queries = 'schedule_db_queries_total{view="events"}'
+        slow = 'schedule_request_duration_seconds_bucket{view="events",le="+Inf"}'
+        before = metric(requests), metric(queries), metric(slow)
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(reverse('events', kwargs=dict(username='owner')))
+        self.assertEqual(metric(requests) - before[0], 1)
+        self.assertEqual(metric(queries) - before[1], len(context))
+        self.assertEqual(metric(slow) - before[2], 1)
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        self.assertContains(response, '# TYPE schedule_request_duration_seconds histogram\n')
+
+    def test_bookings_invite_uses_and_conflicts(self):
+        url = reverse('schedule_as_guest_form', kwargs=dict(uuid=self.invite.uuid, year='2023', month='08', day='07', time='10:00'))
+        before = [metric(s) for s in (
+            'schedule_bookings_total{source="guest"}', 'schedule_invitation_uses_total', 'schedule_booking_conflicts_total',
+        )]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url, {'notes': ''})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url, {'notes': ''})
+        after = [metric(s) for s in (
+            'schedule_bookings_total{source="guest"}', 'schedule_invitation_uses_total', 'schedule_booking_conflicts_total',
+        )]
+        self.assertEqual([a - b for a, b in zip(after, before)], [1, 1, 1])
+
+    def test_workers_are_added_up(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            mine = metric('schedule_invitation_uses_total')
+            with open(os.path.join(directory, '1.json'), 'w') as f:
+                json.dump({'counters': [['schedule_invitation_uses_total', [], 2]], 'histograms': []}, f)
+            self.assertEqual(metric('schedule_invitation_uses_total'), mine + 2)
+            self.assertTrue(os.path.exists(os.path.join(directory, f'{os.getpid()}.json')))
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class ReplicaRouterTest(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', password='secret')
+        self.event = Event.objects.create(owner=self.owner, title='Call', duration=timedelta(hours=1))
+        self.client.force_login(self.owner)
+
+    def tearDown(self):
+        routers.request_state.set(None)
+
+    def test_reads_follow_the_request_writes_go_to_the_primary(self):
+        router = routers.ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Schedule))
+        routers.request_state.set({'replica': 'replica0', 'wrote': False})
+        self.assertEqual(router.db_for_read(Schedule), 'replica0')
+        self.assertEqual(router.db_for_write(Schedule), 'default')
+        self.assertTrue(routers.request_state.get()['wrote'])
+
+    def test_a_write_pins_the_client_to_the_primary(self):
+        response = self.client.get(reverse('calendar', kwargs=dict(username='owner', year='2023', month='08')))
+        self.assertNotIn(routers.PIN_COOKIE, response.cookies)
+        response = self.client.post(
+            reverse('schedule_event', kwargs=dict(username='owner')),
+            {'event': self.event.pk, 'start_time': '2023-08-07 10:00', 'interval': 1},
+        )
+        self.assertEqual(Schedule.objects.count(), 1)
+        self.assertEqual(response.cookies[routers.PIN_COOKIE]['max-age'], settings.REPLICA_PIN_SECONDS)
+
+    def test_a_day_grid_read_from_a_replica_is_not_cached(self):
+        cache.clear()
+        day = dict(year='2023', month='08', day='07')
+        url = reverse('schedule', kwargs=dict(username='owner', **day))
+        # the primary stands in for a replica
+        with override_settings(DATABASE_REPLICAS=['default']):
+            self.client.get(url)
+        self.assertIsNone(cache.get(ScheduleView.get_grid_key(self.owner.pk, day)))
+        self.client.get(url)
+        self.assertIsNotNone(cache.get(ScheduleView.get_grid_key(self.owner.pk, day)))
+
+
+@skipUnless(settings.DATABASE_REPLICAS, 'needs REPLICA_DATABASE_URLS, e.g. sqlite:////tmp/replica.sqlite3')
+class ReplicaDatabaseTest(TestCase):
+    # the test replica is a database of its own, nothing is replicated to it, so the
+    # other tests read nothing from it: run it alone, e.g.
+    # REPLICA_DATABASE_URLS=sqlite:////tmp/replica.sqlite3 python manage.py test main.tests.ReplicaDatabaseTest
+    databases = {'default', *settings.DATABASE_REPLICAS}
+
+    def setUp(self):
+        owner = User.objects.create_user('owner', password='secret')
+        event = Event.objects.create(owner=owner, title='Call', duration=timedelta(hours=1))
+        self.invite = Invitation.objects.create(event=event, max_number_of_uses=5)
+        self.url = reverse('guest_calendar', kwargs=dict(uuid=self.invite.uuid, year='2023', month='08'))
+
+    def test_guest_pages_read_from_the_replica_until_pinned(self):
+        # the invitation only exists on the primary
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        response = self.client.post(
+            reverse('schedule_as_guest_form', kwargs=dict(uuid=self.invite.uuid, year='2023', month='08', day='07', time='10:00')),
+            {'notes': ''},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(routers.PIN_COOKIE, response.cookies)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+
+@override_settings(TIME_ZONE='UTC')
+class WeekViewTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('owner', password='secret')
+        self.event = Event.objects.create(owner=self.owner, title='Call', duration=timedelta(hours=1))
+        self.invite = Invitation.objects.create(event=self.event, max_number_of_uses=5)
+        for week_day in ('Mo', 'We'):
+            AvailabilityWindow.objects.create(owner=self.owner, week_day=week_day, start_time=time(9), end_time=time(12), timezone='UTC')
+        Schedule.objects.create(event=self.event, start_time=at(10))
+        Schedule.objects.create(event=self.event, start_time=at(11, day=8), frequency='daily', count=3)
+        # over midnight
+        Schedule.objects.create(event=self.event, start_time=at(23, 30, day=9))
+        self.day = dict(year='2023', month='08', day='07')
+
+    def test_owner_week_matches_the_day_pages(self):
+        self.client.force_login(self.owner)
+        days = self.client.get(reverse('week', kwargs=dict(username='owner', **self.day))).context['days']
+        self.assertEqual([d['date'] for d in days], [date(2023, 8, 7) + timedelta(days=i) for i in range(7)])
+        for d in days:
+            kwargs = dict(username='owner', year='2023', month='08', day=d['date'].strftime('%d'))
+            context = self.client.get(reverse('schedule', kwargs=kwargs)).context
+            self.assertEqual(d['slots'], context['slots'])
+            self.assertEqual(d['occurrences'], context['occurrences'])
+        self.assertEqual([len(d['occurrences']) for d in days], [1, 1, 2, 2, 0, 0, 0])
+
+    def test_guest_week_shows_available_slots(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('week_as_guest', kwargs=dict(uuid=self.invite.uuid, **self.day)), {'days': 3})
+        days = response.context['days']
+        self.assertEqual([len(d['slots']) for d in days], [6, 0, 6])
+        # the Monday booking and the daily one on Wednesday
+        self.assertContains(response, 'unavailable', count=4)
+        self.assertEqual(response.context['next'], date(2023, 8, 10))
+
+    def test_number_of_days_is_bounded(self):
+        self.client.force_login(self.owner)
+        url = reverse('week', kwargs=dict(username='owner', **self.day))
+        self.assertEqual(len(self.client.get(url, {'days': 100}).context['days']), 14)
+        self.assertEqual(len(self.client.get(url, {'days': 'x'}).context['days']), 7)
+
+
+@override_settings(TIME_ZONE='UTC')
+class NextAvailableTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('owner', password='secret')
+        self.event = Event.objects.create(owner=self.owner, title='Call', duration=timedelta(hours=1))
+        self.invite = Invitation.objects.create(event=self.event, max_number_of_uses=5)
+        for week_day, name in AvailabilityWindow.DAYS_OF_WEEK:
+            AvailabilityWindow.objects.create(owner=self.owner, week_day=week_day, start_time=time(9), end_time=time(12), timezone='UTC')
+        self.today = datetime.combine(timezone.now().date(), time(), pytz.utc)
+        self.url = reverse('next_available', kwargs=dict(uuid=self.invite.uuid))
+
+    def test_skips_booked_days(self):
+        # the first three days are booked from 9 to 12
+        Schedule.objects.create(event=Event.objects.create(owner=self.owner, title='Busy', duration=timedelta(hours=3)),
+                                start_time=self.today + timedelta(hours=9), frequency='daily', count=3)
+        with self.assertNumQueries(2):
+            data = self.client.get(self.url, {'count': 3}).json()
+        day = self.today + timedelta(days=3, hours=9)
+        self.assertEqual(data['slots'], [(day + timedelta(minutes=30 * i)).isoformat() for i in range(3)])
+
+    def test_agrees_with_the_free_slots_of_the_range(self):
+        for i in range(1, 20):
+            Schedule.objects.create(event=self.event, start_time=self.today + timedelta(days=i // 2, hours=9 + i % 3))
+        Schedule.objects.create(event=self.event, start_time=self.today + timedelta(days=2, hours=10, minutes=30), frequency='weekly')
+        now = timezone.now()
+        first = self.today + -((self.today - now) // availability.SLOT) * availability.SLOT
+        end = first + timedelta(days=14)
+        expected = availability.free_slots(
+            get_available_intervals(self.owner, first, end), get_busy_intervals(self.owner, first, end),
+            first, end, availability.SLOT, self.event.duration
+        )[:20]
+        data = self.client.get(self.url, {'count': 20, 'days': 14}).json()
+        self.assertEqual(data['slots'], [t.isoformat() for t in expected])
+
+    def test_bad_parameters(self):
+        self.assertEqual(self.client.get(self.url, {'count': 0}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'days': 'x'}).status_code, 400)
+
+    def test_bookings_are_read_only_as_far_as_needed(self):
+        bookings = [series(at(9, day=d), frequency='') for d in range(1, 8)]
+        read = []
+        occurrences = recurrence.expand_sorted((read.append(b) or b for b in bookings), at(0, day=1), at(0, day=30))
+        self.assertEqual([s for s, e, b in islice(occurrences, 2)], [at(9, day=1), at(9, day=2)])
+        self.assertEqual(len(read), 3)
+
+    def test_lazy_subtract(self):
+        available = [(at(9), at(12)), (at(13), at(17))]
+        busy = [(at(8), at(9, 30)), (at(10), at(11)), (at(10, 30), at(13, 30)), (at(14), at(14)), (at(16), at(16, 30))]
+        self.assertEqual(list(availability.iter_free(available, iter(busy))), availability.subtract(available, availability.merge(busy)))
+
+
+@override_settings(TIME_ZONE='UTC')
+class GroupInvitationTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('owner', password='secret')
+        self.members = [self.owner] + [User.objects.create_user(name) for name in ('alice', 'bob')]
+        # free together on Monday from 10 to 12
+        for member, start, end in zip(self.members, (9, 10, 8), (12, 13, 12)):
+            AvailabilityWindow.objects.create(owner=member, week_day='Mo', start_time=time(start), end_time=time(end), timezone='UTC')
+        self.events = [Event.objects.create(owner=member, title='Busy', duration=timedelta(minutes=30)) for member in self.members]
+        self.group = GroupInvitation.objects.create(owner=self.owner, title='Team', duration=timedelta(minutes=30))
+        self.group.members.add(*self.members)
+        self.url = reverse('group_free_slots', kwargs=dict(uuid=self.group.uuid)) + '?start=2023-08-07&end=2023-08-07'
+
+    def test_common_free_slots(self):
+        Schedule.objects.create(event=self.events[0], start_time=at(10))
+        Schedule.objects.create(event=self.events[2], start_time=at(11, 30), frequency='daily')
+        data = self.client.get(self.url).json()
+        self.assertEqual(data['slots'], ['2023-08-07T10:30:00+00:00', '2023-08-07T11:00:00+00:00'])
+        self.assertEqual(data['members'], 3)
+
+    def test_queries_do_not_grow_with_the_group(self):
+        with self.assertNumQueries(4):
+            self.client.get(self.url)
+        for i in range(10):
+            member = User.objects.create_user(f'member{i}')
+            AvailabilityWindow.objects.create(owner=member, week_day='Mo', start_time=time(0), end_time=time(23), timezone='UTC')
+            Schedule.objects.create(event=Event.objects.create(owner=member, title='Busy'), start_time=at(9))
+            self.group.members.add(member)
+        # a new member is a new cache key
+        with self.assertNumQueries(4):
+            data = self.client.get(self.url).json()
+        self.assertEqual(data['members'], 13)
+        with self.assertNumQueries(2):
+            self.client.get(self.url)
+
+    def test_a_members_booking_invalidates_the_cache(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Schedule.objects.create(event=self.events[1], start_time=at(10))
+        self.assertEqual(self.client.get(self.url).json()['slots'][0], '2023-08-07T10:30:00+00:00')
+
+    def test_common_is_the_intersection_of_all(self):
+        lists = [
+            [(at(8), at(10)), (at(11), at(15)), (at(16), at(18))],
+            [(at(9), at(12)), (at(12, 30), at(17))],
+            [(at(7), at(9, 30)), (at(11, 30), at(16, 30))],
+        ]
+        expected = lists[0]
+        for intervals in lists[1:]:
+            expected = availability.intersect(expected, intervals)
+        self.assertEqual(list(availability.common(*map(iter, lists))), expected)
+        # touching intervals don't overlap
+        self.assertEqual(list(availability.common([(at(8), at(9))], [(at(9), at(10))])), [])
+        self.assertEqual(list(availability.common()), [])
+
+    def test_expired_and_unknown_links(self):
+        self.group.expiration_time = timezone.now() - timedelta(days=1)
+        self.group.save()
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.assertEqual(self.client.get(reverse('group_free_slots', kwargs=dict(uuid=uuid.uuid4()))).status_code, 404)
+
+    def test_members_join_themselves(self):
+        self.client.force_login(self.owner)
+        url = reverse('group_invitation_create', kwargs=dict(username='owner'))
+        # nobody can be added by someone else
+        self.assertNotIn('members', self.client.get(url).context['form'].fields)
+        response = self.client.post(url, {'title': 'Planning', 'duration': '01:00:00', 'expiration_time': '2099-01-01 00:00'})
+        self.assertEqual(response.status_code, 302)
+        group = GroupInvitation.objects.get(title='Planning')
+        self.assertEqual(list(group.members.all()), [self.owner])
+        join = reverse('group_join', kwargs=dict(uuid=group.uuid))
+        self.client.force_login(self.members[1])
+        self.client.post(join, {'join': 'Join'})
+        self.assertEqual(set(group.members.all()), {self.owner, self.members[1]})
+        self.client.post(join, {'leave': 'Leave'})
+        self.assertEqual(list(group.members.all()), [self.owner])
+        # the owner stays
+        self.client.force_login(self.owner)
+        self.client.post(join, {'leave': 'Leave'})
+        self.assertEqual(list(group.members.all()), [self.owner])
+
+    def test_joining_needs_a_login(self):
+        response = self.client.post(reverse('group_join', kwargs=dict(uuid=self.group.uuid)), {'join': 'Join'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.group.members.count(), 3)
+
+
+class BulkBookingTest(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', password='secret')
+        self.event = Event.objects.create(owner=self.owner, title='Call', duration=timedelta(hours=1))
+        Schedule.objects.create(event=self.event, start_time=at(10))
+        self.url = reverse('bulk_booking', kwargs=dict(username='owner'))
+        self.client.force_login(self.owner)
+
+    def post(self, starts, **body):
+        items = [{'event': self.event.slug, 'start_time': start.isoformat()} for start in starts]
+        return self.client.post(self.url, json.dumps(dict(body, bookings=items)), content_type='application/json')
+
+    def test_one_conflict_rejects_all(self):
+        response = self.post([at(12), at(10, 30), at(13)])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json(), {'created': [], 'rejected': [{'index': 1, 'error': OVERLAP_ERROR}]})
+        self.assertEqual(Schedule.objects.count(), 1)
+
+    def test_partial(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            before = metric('schedule_bookings_total{source="bulk"}')
+            response = self.post([at(12), at(10, 30), at(13), at(12, 30)], partial=True)
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        self.assertEqual([b['index'] for b in data['created']], [0, 2])
+        self.assertEqual([b['index'] for b in data['rejected']], [1, 3])
+        self.assertEqual(metric('schedule_bookings_total{source="bulk"}'), before + 2)
+        saved = Schedule.objects.get(uuid=data['created'][1]['uuid'])
+        self.assertEqual((saved.owner, saved.end_time, saved.series_end), (self.owner, at(14), at(14)))
+
+    def test_queries_do_not_grow_with_the_batch(self):
+        with CaptureQueriesContext(connection) as few:
+            self.assertEqual(self.post([at(11), at(12)]).status_code, 201)
+        with CaptureQueriesContext(connection) as many:
+            self.assertEqual(self.post([at(h, day=8) for h in range(20)]).status_code, 201)
+        self.assertEqual(len(many), len(few))
+        self.assertEqual(Schedule.objects.count(), 23)
+
+    def test_bad_items(self):
+        self.assertEqual(self.client.post(self.url, 'nope', content_type='application/json').status_code, 400)
+        self.assertEqual(self.post([]).status_code, 400)
+        items = [{'event': 'nope', 'start_time': '2023-08-07T12:00'}, {'event': self.event.slug, 'start_time': 'noon'}, 1]
+        response = self.client.post(self.url, json.dumps({'bookings': items, 'partial': True}), content_type='application/json')
+        self.assertEqual([b['index'] for b in response.json()['rejected']], [0, 1, 2])
+
+    def test_malformed_items_are_a_bad_request(self):
+        items = [{'event': self.event.slug, 'start_time': 'noon'}, {'event': self.event.slug, 'start_time': at(12).isoformat()}]
+        response = self.client.post(self.url, json.dumps({'bookings': items}), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Schedule.objects.count(), 1)
+
+    def test_token(self):
+        self.client.logout()
+        client = Client(enforce_csrf_checks=True)
+        body = json.dumps({'bookings': [{'event': self.event.slug, 'start_time': at(12).isoformat()}]})
+        response = client.post(self.url, body, content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {api_token("owner")}')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Schedule.objects.filter(owner=self.owner).count(), 2)
+        response = client.post(self.url, body, content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {api_token("other")}')
+        self.assertEqual(response.status_code, 401)
+
+    def test_a_session_still_needs_the_csrf_token(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.owner)
+        body = json.dumps({'bookings': [{'event': self.event.slug, 'start_time': at(12).isoformat()}]})
+        self.assertEqual(client.post(self.url, body, content_type='application/json').status_code, 403)
+        # any page with a form sets the cookie
+        client.get(reverse('set_availability', kwargs=dict(username='owner')))
+        response = client.post(self.url, body, content_type='application/json', HTTP_X_CSRFTOKEN=client.cookies['csrftoken'].value)
+        self.assertEqual(response.status_code, 201)
+
+    def test_times_without_offset_are_in_the_users_timezone(self):
+        session = self.client.session
+        session['django_timezone'] = 'Europe/Berlin'
+        session.save()
+        items = [{'event': self.event.slug, 'start_time': start} for start in ['2023-03-25T12:00', '2023-03-27T12:00', '2023-08-07T09:00+00:00']]
+        response = self.client.post(self.url, json.dumps({'bookings': items}), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            [parse_datetime(b['start_time']) for b in response.json()['created']],
+            [datetime(2023, 3, 25, 11, tzinfo=pytz.utc), datetime(2023, 3, 27, 10, tzinfo=pytz.utc), at(9)],
+        )
+
+    def test_only_the_owner(self):
+        User.objects.create_user('other', password='secret')
+        self.client.login(username='other', password='secret')
+        self.assertEqual(self.post([at(12)]).status_code, 403)
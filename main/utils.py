@@ -1,18 +1,100 @@
-import pytz
+from datetime import timezone as dt_timezone
 from django.shortcuts import get_object_or_404
+from django.core import signing
 from django.core.exceptions import PermissionDenied
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
 
 
 def make_utc(dt):
-    from django.utils import timezone
     if timezone.is_naive(dt):
         dt = timezone.make_aware(dt)
-    return dt.astimezone(pytz.utc)
+    return dt.astimezone(dt_timezone.utc)
 
 
-def get_invite_or_403(uuid):
+def get_invite_or_403(uuid, request=None):
+    # the invitation, its event and the owner are fetched once per request and kept on the request
     from .models import Invitation
-    invite = get_object_or_404(Invitation, uuid=uuid)
-    if not invite.is_active:
+    cache = request.__dict__.setdefault('_invitations', {}) if request is not None else {}
+    invite = cache.get(str(uuid))
+    if invite is None:
+        # only active invitations are looked up, which on PostgreSQL is a partial index
+        # (see migration 0011); telling an expired link from a wrong one costs a second query
+        try:
+            invite = Invitation.objects.active().select_related('event__owner__availability_index').get(uuid=uuid)
+        except Invitation.DoesNotExist:
+            get_object_or_404(Invitation.objects.only('id'), uuid=uuid)
+            raise PermissionDenied("Sorry, the invitation is expired!")
+        cache[str(uuid)] = invite
+    # used up earlier in the request
+    elif not invite.is_active:
         raise PermissionDenied("Sorry, the invitation is expired!")
     return invite
+
+
+def get_group_invite_or_403(uuid):
+    from .models import GroupInvitation
+    group = get_object_or_404(GroupInvitation.objects.select_related('owner'), uuid=uuid)
+    if not group.is_active:
+        raise PermissionDenied("Sorry, the invitation is expired!")
+    return group
+
+
+# guests open pages under this prefix (see schedule/urls.py). their timezone is kept
+# in a signed cookie instead of the session, so an invitation link never creates a session row
+GUEST_PATH_PREFIX = '/invite/'
+GUEST_TIMEZONE_COOKIE = 'guest_timezone'
+GUEST_TIMEZONE_MAX_AGE = 60 * 60 * 24 * 365
+
+
+def get_guest_timezone(request):
+    # ?tz= wins over the cookie, so a link can carry the timezone
+    return request.GET.get('tz') or request.get_signed_cookie(GUEST_TIMEZONE_COOKIE, default=None, salt='main.timezone')
+
+
+def set_guest_timezone(response, tzname):
+    response.set_signed_cookie(
+        GUEST_TIMEZONE_COOKIE, tzname, salt='main.timezone', max_age=GUEST_TIMEZONE_MAX_AGE,
+        path=GUEST_PATH_PREFIX, httponly=True, samesite='Lax',
+    )
+    return response
+
+
+def feed_token(username):
+    # calendar clients can't log in, so feed urls carry a signature of the username
+    return signing.Signer(salt='main.feed').signature(username)
+
+
+def check_feed_token(username, token):
+    return constant_time_compare(feed_token(username), token or '')
+
+
+def api_token(username):
+    # integrations don't keep a session, the bulk booking api takes "Authorization: Bearer <token>"
+    return signing.Signer(salt='main.api').signature(username)
+
+
+def check_api_token(username, token):
+    return constant_time_compare(api_token(username), token or '')
+
+
+def busy_intervals(bookings, start, end):
+    # merged (start, end) of a Schedule queryset overlapping [start, end), recurring ones expanded
+    from .availability import merge
+    from .recurrence import FIELDS
+    bookings = bookings.overlapping(start, end).only(*FIELDS)
+    return merge(span for b in bookings for span in b.occurrences(start, end))
+
+
+def get_busy_intervals(owner, start, end):
+    # merged (start, end) of the owner's bookings overlapping [start, end), recurring ones expanded
+    from .models import Schedule
+    return busy_intervals(Schedule.objects.filter(owner=owner), start, end)
+
+
+def get_available_intervals(owner, start, end):
+    # the owner's availability as concrete intervals in [start, end), no query
+    # when the owner was loaded with select_related('availability_index')
+    from .models import AvailabilityIndex
+    index = AvailabilityIndex.for_owner(owner)
+    return index.intervals(start, end) if index else []
@@ -1,24 +1,42 @@
 from typing import Any, Dict, Optional
 from django.db import models
 from django.db.models.query import QuerySet
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, render, redirect
-from django.core.exceptions import ValidationError
-from django.views.generic.edit import CreateView, UpdateView, DeleteView
+from django.template.loader import render_to_string
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.views.generic.edit import CreateView, UpdateView, DeleteView, FormView
 from django.views.generic.base import TemplateView, RedirectView, View
 from django.views.generic.list import ListView
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import method_decorator
+from django.utils.crypto import constant_time_compare
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date
+from django.utils.safestring import mark_safe
 from django.utils import timezone
-from django.db.models import F
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
 from datetime import date
 from datetime import datetime, timedelta, time
+import bisect
 import calendar
-import pytz
-from .models import Schedule, Event, Invitation, AvailabilityWindow
-from main.utils import get_invite_or_403
-from itertools import chain
+import hashlib
+import heapq
+import io
+import json
+from .models import Schedule, Event, Invitation, GroupInvitation, AvailabilityWindow
+from .forms import ImportBookingsForm
+from main.utils import get_invite_or_403, get_group_invite_or_403, feed_token, check_feed_token, api_token, check_api_token, get_busy_intervals, get_available_intervals, set_guest_timezone
+from main.cache import get_owner_version, get_owner_versions
+from main import availability, booking, ics, importers, metrics, pagination, recurrence, zones
+from schedule import routers
+from itertools import chain, islice
 
 
 class TestOwnershipMixin(UserPassesTestMixin):
@@ -33,6 +51,12 @@ class TestOwnershipMixin(UserPassesTestMixin):
             return True
         return False
 
+    def get_owner(self):
+        # the ownership test already made sure that a username in the url is the logged in user
+        if self.kwargs.get('uuid'):
+            return get_invite_or_403(self.kwargs['uuid'], self.request).event.owner
+        return self.request.user
+
 
 class Home(RedirectView):
     permanent = False
@@ -54,16 +78,38 @@ class SignUp(CreateView):
     template_name = 'registration/signup.html'
 
 
-class EventView(LoginRequiredMixin, ListView):
+class KeysetPaginationMixin:
+    """ListView pages by cursor instead of page number, see main/pagination.py."""
+    paginate_by = pagination.PAGE_SIZE
+    # ascending, ending with a unique field
+    ordering = ['id']
+
+    def paginate_queryset(self, queryset, page_size):
+        page = pagination.paginate_request(self.request, queryset, self.ordering, page_size)
+        return None, page, page.object_list, page.has_other_pages()
+
+
+class EventView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     template_name = 'events.html'
     context_object_name = 'event_list'
 
     def get_queryset(self):
         return Event.objects.filter(owner=self.request.user)
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['feed_token'] = feed_token(self.request.user.username)
+        context['api_token'] = api_token(self.request.user.username)
+        context['feed_url'] = self.request.build_absolute_uri(
+            reverse('calendar_feed', kwargs=dict(username=self.request.user.username))
+        )
+        return context
+
 
 class CalendarRedirectView(TestOwnershipMixin, RedirectView):
     is_permanent = False
+    # see schedule/routers.py
+    replica_reads = True
 
     def get_redirect_url(self, *args, **kwargs):
         now = timezone.now()
@@ -74,7 +120,7 @@ class CalendarRedirectView(TestOwnershipMixin, RedirectView):
                                 kwargs=dict(username=kwargs['username'], event_slug=kwargs['event_slug'], year=year,
                                             month=month))
         if kwargs.get('uuid'):
-            invite = get_invite_or_403(kwargs['uuid'])
+            invite = get_invite_or_403(kwargs['uuid'], self.request)
             return reverse_lazy('guest_calendar',
                                 kwargs=dict(uuid=kwargs['uuid'], year=year, month=month))
         return reverse_lazy('calendar', kwargs=dict(username=kwargs['username'], year=year, month=month))
@@ -82,49 +128,107 @@ class CalendarRedirectView(TestOwnershipMixin, RedirectView):
 
 class CalendarView(TestOwnershipMixin, TemplateView):
     template_name = "calendar.html"
+    replica_reads = True
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        owner = self.get_owner()
         if kwargs.get('username'):
-            user = get_object_or_404(User, username=kwargs['username'])
-            context['user'] = user
+            context['user'] = owner
             context['event_slug'] = kwargs.get('event_slug')
         if kwargs.get('uuid'):
-            context['invite'] = get_invite_or_403(kwargs['uuid'])
+            context['invite'] = get_invite_or_403(kwargs['uuid'], self.request)
         month = int(kwargs['month'])
         year = int(kwargs['year'])
-        context['calendar'] = calendar.Calendar(firstweekday=6).itermonthdays2(year, month)
-        context['month_name'] = calendar.month_name[month]
-        context['prev_month'] = f'{month-1:02d}' if month > 1 else '12'
-        context['prev_year'] = f'{year:04d}' if month > 1 else f'{year-1:04d}'
-        context['next_month'] = f'{month+1:02d}' if month < 12 else '01'
-        context['next_year'] = f'{year:04d}' if month < 12 else f'{year+1:04d}'
+        statuses = self.get_day_statuses(owner, year, month, guest='invite' in context)
+        context.update(self.month_context(year, month, statuses))
         return context
 
+    @staticmethod
+    def month_context(year, month, statuses):
+        return {
+            'calendar': [
+                (day, week_day, statuses.get(day))
+                for day, week_day in calendar.Calendar(firstweekday=6).itermonthdays2(year, month)
+            ],
+            'month_name': calendar.month_name[month],
+            'prev_month': f'{month-1:02d}' if month > 1 else '12',
+            'prev_year': f'{year:04d}' if month > 1 else f'{year-1:04d}',
+            'next_month': f'{month+1:02d}' if month < 12 else '01',
+            'next_year': f'{year:04d}' if month < 12 else f'{year+1:04d}',
+        }
+
+    @staticmethod
+    def month_range(year, month):
+        return (
+            timezone.make_aware(datetime(year, month, 1)),
+            timezone.make_aware(datetime(year + month // 12, month % 12 + 1, 1)),
+        )
+
+    def get_day_statuses(self, owner, year, month, guest):
+        # free / partial / full for every day of the month, keyed by day number
+        month_begins, month_ends = self.month_range(year, month)
+        if guest:
+            available = get_available_intervals(owner, month_begins, month_ends)
+        else:
+            available = [(month_begins, month_ends)]
+        return self.day_statuses(
+            year, month, timezone.get_current_timezone(),
+            get_busy_intervals(owner, month_begins, month_ends),
+            available,
+        )
+
+    @staticmethod
+    def day_statuses(year, month, tz, busy, available):
+        """
+        ``busy`` and ``available`` are merged intervals of the month. Only the
+        booked time inside the availability counts against a day, split at
+        local midnight, so bookings crossing it and series started before the
+        month land on the days they cover.
+        """
+        booked = availability.per_day(availability.intersect(busy, available), tz)
+        available = availability.per_day(available, tz)
+        statuses = {}
+        for day in calendar.Calendar().itermonthdates(year, month):
+            if day.month == month:
+                statuses[day.day] = availability.day_status(
+                    available.get(day, timedelta()),
+                    booked.get(day, timedelta())
+                )
+        return statuses
+
 
 class ScheduleView(TestOwnershipMixin, ListView):
     template_name = 'schedule.html'
     context_object_name = 'schedule_list'
+    replica_reads = True
+    # the rendered day grid is cached until the owner's data changes
+    grid_template_name = 'day_grid.html'
+    grid_timeout = 60 * 60 * 24
+
+    def get(self, request, *args, **kwargs):
+        self.grid_key = self.get_grid_key(self.get_owner().pk, self.kwargs)
+        self.day_grid = cache.get(self.grid_key)
+        return super().get(request, *args, **kwargs)
+
+    @staticmethod
+    def get_grid_key(owner_id, kwargs):
+        if kwargs.get('uuid'):
+            viewer = f"guest:{kwargs['uuid']}"
+        else:
+            viewer = f"owner:{kwargs.get('event_slug') or ''}"
+        day = f"{kwargs['year']}-{kwargs['month']}-{kwargs['day']}"
+        return f'day-grid:{owner_id}:{get_owner_version(owner_id)}:{day}:{viewer}:{timezone.get_current_timezone_name()}'
 
     def get_queryset(self):
+        if self.day_grid is not None:
+            return Schedule.objects.none()
         day = date(int(self.kwargs['year']), int(self.kwargs['month']), int(self.kwargs['day']))
         # here timezone is current, from the session. transfer it to utc
-        end_time = timezone.make_aware(datetime.combine(day, datetime.min.time())).astimezone(pytz.utc)
-        start_time = timezone.make_aware(datetime.combine(day, datetime.max.time())).astimezone(pytz.utc)
-        q = []
-        if self.kwargs.get('uuid'):
-            invite = get_invite_or_403(self.kwargs['uuid'])
-            q = Schedule.objects.filter(
-                event__owner=invite.event.owner,
-                start_time__gte=end_time - F('event__duration'),
-                start_time__lte=start_time
-            ).order_by('start_time')
-        elif self.kwargs.get('username'):
-            q = Schedule.objects.filter(
-                event__owner=get_object_or_404(User, username=self.kwargs['username']),
-                start_time__gte=end_time - F('event__duration'),
-                start_time__lte=start_time
-            ).order_by('start_time')
+        day_begins, day_ends = zones.day_range(day)
+        q = Schedule.objects.filter(owner=self.get_owner()).overlapping(
+            day_begins, day_ends
+        ).select_related('event').order_by('start_time')
         return q
 
     def get_context_data(self, *, object_list=None, **kwargs):
@@ -133,74 +237,155 @@ class ScheduleView(TestOwnershipMixin, ListView):
         # this day is supposed to be in the current timezone, as user/guest chooses it
         context['date'] = day
         # current timezone to utc
-        day_begins = timezone.make_aware(datetime.combine(day, time.min)).astimezone(pytz.utc)
-        day_ends = timezone.make_aware(datetime.combine(day, time.max)).astimezone(pytz.utc)
+        day_begins, day_ends = zones.day_range(day)
         if self.kwargs.get("username"):
             context['username'] = self.kwargs['username']
             context['event_slug'] = self.kwargs.get('event_slug')
         elif self.kwargs.get('uuid'):
-            context['invite'] = get_object_or_404(Invitation, uuid=self.kwargs['uuid'])
-        time_delta = timedelta(seconds=1800) # 30 min
+            context['invite'] = get_invite_or_403(self.kwargs['uuid'], self.request)
+        if self.day_grid is not None:
+            context['day_grid'] = mark_safe(self.day_grid)
+            return context
+        self.render_day_grid(self.request, context, context['schedule_list'], day_begins, day_ends)
+        # a lagging replica's rows would be cached under the newest version
+        if not routers.on_replica():
+            cache.set(self.grid_key, context['day_grid'], self.grid_timeout)
+        return context
+
+    @classmethod
+    def render_day_grid(cls, request, context, bookings, day_begins, day_ends):
+        # fills in the slots of the day and renders them, guests only see the owner's available slots
+        time_delta = availability.SLOT
         context['time_delta'] = time_delta
         if 'invite' in context:
-            # users' availability windows will be stored in utc, so it would be 2 days of week
-            # for now let's assume that a window is always fit in one day: start and end time are withing one day TODO: to deal with this restriction 
-            # when a user in other tz than utc, a window in utc might fall into 2 consecutive days 
-            day1 = calendar.day_name[day_begins.weekday()][:2]
-            day2 = calendar.day_name[day_ends.weekday()][:2]
-            avail_windows1 = AvailabilityWindow.objects.filter(owner=context['invite'].event.owner, week_day=day1).order_by('end_time')
-            avail_windows2 = AvailabilityWindow.objects.filter(owner=context['invite'].event.owner, week_day=day2).order_by('end_time') if day1 != day2 else AvailabilityWindow.objects.none()
-            time_list = []
-            for w in avail_windows1: # works only if the windows dont overlap
-                start_time = timezone.make_aware(datetime.combine(day_begins.date(), w.start_time)).astimezone(pytz.utc)
-                end_time = timezone.make_aware(datetime.combine(day_begins.date(), w.end_time)).astimezone(pytz.utc)
-                for i in range(48):
-                    t = day_begins + i * time_delta
-                    if start_time <= t < end_time:
-                        time_list.append(t) 
-            for w in avail_windows2:
-                start_time = timezone.make_aware(datetime.combine(day_ends.date(), w.start_time)).astimezone(pytz.utc)
-                end_time = timezone.make_aware(datetime.combine(day_ends.date(), w.end_time)).astimezone(pytz.utc)
-                for i in range(48):
-                    t = day_begins + i * time_delta
-                    if start_time <= t < end_time:
-                        time_list.append(t) 
-            context['time_list'] = time_list
+            available = get_available_intervals(context['invite'].event.owner, day_begins, day_ends)
+            time_list = availability.slots_within(available, day_begins, day_ends, time_delta)
         else:
-            context['time_list'] = [day_begins + i * time_delta for i in range(48)]
-        
-        q = context['schedule_list']
-        context['schedule_dict'] = {}
-        for event in q:
-            # max between event's start time and day's start time without minutes
-            event_start_time = event.start_time.astimezone(pytz.utc)
-            event_start_hour = timezone.make_aware(
-                    datetime(
-                        year=event_start_time.year,
-                        month=event_start_time.month,
-                        day=event_start_time.day,
-                        hour=event_start_time.hour
-                    ),
-                    timezone=pytz.utc
-                )
-            begin = max(event_start_hour, day_begins)
-            delta = timedelta(
-                minutes=event.start_time.minute,
-                seconds=event.start_time.second,
-                microseconds=event.start_time.microsecond
-            )
-            if delta >= timedelta(minutes=30):
-                begin = begin + timedelta(minutes=30)
-            current = begin
-            while min(event.end_time, day_ends) > current:
-                context['schedule_dict'][current] = event.event.title
-                current = current + timedelta(minutes=30)
+            time_list = availability.grid(day_begins, day_ends, time_delta)
+        # recurring bookings are expanded for this day only
+        occurrences = list(recurrence.expand(bookings, day_begins, day_ends))
+        bookings = ((start, end, event.event.title) for start, end, event in occurrences)
+        context['schedule_dict'] = availability.occupied_slots(bookings, day_begins, day_ends, time_delta)
+        # everything the grid shows is converted to local time in one pass. lookups stay
+        # in utc, local datetimes in the hour repeated after daylight saving time compare equal
+        local = iter(zones.to_local(chain(time_list, (t for start, end, event in occurrences for t in (start, end)))))
+        context['time_list'] = time_list
+        context['slots'] = list(zip(time_list, islice(local, len(time_list))))
+        context['occurrences'] = [(next(local), next(local), event) for start, end, event in occurrences]
+        context['day_grid'] = render_to_string(cls.grid_template_name, context, request)
+        return context['day_grid']
+
+
+class WeekView(TestOwnershipMixin, TemplateView):
+    """
+    ``?days=`` days (a week by default) from the date in the url, for owners and
+    guests. Bookings of all of them are read in one query and the slots of all
+    days are laid out and converted to local time in one pass.
+    """
+    template_name = 'week.html'
+    replica_reads = True
+    default_days = 7
+    max_days = 14
+
+    def get_days(self):
+        try:
+            days = int(self.request.GET.get('days', self.default_days))
+        except ValueError:
+            days = self.default_days
+        return min(max(days, 1), self.max_days)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        first = date(int(self.kwargs['year']), int(self.kwargs['month']), int(self.kwargs['day']))
+        dates = [first + timedelta(days=i) for i in range(self.get_days())]
+        # utc start of every day and the end of the last one
+        bounds = [zones.day_range(d)[0] for d in dates] + [zones.day_range(dates[-1])[1]]
+        begins, ends = bounds[0], bounds[-1]
+        owner = self.get_owner()
+        if self.kwargs.get('uuid'):
+            context['invite'] = get_invite_or_403(self.kwargs['uuid'], self.request)
+            time_list = availability.slots_within(get_available_intervals(owner, begins, ends), begins, ends)
+        else:
+            context['username'] = self.kwargs['username']
+            time_list = availability.grid(begins, ends)
+        bookings = Schedule.objects.filter(owner=owner).overlapping(begins, ends).select_related('event').order_by('start_time')
+        occurrences = list(recurrence.expand(bookings, begins, ends))
+        context['schedule_dict'] = availability.occupied_slots(
+            ((start, end, b.event.title) for start, end, b in occurrences), begins, ends
+        )
+        local = iter(zones.to_local(chain(time_list, (t for start, end, b in occurrences for t in (start, end)))))
+        context['days'] = days = [{'date': d, 'slots': [], 'occurrences': []} for d in dates]
+        # the grid is continuous, each day's slots start at its utc bound
+        i = 0
+        for slot, local_slot in zip(time_list, islice(local, len(time_list))):
+            while slot >= bounds[i + 1]:
+                i += 1
+            days[i]['slots'].append((slot, local_slot))
+        # an occurrence over midnight is listed on every day it touches
+        for start, end, b in occurrences:
+            occurrence = (next(local), next(local), b)
+            for i in range(max(bisect.bisect_right(bounds, start) - 1, 0), min(bisect.bisect_left(bounds, end), len(dates))):
+                days[i]['occurrences'].append(occurrence)
+        context['date'] = first
+        context['previous'] = first - timedelta(days=len(dates))
+        context['next'] = first + timedelta(days=len(dates))
+        context['days_count'] = len(dates)
         return context
 
 
+class CalendarFeed(View):
+    """
+    iCalendar feed of an owner's bookings, optionally of one event only.
+    Repeated polls are answered with 304 from the owner's version stamp alone.
+    """
+
+    def get(self, request, username, event_slug=None):
+        if request.user.is_authenticated and request.user.username == username:
+            owner = request.user
+        elif check_feed_token(username, request.GET.get('token')):
+            owner = None
+        else:
+            raise PermissionDenied
+        event = None
+        if event_slug:
+            # the event and its owner in one query, an unknown event is a 404, not an empty feed
+            event = get_object_or_404(Event.objects.select_related('owner'), owner__username=username, slug=event_slug)
+            owner = event.owner
+        elif owner is None:
+            owner = get_object_or_404(User, username=username)
+        version = get_owner_version(owner.pk)
+        etag = f'"{owner.pk}-{event_slug or ""}-{version}"'
+        last_modified = int(version)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            bookings = Schedule.objects.filter(owner=owner).select_related('event').order_by('start_time')
+            if event:
+                bookings = bookings.filter(event=event)
+            name = f'{username} {event_slug}' if event_slug else username
+            # occurrences of series without an end are listed a year ahead
+            response = StreamingHttpResponse(
+                ics.calendar(bookings.iterator(), name, until=timezone.now() + recurrence.HORIZON),
+                content_type='text/calendar; charset=utf-8'
+            )
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
+
+class MetricsView(View):
+    """The metrics of every worker for Prometheus to scrape."""
+
+    def get(self, request):
+        if settings.METRICS_TOKEN and not constant_time_compare(
+            request.headers.get('Authorization', ''), f'Bearer {settings.METRICS_TOKEN}'
+        ):
+            raise PermissionDenied
+        return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 class ScheduleCreate(LoginRequiredMixin, TestOwnershipMixin, CreateView):
     model = Schedule
-    fields = ['event', 'start_time', 'notes']
+    fields = ['event', 'start_time', 'notes', 'frequency', 'interval', 'count', 'until']
     template_name = 'schedule_event.html'
 
     def get_initial(self):
@@ -220,7 +405,7 @@ class ScheduleCreate(LoginRequiredMixin, TestOwnershipMixin, CreateView):
             ))
         slug = self.kwargs.get('event_slug')
         if slug:
-            initial['event'] = get_object_or_404(Event, slug=slug)
+            initial['event'] = get_object_or_404(Event, owner=self.request.user, slug=slug)
         return initial
 
     def get_context_data(self, **kwargs):
@@ -228,6 +413,111 @@ class ScheduleCreate(LoginRequiredMixin, TestOwnershipMixin, CreateView):
         context['form'].fields['event'].queryset = Event.objects.filter(owner=self.request.user)
         return context
 
+    def form_valid(self, form):
+        # a series repeats at the same wall-clock time in the owner's timezone
+        form.instance.timezone = timezone.get_current_timezone_name()
+        try:
+            self.object = booking.book(form.instance)
+        except ValidationError as e:
+            form.add_error(None, e)
+            return self.form_invalid(form)
+        return HttpResponseRedirect(self.get_success_url())
+
+
+class ImportBookings(LoginRequiredMixin, TestOwnershipMixin, FormView):
+    form_class = ImportBookingsForm
+    template_name = 'import_bookings.html'
+
+    def form_valid(self, form):
+        # the upload is parsed line by line instead of being read into memory
+        lines = io.TextIOWrapper(form.cleaned_data['file'], encoding='utf-8', newline='')
+        try:
+            created, rejected = booking.import_bookings(
+                self.request.user,
+                importers.read(lines, form.cleaned_data['format'])
+            )
+        except UnicodeDecodeError:
+            form.add_error('file', 'The file must be UTF-8 encoded.')
+            return self.form_invalid(form)
+        return self.render_to_response(self.get_context_data(form=form, created=created, rejected=rejected))
+
+
+class BulkBookingView(LoginRequiredMixin, TestOwnershipMixin, View):
+    """
+    Books many single slots at once from a JSON body like
+    {"partial": false, "bookings": [{"event": "<slug>", "start_time": "<ISO 8601>", "notes": ""}, ...]}.
+    Times without an offset are in the current timezone. The bookings are
+    checked and inserted together (see booking.book_many): one bad item
+    rejects them all, unless "partial" is true. GET lists the event slugs.
+    Integrations send "Authorization: Bearer <token>" (see utils.api_token)
+    instead of a session and a CSRF token.
+    """
+    max_bookings = 1000
+
+    @method_decorator(csrf_exempt)
+    def dispatch(self, request, *args, **kwargs):
+        authorization = request.headers.get('Authorization', '')
+        if not authorization.startswith('Bearer '):
+            # a logged in browser, only the token skips the CSRF check
+            return csrf_protect(super().dispatch)(request, *args, **kwargs)
+        if not check_api_token(kwargs['username'], authorization[len('Bearer '):]):
+            return JsonResponse({'error': 'Invalid token.'}, status=401)
+        request.user = get_object_or_404(User, username=kwargs['username'])
+        return super().dispatch(request, *args, **kwargs)
+
+    def get(self, request, username):
+        events = Event.objects.filter(owner=request.user).order_by('slug').values_list('slug', flat=True)
+        return JsonResponse({'events': list(events), 'max_bookings': self.max_bookings})
+
+    def post(self, request, username):
+        try:
+            data = json.loads(request.body)
+            items = data['bookings']
+            partial = bool(data.get('partial', False))
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return JsonResponse({'error': 'The body must be a JSON object with a list of bookings.'}, status=400)
+        if not isinstance(items, list) or not 0 < len(items) <= self.max_bookings:
+            return JsonResponse({'error': f'Send 1 to {self.max_bookings} bookings.'}, status=400)
+        slugs = [item.get('event') for item in items if isinstance(item, dict)]
+        events = {e.slug: e for e in Event.objects.filter(owner=request.user, slug__in=[s for s in slugs if isinstance(s, str)])}
+        tz = timezone.get_current_timezone_name()
+        bookings, rejected = [], []
+        for i, item in enumerate(items):
+            if not isinstance(item, dict):
+                rejected.append((i, 'Each booking must be a JSON object.'))
+                continue
+            event = events.get(item.get('event')) if isinstance(item.get('event'), str) else None
+            try:
+                start = parse_datetime(item.get('start_time') or '')
+            except (TypeError, ValueError):
+                start = None
+            if event is None:
+                rejected.append((i, f'Unknown event "{item.get("event")}".'))
+            elif start is None:
+                rejected.append((i, 'start_time must look like YYYY-MM-DDTHH:MM[:SS][+HH:MM].'))
+            else:
+                b = Schedule(event=event, notes=str(item.get('notes', '')), timezone=tz, start_time=start)
+                b.index = i
+                bookings.append(b)
+        # times without an offset are in the user's timezone, converted in one pass
+        naive = [b for b in bookings if timezone.is_naive(b.start_time)]
+        for b, start in zip(naive, zones.to_utc(b.start_time for b in naive)):
+            b.start_time = start
+        created, conflicts = [], []
+        if partial or not rejected:
+            created, conflicts = booking.book_many(request.user, bookings, partial)
+            rejected.extend((b.index, reason) for b, reason in conflicts)
+        rejected.sort()
+        # nothing booked: 409 if slots were taken, 400 if the items were bad
+        status = 201 if created else 409 if conflicts else 400
+        return JsonResponse({
+            'created': [
+                {'index': b.index, 'uuid': b.uuid, 'start_time': b.start_time.isoformat()}
+                for b in sorted(created, key=lambda b: b.index)
+            ],
+            'rejected': [{'index': i, 'error': reason} for i, reason in rejected],
+        }, status=status)
+
 
 class EventCreate(LoginRequiredMixin, TestOwnershipMixin, CreateView):
     model = Event
@@ -277,6 +567,17 @@ class EventUpdate(LoginRequiredMixin, GetEventMixin, TestOwnershipMixin, UpdateV
         context['action'] = 'Update'
         return context
 
+    def form_valid(self, form):
+        if 'duration' not in form.changed_data:
+            return super().form_valid(form)
+        # the bookings of the event get longer or shorter with it
+        try:
+            self.object = booking.change_duration(form.instance)
+        except ValidationError as e:
+            form.add_error('duration', e)
+            return self.form_invalid(form)
+        return HttpResponseRedirect(self.get_success_url())
+
 
 class InvitationCreate(LoginRequiredMixin, TestOwnershipMixin, CreateView):
     model = Invitation
@@ -285,13 +586,15 @@ class InvitationCreate(LoginRequiredMixin, TestOwnershipMixin, CreateView):
 
     def get_event(self):
         slug = self.kwargs.get('event_slug')
-        event = get_object_or_404(Event, slug=slug)
+        event = get_object_or_404(Event, owner=self.request.user, slug=slug)
         return event
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         event = self.get_event()
-        context['list_of_links'] = Invitation.objects.filter(event__owner=self.request.user, event=event)
+        context['list_of_links'] = pagination.paginate_request(
+            self.request, Invitation.objects.filter(event=event).select_related('event'), ['id']
+        )
         context["event"] = event
         return context
 
@@ -300,13 +603,62 @@ class InvitationCreate(LoginRequiredMixin, TestOwnershipMixin, CreateView):
         return super().form_valid(form)
     
 
-class InvitationListView(LoginRequiredMixin, ListView):
+class GroupInvitationCreate(LoginRequiredMixin, TestOwnershipMixin, CreateView):
+    model = GroupInvitation
+    # members join through the link themselves (see GroupJoinView), nobody is added without consent
+    fields = ['title', 'duration', 'expiration_time']
+    template_name = 'group_invitation_create.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['list_of_links'] = pagination.paginate_request(
+            self.request, GroupInvitation.objects.filter(owner=self.request.user).prefetch_related('members'), ['id']
+        )
+        return context
+
+    def form_valid(self, form):
+        form.instance.owner = self.request.user
+        response = super().form_valid(form)
+        # the owner's own calendar always counts
+        self.object.members.add(self.request.user)
+        return response
+
+
+class GroupJoinView(LoginRequiredMixin, View):
+    """
+    Lets a logged in user share their free time with the holders of a group
+    invitation link by joining it, or stop sharing it by leaving.
+    """
+    template_name = 'group_join.html'
+
+    def get(self, request, uuid):
+        group = get_group_invite_or_403(uuid)
+        return render(request, self.template_name, {
+            'group': group,
+            'is_member': group.members.filter(pk=request.user.pk).exists(),
+        })
+
+    def post(self, request, uuid):
+        group = get_group_invite_or_403(uuid)
+        # the owner's calendar is what the group is about
+        if 'leave' in request.POST and request.user.pk != group.owner_id:
+            group.members.remove(request.user)
+        else:
+            group.members.add(request.user)
+        return redirect('group_join', uuid=uuid)
+
+
+class InvitationListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     model = Invitation
     context_object_name = 'invites_list'
     template_name = 'invitations_list.html'
+    ordering = ['expiration_time', 'id']
 
     def get_queryset(self) -> QuerySet[Any]:
-        return Invitation.objects.filter(event__owner=self.request.user, expiration_time__gte=timezone.now())
+        return Invitation.objects.filter(
+            owner=self.request.user,
+            expiration_time__gte=timezone.now()
+        ).select_related('event')
 
 
 class ScheduleAsGuest(CreateView):
@@ -315,9 +667,7 @@ class ScheduleAsGuest(CreateView):
     template_name = 'schedule_event.html'
 
     def get_invitation(self):
-        uuid = self.kwargs.get("uuid")
-        invite = get_invite_or_403(uuid)
-        return invite
+        return get_invite_or_403(self.kwargs.get("uuid"), self.request)
 
     def get_start_time(self):
         # in user's time zone
@@ -344,10 +694,12 @@ class ScheduleAsGuest(CreateView):
         return form
 
     def form_valid(self, form):
-        invite = self.get_invitation()
-        invite.get_used()
-        form.instance.invite_used = invite
-        return super().form_valid(form)
+        try:
+            self.object = booking.book_with_invitation(self.get_invitation(), form.instance)
+        except ValidationError as e:
+            form.add_error(None, e)
+            return self.form_invalid(form)
+        return HttpResponseRedirect(self.get_success_url())
 
     def get_success_url(self):
         return reverse_lazy("schedule_as_guest_success", kwargs=dict(uuid=self.object.uuid))
@@ -358,23 +710,171 @@ class ScheduleAsGuestSuccess(TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['scheduled_event'] = get_object_or_404(Schedule, uuid=kwargs.get('uuid'))
+        context['scheduled_event'] = get_object_or_404(Schedule.objects.select_related('event__owner'), uuid=kwargs.get('uuid'))
         return context
 
 
+class FreeSlotsView(View):
+    """
+    Free start times of an invitation's event as JSON, for embedded widgets.
+    ?start=YYYY-MM-DD&end=YYYY-MM-DD are days in the current timezone, the end is inclusive.
+    Answers are cached until the owner's data changes.
+    """
+    default_days = 7
+    max_days = 62
+    timeout = 60 * 60 * 24
+
+    def get_days(self, request):
+        # the first and the last day, ValueError saying what is wrong with them
+        try:
+            start_day = date.fromisoformat(request.GET['start']) if 'start' in request.GET else timezone.localdate()
+            end_day = date.fromisoformat(request.GET['end']) if 'end' in request.GET else start_day + timedelta(days=self.default_days - 1)
+        except ValueError:
+            raise ValueError('Dates must look like YYYY-MM-DD.')
+        if not 0 <= (end_day - start_day).days < self.max_days:
+            raise ValueError(f'The range must be 1 to {self.max_days} days long.')
+        return start_day, end_day
+
+    def get(self, request, uuid):
+        invite = get_invite_or_403(uuid, request)
+        try:
+            start_day, end_day = self.get_days(request)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        event = invite.event
+        tz = timezone.get_current_timezone_name()
+        key = f'free-slots:{event.owner_id}:{get_owner_version(event.owner_id)}:{event.duration}:{tz}:{start_day}:{end_day}'
+        data = cache.get(key)
+        if data is None:
+            start, end = zones.day_range(start_day)[0], zones.day_range(end_day)[1]
+            slots = availability.free_slots(
+                get_available_intervals(event.owner, start, end),
+                get_busy_intervals(event.owner, start, end),
+                start, end, availability.SLOT, event.duration
+            )
+            data = {
+                'event': event.title,
+                'duration': int(event.duration.total_seconds() // 60),
+                'timezone': tz,
+                'slots': [t.isoformat() for t in zones.to_local(slots)],
+            }
+            cache.set(key, data, self.timeout)
+        return JsonResponse(data)
+
+
+class GroupFreeSlotsView(FreeSlotsView):
+    """
+    Free start times of a group invitation as JSON: the grid slots where every
+    member is free, with the same ?start= and ?end= as FreeSlotsView. The
+    bookings of all the members are read at once, each member's free time is
+    streamed from their bookings and availability, and a k-way merge of those
+    streams keeps the time common to all of them.
+    """
+
+    def get(self, request, uuid):
+        group = get_group_invite_or_403(uuid)
+        try:
+            start_day, end_day = self.get_days(request)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        members = list(group.members.select_related('availability_index').order_by('id'))
+        versions = get_owner_versions([member.id for member in members])
+        tz = timezone.get_current_timezone_name()
+        # changes to the group or to any member's data make a new key, hashed to fit memcached
+        stamp = hashlib.md5(','.join(f'{m.id}:{versions[m.id]}' for m in members).encode()).hexdigest()
+        key = f'group-free-slots:{group.id}:{stamp}:{group.duration}:{tz}:{start_day}:{end_day}'
+        data = cache.get(key)
+        if data is None:
+            start, end = zones.day_range(start_day)[0], zones.day_range(end_day)[1]
+            bookings = Schedule.objects.filter(owner__in=members).overlapping(start, end).order_by('start_time')
+            # most bookings are single, they are read as plain tuples instead of models
+            spans, series = {member.id: [] for member in members}, {member.id: [] for member in members}
+            for owner_id, b_start, b_end in bookings.filter(frequency='').values_list('owner', 'start_time', 'end_time'):
+                spans[owner_id].append((b_start, b_end))
+            for b in bookings.exclude(frequency='').only('owner', *recurrence.FIELDS):
+                series[b.owner_id].append(b)
+            free = availability.common(*(
+                availability.iter_free(get_available_intervals(member, start, end), heapq.merge(
+                    spans[member.id], ((s, e) for s, e, b in recurrence.expand_sorted(series[member.id], start, end))
+                ))
+                for member in members
+            ))
+            slots = availability.iter_slots(free, start, availability.SLOT, group.duration)
+            data = {
+                'group': group.title,
+                # the link is anonymous, it doesn't tell who the members are
+                'members': len(members),
+                'duration': int(group.duration.total_seconds() // 60),
+                'timezone': tz,
+                'slots': [t.isoformat() for t in zones.to_local(slots)],
+            }
+            cache.set(key, data, self.timeout)
+        return JsonResponse(data)
+
+
+class NextAvailableView(View):
+    """
+    The first ?count= free start times of an invitation's event from now on,
+    within ?days= days, as JSON. The owner's bookings up to there are read
+    in start order and expanded only until enough slots are found.
+    """
+    default_count = 5
+    max_count = 50
+    default_days = 90
+    max_days = 366
+    timeout = 60 * 60 * 24
+
+    def get(self, request, uuid):
+        invite = get_invite_or_403(uuid, request)
+        try:
+            count = int(request.GET.get('count', self.default_count))
+            days = int(request.GET.get('days', self.default_days))
+        except ValueError:
+            return JsonResponse({'error': 'count and days must be numbers.'}, status=400)
+        if not (0 < count <= self.max_count and 0 < days <= self.max_days):
+            return JsonResponse({'error': f'count must be 1 to {self.max_count}, days 1 to {self.max_days}.'}, status=400)
+        event = invite.event
+        tz = timezone.get_current_timezone_name()
+        now = timezone.now()
+        # slots are on the grid of the day pages, which starts at local midnight
+        origin = zones.day_range(timezone.localdate(now))[0]
+        first = origin + -((origin - now) // availability.SLOT) * availability.SLOT
+        key = f'next-available:{event.owner_id}:{get_owner_version(event.owner_id)}:{event.duration}:{tz}:{first.isoformat()}:{count}:{days}'
+        data = cache.get(key)
+        if data is None:
+            end = first + timedelta(days=days)
+            bookings = Schedule.objects.filter(owner=event.owner).overlapping(first, end).only(
+                *recurrence.FIELDS
+            ).order_by('start_time')
+            busy = ((start, finish) for start, finish, b in recurrence.expand_sorted(bookings.iterator(), first, end))
+            free = availability.iter_free(get_available_intervals(event.owner, first, end), busy)
+            slots = list(islice(availability.iter_slots(free, origin, availability.SLOT, event.duration), count))
+            data = {
+                'event': event.title,
+                'duration': int(event.duration.total_seconds() // 60),
+                'timezone': tz,
+                'slots': [t.isoformat() for t in zones.to_local(slots)],
+            }
+            cache.set(key, data, self.timeout)
+        return JsonResponse(data)
+
+
 class SetTimezoneGuestView(View):
     def get(self, request, **kwargs):
-        context = {'timezones': pytz.common_timezones, 'uuid': kwargs.get('uuid')}
+        context = {'timezones': zones.names(), 'uuid': kwargs.get('uuid')}
         return render(request, 'set_timezone.html', context)
 
     def post(self, request, **kwargs):
-        request.session['django_timezone'] = request.POST['timezone']
-        invite = get_invite_or_403(kwargs['uuid'])
-        return redirect('guest_calendar_redirect', uuid=kwargs.get('uuid'))
+        invite = get_invite_or_403(kwargs['uuid'], request)
+        response = redirect('guest_calendar_redirect', uuid=kwargs.get('uuid'))
+        # guests don't get a session, see TimezoneMiddleware
+        if request.POST.get('timezone') in zones.names():
+            set_guest_timezone(response, request.POST['timezone'])
+        return response
 
 class SetTimezoneView(View):
     def get(self, request, **kwargs):
-        context = {'timezones': pytz.common_timezones}
+        context = {'timezones': zones.names()}
         return render(request, 'set_timezone.html', context)
 
     def post(self, request, **kwargs):
@@ -396,17 +896,22 @@ class SetAvailabilityWindow(LoginRequiredMixin, CreateView):
     fields = ['week_day', 'start_time', 'end_time']
     template_name = 'set_availability.html'
 
-    def form_valid(self, form):
-        tz = timezone.get_current_timezone() # windows are not in utc yet
+    def get_form(self, form_class=None):
+        form = super().get_form(form_class)
+        # the window is in the owner's current timezone, the index converts it to utc;
+        # set before validation, the model checks it against the other windows
+        form.instance.timezone = timezone.get_current_timezone_name()
         form.instance.owner = self.request.user
-        return super().form_valid(form)
+        return form
     
     def get_success_url(self) -> str:
         return reverse_lazy('set_availability', kwargs=dict(username=self.request.user.username))
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['list_of_windows'] = AvailabilityWindow.objects.filter(owner=self.request.user)
+        context['list_of_windows'] = pagination.paginate_request(
+            self.request, AvailabilityWindow.objects.filter(owner=self.request.user).select_related('owner'), ['id']
+        )
         return context
     
 
@@ -421,13 +926,12 @@ class GetObjectMixin:
     def get_queryset(self, *args, **kwargs):
         owner = self.request.user
         q = super().get_queryset(*args, **kwargs)
-        if q.exist():
-            fields = set(q.all().values()[0]) # 
-            if 'owner' in fields:
-                return q.filter(owner=owner)
-            elif 'event' in fields:
-                return q.filter(event__owner=owner)
-        return q
+        fields = {field.name for field in q.model._meta.get_fields()}
+        if 'owner' in fields:
+            return q.filter(owner=owner)
+        elif 'event' in fields:
+            return q.filter(event__owner=owner)
+        return q.none()
 
 
 class DeleteAvailabilityWindow(LoginRequiredMixin, GetObjectMixin, DeleteView):
@@ -439,11 +943,37 @@ class DeleteAvailabilityWindow(LoginRequiredMixin, GetObjectMixin, DeleteView):
     
     
 class ScheduleCancel(LoginRequiredMixin, GetObjectMixin, DeleteView):
+    """Deletes a booking, or with ?occurrence=<iso start> cancels one occurrence of a series."""
     model = Schedule
     template_name = 'confirm_delete.html'
 
-    def get_success_url(self) -> str:
-        scheduled = self.object.start_time
+    def get_occurrence(self):
+        try:
+            start = datetime.fromisoformat(self.request.GET['occurrence'])
+        except (KeyError, ValueError):
+            return None
+        if not self.object.frequency or timezone.is_naive(start):
+            return None
+        if not any(s == start for s, e in self.object.occurrences(start, start + timedelta(microseconds=1))):
+            return None
+        return start
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['occurrence'] = self.get_occurrence()
+        return context
+
+    def delete(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        occurrence = self.get_occurrence()
+        if occurrence is None:
+            return super().delete(request, *args, **kwargs)
+        self.object.exceptions.append(recurrence.exception_key(occurrence))
+        self.object.save(update_fields=['exceptions'])
+        return HttpResponseRedirect(self.get_success_url(occurrence))
+
+    def get_success_url(self, scheduled=None) -> str:
+        scheduled = timezone.localtime(scheduled or self.object.start_time)
         year = f'{scheduled.year:04d}'
         month = f'{scheduled.month:02d}'
         day = f'{scheduled.day:02d}'
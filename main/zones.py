@@ -0,0 +1,122 @@
+"""
+Timezones.
+
+Zones are stdlib zoneinfo objects looked up once per process. The bulk helpers
+convert a day's slots or a batch of bookings with the UTC offsets of that
+range, found once, instead of asking the zone about every value.
+"""
+import bisect
+import math
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from functools import lru_cache
+import zoneinfo
+from django.conf import settings
+from django.utils import timezone
+
+UTC = dt_timezone.utc
+
+
+@lru_cache(maxsize=1024)
+def get_zone(name):
+    """ZoneInfo for ``name``, raises zoneinfo.ZoneInfoNotFoundError (a KeyError) or ValueError."""
+    return zoneinfo.ZoneInfo(name)
+
+
+@lru_cache(maxsize=1)
+def names():
+    """Every known timezone name, sorted, for the timezone pickers."""
+    return sorted(zoneinfo.available_timezones())
+
+
+def current():
+    """The active timezone as a ZoneInfo."""
+    return get_zone(timezone.get_current_timezone_name())
+
+
+def default():
+    return get_zone(settings.TIME_ZONE)
+
+
+def day_range(day, tz=None):
+    """UTC start and end of a local date, 23 or 25 hours apart on daylight saving changes."""
+    tz = tz or current()
+    return (
+        datetime.combine(day, time.min, tz).astimezone(UTC),
+        datetime.combine(day + timedelta(days=1), time.min, tz).astimezone(UTC),
+    )
+
+
+def _transition(tz, lo, hi):
+    # the first whole second in (lo, hi] with the offset of hi, zones change on whole seconds
+    offset = hi.astimezone(tz).utcoffset()
+    lo, hi = math.floor(lo.timestamp()), math.ceil(hi.timestamp())
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if datetime.fromtimestamp(mid, tz).utcoffset() == offset:
+            hi = mid
+        else:
+            lo = mid
+    return datetime.fromtimestamp(hi, UTC)
+
+
+def offsets(start, end, tz):
+    """
+    The UTC offsets of ``tz`` in [start, end) as a list of (UTC instant, offset)
+    steps, each in force from its instant on. Usually one step per range, the
+    zone is asked once per day and the changes are found by bisection.
+    """
+    start, end = start.astimezone(UTC), end.astimezone(UTC)
+    steps = [(start, start.astimezone(tz).utcoffset())]
+    day = start
+    while day < end:
+        next_day = min(day + timedelta(days=1), end)
+        offset = next_day.astimezone(tz).utcoffset()
+        if offset != steps[-1][1]:
+            steps.append((_transition(tz, day, next_day), offset))
+        day = next_day
+    return steps
+
+
+def to_local(values, tz=None):
+    """
+    Aware datetimes in ``tz`` (the current timezone by default), converted with
+    the offsets of their range in one pass. Datetimes already in the zone are
+    free to show in templates.
+    """
+    tz = tz or current()
+    values = [v.astimezone(UTC) for v in values]
+    if not values:
+        return []
+    steps = offsets(min(values), max(values) + timedelta(seconds=1), tz)
+    instants = [instant for instant, offset in steps]
+    result = []
+    for v in values:
+        i = bisect.bisect_right(instants, v) - 1
+        offset = steps[i][1]
+        # the second time the clock shows the same hour after it's turned back
+        fold = int(i > 0 and offset < steps[i - 1][1] and v < instants[i] + (steps[i - 1][1] - offset))
+        result.append((v + offset).replace(tzinfo=tz, fold=fold))
+    return result
+
+
+def to_utc(values, tz=None):
+    """
+    Naive wall-clock datetimes in ``tz`` converted to aware UTC ones in one pass.
+    Ambiguous and skipped times are read like zoneinfo does with fold=0.
+    """
+    tz = tz or current()
+    values = list(values)
+    if not values:
+        return []
+    margin = timedelta(days=1)
+    steps = offsets((min(values) - margin).replace(tzinfo=UTC), (max(values) + margin).replace(tzinfo=UTC), tz)
+    # wall-clock time from which each step's offset applies
+    walls = [datetime.min] + [
+        (instant + max(offset, steps[i - 1][1])).replace(tzinfo=None)
+        for i, (instant, offset) in enumerate(steps) if i
+    ]
+    result = []
+    for v in values:
+        offset = steps[bisect.bisect_right(walls, v) - 1][1]
+        result.append((v - offset).replace(tzinfo=UTC))
+    return result
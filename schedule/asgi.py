@@ -0,0 +1,19 @@
+"""
+ASGI config for schedule project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+The read-only guest pages are served by the async views in main/async_views.py,
+see schedule/asgi_urls.py.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'schedule.settings.prod')
+os.environ.setdefault('ROOT_URLCONF', 'schedule.asgi_urls')
+
+application = get_asgi_application()
@@ -0,0 +1,20 @@
+"""
+URL configuration under ASGI: the same routes as schedule.urls, with the
+read-only guest pages served by async views.
+"""
+from django.urls import URLPattern
+from main.async_views import GuestCalendarRedirectView, GuestCalendarView, GuestScheduleView, GuestBookingSuccessView
+from schedule import urls
+
+ASYNC_VIEWS = {
+    'guest_calendar_redirect': GuestCalendarRedirectView,
+    'guest_calendar': GuestCalendarView,
+    'schedule_as_guest': GuestScheduleView,
+    'schedule_as_guest_success': GuestBookingSuccessView,
+}
+
+urlpatterns = [
+    URLPattern(p.pattern, ASYNC_VIEWS[p.name].as_view(), p.default_args, p.name)
+    if getattr(p, 'name', None) in ASYNC_VIEWS else p
+    for p in urls.urlpatterns
+]
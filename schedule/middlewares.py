@@ -1,16 +1,81 @@
-import pytz
+import random
+from time import perf_counter
+from django.conf import settings
 from django.utils import timezone
+from django.utils.deprecation import MiddlewareMixin
+from main import metrics
+from main.utils import GUEST_PATH_PREFIX, get_guest_timezone, set_guest_timezone
+from main.zones import get_zone
+from schedule import routers
 
 
-class TimezoneMiddleware:
-    def __init__(self, get_response):
-        self.get_response = get_response
+class TimezoneMiddleware(MiddlewareMixin):
+    # MiddlewareMixin lets it run under ASGI without holding a thread for the whole request
 
-    def __call__(self, request):
-        tzname = request.session.get('django_timezone')
-        if tzname:
-            timezone.activate(pytz.timezone(tzname))
+    def process_request(self, request):
+        # guests carry their timezone in a signed cookie or ?tz=, the session is only read for owners
+        if request.path_info.startswith(GUEST_PATH_PREFIX):
+            tzname = get_guest_timezone(request)
         else:
-            timezone.deactivate()
-        return self.get_response(request)
+            tzname = request.session.get('django_timezone')
+        # zones are cached per process, an unknown name falls back to the default
+        try:
+            timezone.activate(get_zone(tzname or settings.TIME_ZONE))
+        except (KeyError, ValueError):
+            timezone.activate(get_zone(settings.TIME_ZONE))
 
+    def process_response(self, request, response):
+        # a timezone that came with the link is remembered for the next pages
+        tzname = request.GET.get('tz')
+        if tzname and request.path_info.startswith(GUEST_PATH_PREFIX) and timezone.get_current_timezone_name() == tzname:
+            set_guest_timezone(response, tzname)
+        return response
+
+
+class MetricsMiddleware(MiddlewareMixin):
+    # first in MIDDLEWARE, so the latency covers the other middlewares too
+
+    def process_request(self, request):
+        request._metrics_started = perf_counter()
+        request._metrics_queries = [0, 0.0]
+        # seen by the queries of this request in any thread, see metrics.count_queries
+        metrics.request_queries.set(request._metrics_queries)
+
+    def process_response(self, request, response):
+        if not hasattr(request, '_metrics_started'):
+            return response
+        metrics.request_queries.set(None)
+        match = request.resolver_match
+        view = match.url_name or match.view_name if match else ''
+        queries, seconds = request._metrics_queries
+        metrics.observe('schedule_request_duration_seconds', perf_counter() - request._metrics_started, view=view)
+        metrics.inc('schedule_requests_total', view=view, status=response.status_code)
+        metrics.inc('schedule_db_queries_total', queries, view=view)
+        metrics.inc('schedule_db_query_seconds_total', seconds, view=view)
+        metrics.flush()
+        return response
+
+
+class ReplicaMiddleware(MiddlewareMixin):
+    # before SessionMiddleware, so a session saved by the request counts as a write
+
+    def process_request(self, request):
+        routers.request_state.set({'replica': None, 'wrote': False})
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # one replica for the whole request, so its reads agree with each other
+        view_class = getattr(view_func, 'view_class', None)
+        if (
+            settings.DATABASE_REPLICAS and request.method in ('GET', 'HEAD')
+            and getattr(view_class, 'replica_reads', False) and routers.PIN_COOKIE not in request.COOKIES
+        ):
+            routers.request_state.get()['replica'] = random.choice(settings.DATABASE_REPLICAS)
+
+    def process_response(self, request, response):
+        state = routers.request_state.get()
+        routers.request_state.set(None)
+        if state and state['wrote']:
+            response.set_cookie(
+                routers.PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax',
+            )
+        return response
@@ -0,0 +1,39 @@
+"""
+Read replicas.
+
+Every query goes to the primary ('default') except the reads of views with
+``replica_reads = True`` answering a GET, which go to one of the aliases in
+settings.DATABASE_REPLICAS. A client that has just written is kept on the
+primary for REPLICA_PIN_SECONDS by a cookie (see ReplicaMiddleware), so it
+reads its own writes, like the owner seeing the booking they just made.
+"""
+from contextvars import ContextVar
+
+PIN_COOKIE = 'primary_pin'
+
+# {'replica': alias or None, 'wrote': bool} of the current request, shared with
+# the threads it runs queries in
+request_state = ContextVar('request_state', default=None)
+
+
+def on_replica():
+    """Whether the current request reads from a replica, which may lag behind the primary."""
+    state = request_state.get()
+    return bool(state and state['replica'])
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        state = request_state.get()
+        return state['replica'] if state else None
+
+    def db_for_write(self, model, **hints):
+        state = request_state.get()
+        if state:
+            state['wrote'] = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as the primary
+        return True
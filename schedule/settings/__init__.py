@@ -0,0 +1,4 @@
+"""
+Settings profiles: schedule.settings.dev (manage.py) and schedule.settings.prod
+(schedule/wsgi.py and schedule/asgi.py). Set DJANGO_SETTINGS_MODULE to choose another.
+"""
@@ -1,5 +1,5 @@
 """
-Django settings for schedule project.
+Django settings for schedule project, shared by the dev and prod profiles.
 
 Generated by 'django-admin startproject' using Django 2.2.7.
 
@@ -17,7 +17,7 @@ env = environ.Env()
 environ.Env.read_env(env_file='.env')
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 
 # Quick-start development settings - unsuitable for production
@@ -27,7 +27,7 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 SECRET_KEY = env('SECRET_KEY')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = env('DEBUG')
+DEBUG = env.bool('DEBUG', default=False)
 
 ALLOWED_HOSTS = []
 
@@ -42,10 +42,11 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'main.apps.MainConfig',
-    'debug_toolbar'
 ]
 
 MIDDLEWARE = [
+    'schedule.middlewares.MetricsMiddleware',
+    'schedule.middlewares.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -54,10 +55,10 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'schedule.middlewares.TimezoneMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
 ]
 
-ROOT_URLCONF = 'schedule.urls'
+# schedule/asgi.py switches to schedule.asgi_urls
+ROOT_URLCONF = env('ROOT_URLCONF', default='schedule.urls')
 
 TEMPLATES = [
     {
@@ -86,6 +87,34 @@ DATABASES = {
     'default': env.db(),
 }
 
+# read replicas, comma separated database urls, see schedule/routers.py
+DATABASE_REPLICAS = []
+for i, url in enumerate(env.list('REPLICA_DATABASE_URLS', default=[])):
+    DATABASES[f'replica{i}'] = env.db_url_config(url)
+    DATABASE_REPLICAS.append(f'replica{i}')
+
+DATABASE_ROUTERS = ['schedule.routers.ReplicaRouter']
+
+# seconds a client reads from the primary after it wrote
+REPLICA_PIN_SECONDS = env.int('REPLICA_PIN_SECONDS', default=10)
+
+
+# Cache
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+# per-owner change versions live here, use a shared backend when running several workers
+
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
+# threads, and so database connections, the async guest views run queries in (see main/async_views.py)
+ASYNC_QUERY_THREADS = env.int('ASYNC_QUERY_THREADS', default=20)
+
+# shared by the workers so /metrics shows them all, empty keeps them per process (see main/metrics.py)
+METRICS_DIR = env('METRICS_DIR', default='')
+# when set, /metrics wants "Authorization: Bearer <token>"
+METRICS_TOKEN = env('METRICS_TOKEN', default='')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
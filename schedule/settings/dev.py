@@ -0,0 +1,11 @@
+"""
+Development: debug on, with the debug toolbar.
+"""
+from .base import *  # noqa: F401,F403
+from .base import INSTALLED_APPS, MIDDLEWARE, env
+
+DEBUG = env.bool('DEBUG', default=True)
+
+INSTALLED_APPS = INSTALLED_APPS + ['debug_toolbar']
+
+MIDDLEWARE = MIDDLEWARE + ['debug_toolbar.middleware.DebugToolbarMiddleware']
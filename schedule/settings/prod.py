@@ -0,0 +1,28 @@
+"""
+Production: no debug tooling, templates compiled once per process and
+database connections kept open between requests.
+"""
+from .base import *  # noqa: F401,F403
+from .base import DATABASES, TEMPLATES, env
+
+DEBUG = False
+
+ALLOWED_HOSTS = env.list('ALLOWED_HOSTS', default=[])
+
+# seconds a connection is reused for, replicas included
+for database in DATABASES.values():
+    database['CONN_MAX_AGE'] = env.int('CONN_MAX_AGE', default=60)
+
+TEMPLATES[0]['APP_DIRS'] = False
+TEMPLATES[0]['OPTIONS']['loaders'] = [
+    ('django.template.loaders.cached.Loader', [
+        'django.template.loaders.filesystem.Loader',
+        'django.template.loaders.app_directories.Loader',
+    ]),
+]
+TEMPLATES[0]['OPTIONS']['context_processors'] = [
+    p for p in TEMPLATES[0]['OPTIONS']['context_processors'] if p != 'django.template.context_processors.debug'
+]
+
+# /metrics is never public in production, start-up fails without the token
+METRICS_TOKEN = env('METRICS_TOKEN')
@@ -13,13 +13,14 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-import debug_toolbar
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include, re_path
 from main.views import SignUp, Home, ScheduleView, EventView, CalendarRedirectView, CalendarView, \
     ScheduleCreate, EventCreate, EventDelete, EventUpdate, InvitationCreate, ScheduleAsGuest, ScheduleAsGuestSuccess,\
     SetTimezoneGuestView, SetTimezoneView, InvitationListView, InvitationCreateMenu, SetAvailabilityWindow, DeleteAvailabilityWindow,\
-    ScheduleCancel
+    ScheduleCancel, CalendarFeed, ImportBookings, FreeSlotsView, MetricsView, WeekView, NextAvailableView,\
+    GroupFreeSlotsView, GroupInvitationCreate, GroupJoinView, BulkBookingView
 
 
 urlpatterns = [
@@ -35,6 +36,9 @@ urlpatterns = [
         name='set_timezone'
     ),
 
+    # Prometheus metrics
+    path('metrics', MetricsView.as_view(), name='metrics'),
+
     # Schedule as a guest with an invitation link
     re_path(
         r'^invite/(?P<uuid>[0-9a-f]{8}-[0-9a-f]{4}-4[0-9a-f]{3}-[0-9a-f]{4}-[0-9a-f]{12})$',
@@ -62,6 +66,12 @@ urlpatterns = [
         ScheduleView.as_view(),
         name='schedule_as_guest'
     ),
+    re_path(
+        r'^invite/(?P<uuid>[0-9a-f]{8}-[0-9a-f]{4}-4[0-9a-f]{3}-[0-9a-f]{4}-[0-9a-f]{12})/'
+        r'(?P<year>[0-9]{4})/(?P<month>[0-9]{2})/(?P<day>[0-9]{2})/week$',
+        WeekView.as_view(),
+        name='week_as_guest'
+    ),
 
     re_path(
         r'^invite/(?P<uuid>[0-9a-f]{8}-[0-9a-f]{4}-4[0-9a-f]{3}-[0-9a-f]{4}-[0-9a-f]{12})/'
@@ -70,6 +80,33 @@ urlpatterns = [
         name='schedule_as_guest_form'
     ),
 
+    # free slots of an invitation as JSON
+    re_path(
+        r'^invite/(?P<uuid>[0-9a-f]{8}-[0-9a-f]{4}-4[0-9a-f]{3}-[0-9a-f]{4}-[0-9a-f]{12})/free_slots$',
+        FreeSlotsView.as_view(),
+        name='free_slots'
+    ),
+
+    # the first free slots of an invitation as JSON
+    re_path(
+        r'^invite/(?P<uuid>[0-9a-f]{8}-[0-9a-f]{4}-4[0-9a-f]{3}-[0-9a-f]{4}-[0-9a-f]{12})/next_available$',
+        NextAvailableView.as_view(),
+        name='next_available'
+    ),
+
+    # the common free slots of the members of a group invitation as JSON
+    re_path(
+        r'^invite/group/(?P<uuid>[0-9a-f]{8}-[0-9a-f]{4}-4[0-9a-f]{3}-[0-9a-f]{4}-[0-9a-f]{12})/free_slots$',
+        GroupFreeSlotsView.as_view(),
+        name='group_free_slots'
+    ),
+    # joining or leaving a group invitation
+    re_path(
+        r'^invite/group/(?P<uuid>[0-9a-f]{8}-[0-9a-f]{4}-4[0-9a-f]{3}-[0-9a-f]{4}-[0-9a-f]{12})/join$',
+        GroupJoinView.as_view(),
+        name='group_join'
+    ),
+
     re_path(
         r'^invite/(?P<uuid>[0-9a-f]{8}-[0-9a-f]{4}-4[0-9a-f]{3}-[0-9a-f]{4}-[0-9a-f]{12})/success$',
         ScheduleAsGuestSuccess.as_view(),
@@ -90,10 +127,23 @@ urlpatterns = [
         ScheduleView.as_view(),
         name='schedule'
     ),
+    re_path(
+        r'^(?P<username>[\-\.\w]+)/(?P<year>[0-9]{4})/(?P<month>[0-9]{2})/(?P<day>[0-9]{2})/week$',
+        WeekView.as_view(),
+        name='week'
+    ),
 
     # List of Events
     re_path(r'^(?P<username>[\-\.\w]+)/events$', EventView.as_view(), name='events'),
 
+    # iCalendar feeds of the bookings
+    re_path(r'^(?P<username>[\-\.\w]+)/feed\.ics$', CalendarFeed.as_view(), name='calendar_feed'),
+    re_path(
+        r'^(?P<username>[\-\.\w]+)/(?P<event_slug>[\-\.\w]+)/feed\.ics$',
+        CalendarFeed.as_view(),
+        name='event_calendar_feed'
+    ),
+
     # Creating a new Event
     re_path(
         r'^(?P<username>[\-\.\w]+)/create_event$',
@@ -113,6 +163,18 @@ urlpatterns = [
         ScheduleCreate.as_view(),
         name='schedule_event_form'
     ),
+    # Import bookings from an iCalendar or CSV file
+    re_path(
+        r'^(?P<username>[\-\.\w]+)/schedule_event/import$',
+        ImportBookings.as_view(),
+        name='import_bookings'
+    ),
+    # Book many slots at once with a JSON body
+    re_path(
+        r'^(?P<username>[\-\.\w]+)/schedule_event/bulk$',
+        BulkBookingView.as_view(),
+        name='bulk_booking'
+    ),
     # Cancel a scheduled event
         re_path(
         r'^(?P<username>[\-\.\w]+)/schedule_event/cancel/(?P<uuid>[0-9a-f]{8}-[0-9a-f]{4}-4[0-9a-f]{3}-[0-9a-f]{4}-[0-9a-f]{12})$',
@@ -183,6 +245,12 @@ urlpatterns = [
         InvitationCreate.as_view(),
         name='invitation_create'
     ),
+    # Create a group invitation link
+    re_path(
+        r'^(?P<username>[\-\.\w]+)/group_invite/create$',
+        GroupInvitationCreate.as_view(),
+        name='group_invitation_create'
+    ),
     # Create an invitation link from the main menu
     re_path(
         r'^(?P<username>[\-\.\w]+)/invite/create$',
@@ -192,5 +260,9 @@ urlpatterns = [
 
 
     path('', Home.as_view(), name='home'),
-    path('__debug__/', include(debug_toolbar.urls)),
 ]
+
+# only the dev settings load the toolbar
+if 'debug_toolbar' in settings.INSTALLED_APPS:
+    import debug_toolbar
+    urlpatterns.append(path('__debug__/', include(debug_toolbar.urls)))